@@ -0,0 +1,186 @@
+"""
+Parking Archive - Lưu event và dòng tính tiền dạng Parquet để phân tích lịch sử
+
+Cấu trúc thư mục (ARCHIVE_DIR):
+- events/date=YYYY-MM-DD/floor=X/*.parquet  : event đã parse (kể cả event trải từ frame)
+- billing/date=YYYY-MM-DD/floor=X/*.parquet : dòng tính tiền gửi lên parking-status
+- bills/date=YYYY-MM-DD/floor=X/*.parquet   : hóa đơn của lượt đỗ đã kết thúc (theo ngày ra)
+
+date là ngày theo giờ địa phương của bảng giá (cùng ranh giới ngày với trần tiền mỗi ngày),
+tính từ Unix timestamp nên không phụ thuộc timezone của Spark session.
+
+Mỗi micro-batch ghi thêm vài file nhỏ vào từng partition; compact_table định kỳ gộp
+các file của những ngày đã qua thành một file, bị dừng giữa chừng cũng không để lại dữ
+liệu trùng. Ghi theo foreachBatch là at-least-once: batch chạy lại sau sự cố có thể ghi
+trùng, báo cáo (parking_report.py) bỏ trùng hóa đơn theo lượt đỗ và event theo nội dung
+nên không bị ảnh hưởng.
+"""
+
+import json
+import time
+
+from pyspark.sql.functions import col, expr, substring
+
+EVENTS_TABLE = "events"
+BILLING_TABLE = "billing"
+BILLS_TABLE = "bills"
+PARTITION_COLUMNS = ("date", "floor")
+
+# File do Spark tự đặt tên bắt đầu bằng "part-"; thư mục "_compacting" bị reader bỏ qua
+COMPACTING_DIR = "_compacting"
+# Kế hoạch đổi tên / xóa của một lần gộp, có file này nghĩa là file gộp đã ghi xong
+COMPACTING_MANIFEST = "_manifest.json"
+
+
+# Schema các bảng (như streaming ghi), để đọc bảng chưa có dữ liệu thành DataFrame rỗng
+TABLE_SCHEMAS = {
+    EVENTS_TABLE: "lot_id string, location string, license_plate string, status_code string, "
+                  "event_timestamp string, event_timestamp_unix bigint, processing_time timestamp, "
+                  "date date, floor string",
+    BILLING_TABLE: "lot_id string, location string, license_plate string, status_code string, "
+                   "status string, entry_time_unix bigint, event_timestamp_unix bigint, "
+                   "current_timestamp_unix bigint, parked_duration_seconds bigint, parked_blocks int, "
+                   "total_cost double, date date, floor string",
+    BILLS_TABLE: "lot_id string, location string, license_plate string, entry_time_unix bigint, "
+                 "exit_time_unix bigint, bill_blocks int, bill_amount double, date date, floor string",
+}
+
+
+def table_path(archive_dir, table):
+    return f"{archive_dir.rstrip('/')}/{table}"
+
+
+def table_exists(spark, path):
+    """Bảng đã có thư mục chưa (bills chỉ được tạo khi lượt đỗ đầu tiên kết thúc)"""
+    fs, root = _hadoop_fs(spark, path)
+    return fs.exists(root)
+
+
+def local_date_expr(unix_col, utc_offset_hours):
+    """Cột ngày (giờ địa phương) từ cột Unix timestamp"""
+    offset = int(utc_offset_hours * 3600)
+    return expr(f"date_add(date'1970-01-01', cast(floor(({unix_col} + {offset}) / 86400) as int))")
+
+
+def with_partition_columns(df, unix_col, utc_offset_hours):
+    """Thêm cột date và floor (ký tự đầu của location)"""
+    return df \
+        .withColumn("date", local_date_expr(unix_col, utc_offset_hours)) \
+        .withColumn("floor", substring(col("location"), 1, 1))
+
+
+def append_partitioned(df, path):
+    df.write.mode("append").partitionBy(*PARTITION_COLUMNS).parquet(path)
+
+
+def _hadoop_fs(spark, path):
+    jvm = spark._jvm
+    hadoop_path = jvm.org.apache.hadoop.fs.Path(path)
+    return hadoop_path.getFileSystem(spark._jsc.hadoopConfiguration()), hadoop_path
+
+
+def _parquet_files(fs, directory):
+    return [s.getPath() for s in fs.listStatus(directory)
+            if s.isFile() and s.getPath().getName().endswith(".parquet")]
+
+
+def list_partitions(spark, path):
+    """
+    Liệt kê partition của một bảng
+
+    Returns:
+        list: (date, floor, đường dẫn Hadoop, danh sách file parquet)
+    """
+    fs, root = _hadoop_fs(spark, path)
+    if not fs.exists(root):
+        return []
+    partitions = []
+    for date_status in fs.listStatus(root):
+        date_name = date_status.getPath().getName()
+        if not (date_status.isDirectory() and date_name.startswith("date=")):
+            continue
+        for floor_status in fs.listStatus(date_status.getPath()):
+            floor_name = floor_status.getPath().getName()
+            if not (floor_status.isDirectory() and floor_name.startswith("floor=")):
+                continue
+            partitions.append((date_name[len("date="):], floor_name[len("floor="):],
+                               floor_status.getPath(), _parquet_files(fs, floor_status.getPath())))
+    return partitions
+
+
+def _write_text(fs, path, text):
+    out = fs.create(path, True)
+    try:
+        out.write(bytearray(text.encode("utf-8")))
+    finally:
+        out.close()
+
+
+def _read_text(spark, fs, path):
+    stream = fs.open(path)
+    try:
+        scanner = spark._jvm.java.util.Scanner(stream, "UTF-8").useDelimiter("\\A")
+        return scanner.next() if scanner.hasNext() else ""
+    finally:
+        stream.close()
+
+
+def _finish_compaction(spark, fs, partition, tmp):
+    """Làm nốt một lần gộp đã có manifest: đổi tên file gộp vào partition, xóa file cũ"""
+    Path = spark._jvm.org.apache.hadoop.fs.Path
+    plan = json.loads(_read_text(spark, fs, Path(tmp, COMPACTING_MANIFEST)))
+    for name, target in plan["rename"].items():
+        source = Path(tmp, name)
+        if fs.exists(source):
+            fs.rename(source, Path(partition, target))
+    for name in plan["delete"]:
+        fs.delete(Path(partition, name), False)
+    fs.delete(tmp, True)
+
+
+def compact_table(spark, path, before_date, min_files=8):
+    """
+    Gộp file nhỏ của các partition có date < before_date (ngày đã đóng, không còn được ghi)
+
+    File gộp được ghi vào thư mục tạm trong partition, rồi manifest (file gộp nào đổi tên
+    thành gì, file cũ nào bị xóa) được ghi nguyên tử; sau đó mới đổi tên và xóa. Bị dừng
+    trước manifest thì thư mục tạm bị bỏ, sau manifest thì lần gộp kế tiếp làm nốt theo
+    manifest, nên không bảng nào (events, billing, bills) bị trùng dòng. Báo cáo chạy đúng
+    lúc đang đổi tên / xóa có thể thấy cả file cũ lẫn file gộp.
+
+    Args:
+        before_date (str): Ngày "YYYY-MM-DD", chỉ gộp partition trước ngày này
+        min_files (int): Chỉ gộp partition có từ chừng này file trở lên
+
+    Returns:
+        int: Số partition đã gộp
+    """
+    fs, _ = _hadoop_fs(spark, path)
+    Path = spark._jvm.org.apache.hadoop.fs.Path
+    compacted = 0
+    for date, floor, partition, files in list_partitions(spark, path):
+        if date >= before_date:
+            continue
+        tmp = Path(partition, COMPACTING_DIR)
+        if fs.exists(Path(tmp, COMPACTING_MANIFEST)):
+            # Lần gộp trước dừng sau manifest
+            _finish_compaction(spark, fs, partition, tmp)
+            compacted += 1
+            continue
+        if len(files) < min_files:
+            continue
+        fs.delete(tmp, True)
+        spark.read.parquet(*[f.toString() for f in files]) \
+            .coalesce(1) \
+            .write.mode("overwrite").parquet(tmp.toString())
+        stamp = int(time.time() * 1000)
+        plan = {
+            "rename": {f.getName(): f"part-compacted-{stamp}-{i:03d}.parquet"
+                       for i, f in enumerate(_parquet_files(fs, tmp))},
+            "delete": [f.getName() for f in files]
+        }
+        _write_text(fs, Path(tmp, COMPACTING_MANIFEST + ".tmp"), json.dumps(plan))
+        fs.rename(Path(tmp, COMPACTING_MANIFEST + ".tmp"), Path(tmp, COMPACTING_MANIFEST))
+        _finish_compaction(spark, fs, partition, tmp)
+        compacted += 1
+    return compacted
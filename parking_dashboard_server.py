@@ -0,0 +1,272 @@
+"""
+Dashboard Server - Đọc parking-status một lần, phát snapshot + delta cho nhiều màn hình
+
+Một consumer Kafka (mọi partition, không dùng consumer group) giữ dữ liệu đã gộp của mọi bãi;
+màn hình cổng vào, văn phòng, điện thoại... kết nối tới server thay vì mỗi màn hình tự đọc
+Kafka, nên thêm màn hình không làm tăng tải Kafka.
+
+Một cổng, hai kiểu client (xem parking_status_feed.py cho định dạng message):
+- TCP, JSON mỗi dòng: client gửi một dòng {"lot_id": "hanoi-01"} ({"lot_id": null} = mọi bãi),
+  server gửi {"type": "snapshot", ...} rồi {"type": "delta", ...} mỗi khi có thay đổi
+  (GUI: python parking_gui_consumer.py --dashboard host:8765)
+- HTTP: GET /events?lot_id=hanoi-01 là Server-Sent Events (cùng các message trên, dùng
+  EventSource trên trình duyệt), GET /snapshot?lot_id=... trả về JSON một lần
+
+Client chậm không làm chậm server: delta chưa gửi được của mỗi client được gộp lại
+(vị trí đổi nhiều lần chỉ gửi dòng mới nhất) và gửi một lần khi client đọc kịp.
+
+Cách chạy:
+    python parking_dashboard_server.py --kafka-broker 192.168.80.212:9092 --port 8765
+    python parking_dashboard_server.py --kafka-broker 192.168.80.212:9092 --snapshot /tmp/dashboard.snapshot
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import parse_qs, urlsplit
+
+from parking_snapshot import PartitionWatcher, load_snapshot, save_snapshot
+from parking_status_feed import (
+    DASHBOARD_PORT, KAFKA_AVAILABLE, POLL_MAX_RECORDS, assign_partitions, merge_delta, poll_delta
+)
+
+SSE_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/event-stream\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Access-Control-Allow-Origin: *\r\n\r\n"
+)
+
+
+def encode_message(kind, lots, sse=False):
+    data = json.dumps({"type": kind, "lots": lots}, ensure_ascii=False, separators=(',', ':'))
+    return f"data: {data}\n\n".encode() if sse else f"{data}\n".encode()
+
+
+def encode_error(message):
+    return (json.dumps({"type": "error", "message": message}, ensure_ascii=False) + "\n").encode()
+
+
+class DashboardClient:
+    """Một màn hình đang kết nối: delta chờ gửi (đã gộp) và lọc theo bãi"""
+
+    def __init__(self, writer, lot_id=None, sse=False):
+        self.writer = writer
+        self.lot_id = lot_id
+        self.sse = sse
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, delta):
+        lots = delta if self.lot_id is None else {self.lot_id: delta[self.lot_id]} if self.lot_id in delta else {}
+        if lots:
+            merge_delta(self.pending, lots)
+            self.ready.set()
+
+    async def run(self, snapshot):
+        """Gửi snapshot rồi gửi delta đã gộp mỗi khi có thay đổi, tới khi client ngắt"""
+        self.writer.write(encode_message("snapshot", snapshot, self.sse))
+        await self.writer.drain()
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            pending, self.pending = self.pending, {}
+            self.writer.write(encode_message("delta", pending, self.sse))
+            await self.writer.drain()
+
+
+class DashboardServer:
+    """Dữ liệu đã gộp của mọi bãi và danh sách client"""
+
+    def __init__(self, kafka_broker, topic, max_records=POLL_MAX_RECORDS,
+                 snapshot_path=None, snapshot_interval=10.0):
+        self.kafka_broker = kafka_broker
+        self.topic = topic
+        self.max_records = max_records
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.lot_data = defaultdict(dict)   # {lot_id: {location: dòng}}
+        self.positions = {}                 # {"topic:partition": offset kế tiếp}, khớp với lot_data
+        self.clients = set()
+        self.consumed = 0
+        self.snapshot_dirty = False
+
+    def view(self, lot_id=None):
+        """Snapshot cho client (bản sao nông, để client đang gửi không bị đổi giữa chừng)"""
+        if lot_id is not None:
+            return {lot_id: dict(self.lot_data.get(lot_id, {}))}
+        return {lot: dict(rows) for lot, rows in self.lot_data.items()}
+
+    def apply(self, delta):
+        merge_delta(self.lot_data, delta)
+        self.snapshot_dirty = True
+        for client in self.clients:
+            client.push(delta)
+
+    def write_snapshot(self, lot_data=None, positions=None):
+        try:
+            save_snapshot(self.snapshot_path, positions or self.positions, lots=lot_data or self.lot_data)
+        except OSError as e:
+            print(f"⚠️  Không ghi được snapshot {self.snapshot_path}: {e}", file=sys.stderr)
+
+    async def write_snapshot_async(self):
+        """
+        Ghi snapshot trong thread pool để json + fsync không chặn event loop (các client vẫn
+        nhận delta); bản sao được lấy trên event loop nên dữ liệu và offset khớp nhau
+        """
+        lot_data, positions = self.view(), dict(self.positions)
+        self.snapshot_dirty = False
+        await asyncio.get_running_loop().run_in_executor(None, self.write_snapshot, lot_data, positions)
+
+    async def consume(self):
+        """Đọc Kafka (poll chạy trong thread pool), áp dụng delta và phát cho client"""
+        loop = asyncio.get_running_loop()
+        if self.snapshot_path:
+            data = load_snapshot(self.snapshot_path)
+            if data:
+                merge_delta(self.lot_data, data.get("lots", {}))
+                self.positions = dict(data.get("positions", {}))
+                print(f"💾 Đã nạp snapshot {self.snapshot_path}: "
+                      f"{sum(len(rows) for rows in self.lot_data.values())} vị trí", file=sys.stderr)
+        consumer = await loop.run_in_executor(
+            None, assign_partitions, self.kafka_broker, self.topic, self.positions, self.max_records)
+        print(f"✅ Đã kết nối Kafka: {self.kafka_broker}, topic {self.topic}", file=sys.stderr)
+        watcher = PartitionWatcher([self.topic])
+        last_snapshot = last_report = time.time()
+        last_count = 0
+        try:
+            while True:
+                delta, _, count = await loop.run_in_executor(
+                    None, poll_delta, consumer, self.positions, self.max_records, watcher)
+                self.consumed += count
+                if delta:
+                    self.apply(delta)
+                now = time.time()
+                if self.snapshot_path and self.snapshot_dirty and now - last_snapshot >= self.snapshot_interval:
+                    await self.write_snapshot_async()
+                    last_snapshot = now
+                if now - last_report >= 10:
+                    rate = (self.consumed - last_count) / (now - last_report)
+                    print(f"📊 {rate:,.0f} msg/s | {len(self.lot_data)} bãi | {len(self.clients)} client",
+                          file=sys.stderr)
+                    last_report, last_count = now, self.consumed
+        finally:
+            if self.snapshot_path and self.snapshot_dirty:
+                self.write_snapshot()
+            consumer.close()
+
+    async def handle(self, reader, writer):
+        """Dòng đầu tiên quyết định kiểu client: "GET ..." là HTTP, còn lại là JSON"""
+        client = None
+        tasks = ()
+        try:
+            line = await reader.readline()
+            if line.startswith(b"GET "):
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                try:
+                    url = urlsplit(line.split()[1].decode())
+                except (IndexError, ValueError):
+                    writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    await writer.drain()
+                    return
+                lot_id = parse_qs(url.query).get("lot_id", [None])[0]
+                if url.path == "/snapshot":
+                    body = json.dumps({"type": "snapshot", "lots": self.view(lot_id)},
+                                      ensure_ascii=False).encode()
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=utf-8\r\n"
+                                 b"Access-Control-Allow-Origin: *\r\n"
+                                 b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+                    await writer.drain()
+                    return
+                if url.path != "/events":
+                    writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    await writer.drain()
+                    return
+                writer.write(SSE_HEADERS)
+                client = DashboardClient(writer, lot_id, sse=True)
+            else:
+                try:
+                    hello = json.loads(line or b"{}")
+                except ValueError:
+                    hello = None
+                lot_id = hello.get("lot_id") if isinstance(hello, dict) else None
+                if not isinstance(hello, dict) or not (lot_id is None or isinstance(lot_id, str)):
+                    writer.write(encode_error('hello phải là {"lot_id": "<mã bãi>"} hoặc {"lot_id": null}'))
+                    await writer.drain()
+                    return
+                client = DashboardClient(writer, lot_id)
+            # Snapshot và đăng ký nhận delta trong cùng một bước của event loop: không sót delta nào
+            snapshot = self.view(client.lot_id)
+            self.clients.add(client)
+            # Client không gửi gì thêm: reader hết (EOF) nghĩa là client đã ngắt, kể cả khi
+            # chưa có delta nào để ghi (bãi yên tĩnh) nên lỗi ghi không bao giờ xảy ra
+            tasks = (asyncio.ensure_future(client.run(snapshot)), asyncio.ensure_future(_wait_eof(reader)))
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() and not isinstance(task.exception(), ConnectionError):
+                    raise task.exception()
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.clients.discard(client)
+            writer.close()
+
+
+async def _wait_eof(reader):
+    """Đọc bỏ dữ liệu client gửi tới khi hết (client đóng kết nối)"""
+    while await reader.read(4096):
+        pass
+
+
+async def serve(server, host, port):
+    tcp = await asyncio.start_server(server.handle, host, port)
+    print(f"🔌 Dashboard server: {host}:{port} (JSON mỗi dòng, GET /events, GET /snapshot)", file=sys.stderr)
+    async with tcp:
+        await asyncio.gather(tcp.serve_forever(), server.consume())
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Dashboard Server - Một consumer Kafka cho nhiều màn hình')
+    parser.add_argument('--kafka-broker', type=str,
+                       default=os.getenv('KAFKA_BROKER', 'localhost:9092'),
+                       help='Địa chỉ Kafka broker')
+    parser.add_argument('--topic', type=str, default='parking-status',
+                       help='Tên Kafka topic để đọc')
+    parser.add_argument('--host', type=str, default='0.0.0.0',
+                       help='Địa chỉ lắng nghe (mặc định: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=int(os.getenv('DASHBOARD_PORT', DASHBOARD_PORT)),
+                       help=f'Cổng lắng nghe (mặc định: {DASHBOARD_PORT} hoặc từ biến môi trường DASHBOARD_PORT)')
+    parser.add_argument('--max-records', type=int, default=POLL_MAX_RECORDS,
+                       help=f'Số message tối đa mỗi lần poll Kafka (mặc định: {POLL_MAX_RECORDS})')
+    parser.add_argument('--snapshot', type=str, default=os.getenv('DASHBOARD_SNAPSHOT'),
+                       help='File snapshot dữ liệu + offset để khởi động nhanh (mặc định: không lưu, '
+                            'hoặc từ biến môi trường DASHBOARD_SNAPSHOT)')
+    parser.add_argument('--snapshot-interval', type=float, default=10.0,
+                       help='Chu kỳ ghi snapshot, giây (mặc định: 10)')
+
+    args = parser.parse_args()
+
+    if not KAFKA_AVAILABLE:
+        print("❌ Lỗi: kafka-python chưa được cài đặt")
+        print("Chạy: pip install kafka-python")
+        sys.exit(1)
+
+    server = DashboardServer(args.kafka_broker, args.topic, args.max_records,
+                             args.snapshot, args.snapshot_interval)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n⏹️  Dừng dashboard server", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Event Log - Ghi lại và phát lại (replay) luồng sự kiện đỗ xe
+
+Ghi (record): mỗi event (dict từ get_event_info) được lưu vào file log nhị phân
+append-only kèm file index, để các lần benchmark Spark dùng đúng cùng một input.
+
+Định dạng:
+- <path>      : header MAGIC + độ dài metadata (uint32) + metadata JSON,
+                sau đó là các record: key_len (uint16) | value_len (uint32) | key | value
+                (value là JSON compact UTF-8, key là lot_id)
+- <path>.idx  : mỗi record một entry cố định: offset (uint64) | emit_time (float64)
+
+Phát lại (replay): mmap file log, gửi lại lên Kafka hoặc stdout theo tốc độ gốc,
+N lần tốc độ gốc, hoặc nhanh nhất có thể, trong một khoảng offset [start, end).
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from datetime import datetime
+
+from parking_json_stream import KAFKA_AVAILABLE, DeliveryStats, create_kafka_producer
+from parking_wire_format import lot_key
+
+MAGIC = b"PKLOG1\n"
+RECORD_HEADER = struct.Struct("<HI")
+INDEX_ENTRY = struct.Struct("<Qd")
+
+
+def encode_event(event_data):
+    """Serialize event thành JSON compact (giống value producer gửi lên Kafka)"""
+    return json.dumps(event_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class EventLogWriter:
+    """Ghi event vào log append-only; index được ghi song song để đọc ngẫu nhiên O(1)"""
+
+    def __init__(self, path, metadata=None):
+        """
+        Args:
+            path (str): Đường dẫn file log (file index là path + '.idx')
+            metadata (dict): Thông tin kèm theo (seed, cấu hình bãi, ...), chỉ ghi khi tạo file mới
+        """
+        self.path = path
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._data = open(path, 'ab')
+        self._index = open(path + '.idx', 'ab')
+        if new_file:
+            meta = json.dumps(metadata or {}, ensure_ascii=False).encode('utf-8')
+            self._data.write(MAGIC + struct.pack("<I", len(meta)) + meta)
+        self._offset = self._data.tell()
+        self.count = 0
+
+    def append(self, event_data, emit_time=None):
+        """Ghi một event (dict) với thời điểm phát emit_time (mặc định: time.time())"""
+        key = lot_key(event_data)
+        value = encode_event(event_data)
+        self._data.write(RECORD_HEADER.pack(len(key), len(value)))
+        self._data.write(key)
+        self._data.write(value)
+        self._index.write(INDEX_ENTRY.pack(self._offset, time.time() if emit_time is None else emit_time))
+        self._offset += RECORD_HEADER.size + len(key) + len(value)
+        self.count += 1
+
+    def flush(self):
+        self._data.flush()
+        self._index.flush()
+
+    def close(self):
+        self.flush()
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventLogReader:
+    """Đọc log qua mmap; record thứ i được tìm qua index nên không cần quét tuần tự"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} không phải file event log")
+        (meta_len,) = struct.unpack_from("<I", self._data, len(MAGIC))
+        meta_start = len(MAGIC) + 4
+        self.metadata = json.loads(self._data[meta_start:meta_start + meta_len].decode('utf-8'))
+
+        with open(path + '.idx', 'rb') as f:
+            index_size = os.fstat(f.fileno()).st_size
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if index_size else b""
+        # Bỏ entry cuối nếu bị ghi dở (ví dụ producer bị kill)
+        self._count = index_size // INDEX_ENTRY.size
+        while self._count > 0 and not self._complete(self._count - 1):
+            self._count -= 1
+
+    def _complete(self, i):
+        offset, _ = INDEX_ENTRY.unpack_from(self._index, i * INDEX_ENTRY.size)
+        if offset + RECORD_HEADER.size > len(self._data):
+            return False
+        key_len, value_len = RECORD_HEADER.unpack_from(self._data, offset)
+        return offset + RECORD_HEADER.size + key_len + value_len <= len(self._data)
+
+    def __len__(self):
+        return self._count
+
+    def emit_time(self, i):
+        return INDEX_ENTRY.unpack_from(self._index, i * INDEX_ENTRY.size)[1]
+
+    def read_raw(self, i):
+        """Trả về (key, value, emit_time) dạng bytes của record thứ i"""
+        offset, emit_time = INDEX_ENTRY.unpack_from(self._index, i * INDEX_ENTRY.size)
+        key_len, value_len = RECORD_HEADER.unpack_from(self._data, offset)
+        start = offset + RECORD_HEADER.size
+        key = self._data[start:start + key_len]
+        value = self._data[start + key_len:start + key_len + value_len]
+        return key, value, emit_time
+
+    def read(self, i):
+        """Trả về event thứ i dạng dict"""
+        return json.loads(self.read_raw(i)[1].decode('utf-8'))
+
+    def close(self):
+        self._data.close()
+        if isinstance(self._index, mmap.mmap):
+            self._index.close()
+
+
+def replay(reader, start=0, end=None, speed=1.0, kafka_broker=None, kafka_topic="parking-events",
+           rebase_time=False, out=None):
+    """
+    Phát lại các record [start, end) của log
+
+    Args:
+        reader (EventLogReader): Log cần phát lại
+        speed (float): 1 = tốc độ gốc, N = nhanh gấp N lần, 0 = nhanh nhất có thể
+        kafka_broker (str): Địa chỉ Kafka broker, None = in ra stdout
+        rebase_time (bool): Dời timestamp của event sao cho record đầu tiên mang thời điểm hiện tại
+            (giữ nguyên khoảng cách giữa các event)
+        out: Stream để in khi không dùng Kafka (mặc định: sys.stdout)
+
+    Returns:
+        int: Số record đã phát
+    """
+    end = len(reader) if end is None else min(end, len(reader))
+    if start >= end:
+        return 0
+    out = out or sys.stdout
+
+    producer = None
+    stats = DeliveryStats()
+    if kafka_broker and KAFKA_AVAILABLE:
+        # Gửi nguyên bytes đã ghi, không serialize lại
+        producer = create_kafka_producer(kafka_broker, fast_mode=True, value_serializer=None)
+    elif kafka_broker:
+        print("⚠️  kafka-python chưa được cài đặt. Chỉ in ra stdout.", file=sys.stderr)
+
+    first_emit = reader.emit_time(start)
+    replay_start = time.time()
+    time_shift = int(replay_start - first_emit) if rebase_time else 0
+    count = 0
+    try:
+        for i in range(start, end):
+            key, value, emit_time = reader.read_raw(i)
+            if speed > 0:
+                delay = replay_start + (emit_time - first_emit) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            if time_shift:
+                event_data = json.loads(value.decode('utf-8'))
+                event_data["timestamp_unix"] += time_shift
+                event_data["timestamp"] = datetime.fromtimestamp(
+                    event_data["timestamp_unix"]).strftime("%Y-%m-%d %H:%M:%S")
+                value = encode_event(event_data)
+
+            if producer:
+                stats.on_send()
+                future = producer.send(kafka_topic, key=key, value=value)
+                future.add_callback(stats.on_success)
+                future.add_errback(stats.on_error)
+            else:
+                out.write(value.decode('utf-8') + '\n')
+            count += 1
+    except KeyboardInterrupt:
+        print("\n⚠️  Đã dừng bởi người dùng (Ctrl+C)", file=sys.stderr)
+    finally:
+        if producer:
+            producer.flush()
+            producer.close()
+            print(f"📊 {stats.summary()}", file=sys.stderr)
+
+    elapsed = time.time() - replay_start
+    print(f"✅ Đã phát lại {count} events trong {elapsed:.2f}s "
+          f"({count / max(elapsed, 1e-9):,.0f} events/s)", file=sys.stderr)
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Phát lại event log đã ghi bằng parking_json_stream.py --record')
+    parser.add_argument('log', type=str, help='Đường dẫn file event log')
+    parser.add_argument('--kafka-broker', type=str,
+                       default=os.getenv('KAFKA_BROKER', 'localhost:9092'),
+                       help='Địa chỉ Kafka broker (mặc định: localhost:9092 hoặc từ biến môi trường KAFKA_BROKER)')
+    parser.add_argument('--topic', type=str, default='parking-events',
+                       help='Tên Kafka topic (mặc định: parking-events)')
+    parser.add_argument('--no-kafka', action='store_true',
+                       help='In ra stdout thay vì gửi lên Kafka')
+    parser.add_argument('--speed', type=float, default=1.0,
+                       help='1 = tốc độ gốc, N = nhanh gấp N lần, 0 = nhanh nhất (mặc định: 1)')
+    parser.add_argument('--start', type=int, default=0,
+                       help='Chỉ số record bắt đầu (mặc định: 0)')
+    parser.add_argument('--end', type=int, default=None,
+                       help='Chỉ số record kết thúc, không bao gồm (mặc định: hết log)')
+    parser.add_argument('--rebase-time', action='store_true',
+                       help='Dời timestamp event về thời điểm hiện tại')
+    parser.add_argument('--info', action='store_true',
+                       help='Chỉ in thông tin log (số record, metadata) rồi thoát')
+
+    args = parser.parse_args()
+
+    reader = EventLogReader(args.log)
+    if args.info:
+        duration = reader.emit_time(len(reader) - 1) - reader.emit_time(0) if len(reader) else 0
+        print(json.dumps({
+            "records": len(reader),
+            "duration_seconds": round(duration, 3),
+            "metadata": reader.metadata
+        }, ensure_ascii=False, indent=2))
+    else:
+        print(f"▶️  Phát lại {args.log}: {len(reader)} records, metadata: "
+              f"{json.dumps(reader.metadata, ensure_ascii=False)}", file=sys.stderr)
+        replay(
+            reader,
+            start=args.start,
+            end=args.end,
+            speed=args.speed,
+            kafka_broker=None if args.no_kafka else args.kafka_broker,
+            kafka_topic=args.topic,
+            rebase_time=args.rebase_time
+        )
+    reader.close()
@@ -0,0 +1,176 @@
+"""
+Floor Map - Sơ đồ bãi đỗ trên tk.Canvas, mỗi vị trí là một ô màu, nhóm theo tầng
+
+Chỉ các ô nằm trong vùng đang nhìn thấy mới có item trên canvas (virtual scrolling):
+khi cuộn / đổi kích thước, ô ra khỏi màn hình bị xóa và ô mới được tạo. Vì vậy chi phí
+vẽ phụ thuộc số ô trên màn hình chứ không phụ thuộc kích thước bãi, và đổi màu một ô
+(update) là O(1) nếu ô đang hiển thị, không làm gì nếu ô nằm ngoài màn hình.
+
+Vị trí của mỗi ô được tính từ chỉ số (không lưu tọa độ từng ô):
+
+    tầng A   [ô][ô][ô]...[ô]      <- FLOOR_HEADER px cho tên tầng
+             [ô][ô]...            <- ceil(số vị trí / số cột) hàng, mỗi hàng CELL + GAP px
+    tầng B   ...
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+from parking_wire_format import LOCATION_PATTERN
+
+CELL = 18           # Cạnh mỗi ô (px)
+GAP = 3             # Khoảng cách giữa các ô (px)
+FLOOR_HEADER = 22   # Chiều cao dòng tên tầng (px)
+MARGIN = 8          # Lề trái / trên (px)
+
+
+def group_by_floor(locations):
+    """[location] -> [(tầng, [location theo số vị trí])], tầng theo thứ tự chữ cái"""
+    floors = {}
+    for loc in locations:
+        m = LOCATION_PATTERN.match(loc)
+        floor = m.group(1) if m else loc[:1]
+        floors.setdefault(floor, []).append(loc)
+    return [
+        (floor, sorted(locs, key=lambda loc: (len(loc), loc)))
+        for floor, locs in sorted(floors.items())
+    ]
+
+
+class FloorMap:
+    """Canvas cuộn được hiển thị một ô màu cho mỗi vị trí"""
+
+    def __init__(self, parent, color_of, on_hover=None, bg='white'):
+        """
+        Args:
+            color_of: Hàm location -> màu ô (gọi khi ô được tạo hoặc cập nhật)
+            on_hover: Hàm nhận location (hoặc None) khi chuột di qua ô
+        """
+        self.color_of = color_of
+        self.on_hover = on_hover
+        self.frame = tk.Frame(parent, bg=bg)
+        self.canvas = tk.Canvas(self.frame, bg=bg, highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.yview)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.floors = []        # [(tầng, [location])]
+        self.floor_top = []     # y của dòng tên mỗi tầng
+        self.columns = 1
+        self.height = 0
+        self.items = {}         # {location: item id} của các ô đang có trên canvas
+        self.locations = {}     # {item id: location}
+        self.headers = []       # item id của tên tầng
+
+        self.canvas.bind('<Configure>', lambda e: self.relayout())
+        self.canvas.bind('<MouseWheel>', self._on_wheel)
+        self.canvas.bind('<Button-4>', lambda e: self.yview('scroll', -3, 'units'))
+        self.canvas.bind('<Button-5>', lambda e: self.yview('scroll', 3, 'units'))
+        self.canvas.bind('<Motion>', self._on_motion)
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def set_locations(self, locations):
+        """Đặt danh sách vị trí (sơ đồ bãi) và vẽ lại"""
+        self.floors = group_by_floor(locations)
+        self.relayout()
+
+    def relayout(self):
+        """Tính lại số cột theo bề rộng canvas, vị trí các tầng và vẽ lại vùng nhìn thấy"""
+        width = max(self.canvas.winfo_width(), CELL + 2 * MARGIN)
+        self.columns = max(1, (width - 2 * MARGIN + GAP) // (CELL + GAP))
+        self.floor_top = []
+        y = MARGIN
+        for _, locs in self.floors:
+            self.floor_top.append(y)
+            rows = -(-len(locs) // self.columns)
+            y += FLOOR_HEADER + rows * (CELL + GAP) + GAP
+        self.height = y + MARGIN
+        self.canvas.configure(scrollregion=(0, 0, width, self.height),
+                              yscrollincrement=CELL + GAP)
+        self.clear()
+        self.render_viewport()
+
+    def clear(self):
+        self.canvas.delete('all')
+        self.items = {}
+        self.locations = {}
+        self.headers = []
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.render_viewport()
+
+    def _on_wheel(self, event):
+        self.yview('scroll', -1 if event.delta > 0 else 1, 'units')
+
+    def _cell_xy(self, floor_index, i):
+        row, col = divmod(i, self.columns)
+        x = MARGIN + col * (CELL + GAP)
+        y = self.floor_top[floor_index] + FLOOR_HEADER + row * (CELL + GAP)
+        return x, y
+
+    def visible_ranges(self):
+        """[(chỉ số tầng, vị trí đầu, vị trí cuối + 1)] của các ô nằm (một phần) trong vùng nhìn thấy"""
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        ranges = []
+        for index, (_, locs) in enumerate(self.floors):
+            cells_top = self.floor_top[index] + FLOOR_HEADER
+            rows = -(-len(locs) // self.columns)
+            if cells_top + rows * (CELL + GAP) < top or self.floor_top[index] > bottom:
+                continue
+            first_row = max(0, int((top - cells_top) // (CELL + GAP)))
+            last_row = min(rows - 1, int((bottom - cells_top) // (CELL + GAP)))
+            ranges.append((index, first_row * self.columns, min(len(locs), (last_row + 1) * self.columns)))
+        return ranges
+
+    def render_viewport(self):
+        """Tạo ô cho vị trí vừa vào vùng nhìn thấy, xóa ô vừa ra khỏi vùng nhìn thấy"""
+        if not self.floors:
+            return
+        ranges = self.visible_ranges()
+        visible = set()
+        for index, start, end in ranges:
+            visible.update(self.floors[index][1][start:end])
+        for loc in [loc for loc in self.items if loc not in visible]:
+            item = self.items.pop(loc)
+            del self.locations[item]
+            self.canvas.delete(item)
+        if not self.headers:
+            self.headers = [
+                self.canvas.create_text(MARGIN, self.floor_top[i] + FLOOR_HEADER // 2, anchor='w',
+                                        text=f"Tầng {floor} ({len(locs)} vị trí)",
+                                        font=('Arial', 10, 'bold'))
+                for i, (floor, locs) in enumerate(self.floors)
+            ]
+        for index, start, end in ranges:
+            locs = self.floors[index][1]
+            for i in range(start, end):
+                loc = locs[i]
+                if loc not in self.items:
+                    x, y = self._cell_xy(index, i)
+                    item = self.canvas.create_rectangle(x, y, x + CELL, y + CELL, width=0,
+                                                        fill=self.color_of(loc))
+                    self.items[loc] = item
+                    self.locations[item] = loc
+
+    def update(self, locations):
+        """Đổi màu các ô của những vị trí đã thay đổi (ô ngoài màn hình được tô khi hiện ra)"""
+        for loc in locations:
+            item = self.items.get(loc)
+            if item is not None:
+                self.canvas.itemconfigure(item, fill=self.color_of(loc))
+
+    def recolor(self):
+        """Tô lại mọi ô đang hiển thị (ví dụ khi đổi bãi)"""
+        self.update(list(self.items))
+
+    def _on_motion(self, event):
+        if not self.on_hover:
+            return
+        items = self.canvas.find_overlapping(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y),
+                                             self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        self.on_hover(next((self.locations[i] for i in items if i in self.locations), None))
@@ -0,0 +1,122 @@
+"""
+Occupancy Frames - Mỗi message là ảnh chụp trạng thái toàn bộ một tầng
+
+Camera thật nhìn thấy cả tầng cùng lúc, nên thay vì một message cho mỗi lần xe đổi
+trạng thái, camera gửi định kỳ một "occupancy frame" cho mỗi tầng:
+
+    {
+        "timestamp": "2026-01-01 08:00:00",
+        "timestamp_unix": 1767229200,
+        "camera_id": "cam-A",
+        "lot_id": "default",
+        "floor": "A",
+        "seq": 42,
+        "slot_count": 10,
+        "bitmap": "hAE=",              # base64, bit i (LSB trước) = vị trí floor + str(i + 1) có xe
+        "plates": ["29A-12345", ...]   # biển số của các vị trí có xe, theo thứ tự bit
+    }
+
+Mất một frame không làm sai trạng thái lâu dài: frame sau mang lại toàn bộ tầng.
+"""
+
+import base64
+from datetime import datetime
+
+from parking_wire_format import DEFAULT_LOT_ID, LOCATION_PATTERN
+
+
+def floor_layout(locations):
+    """{tầng: số vị trí} từ danh sách vị trí dạng "A1".."A{n}" """
+    layout = {}
+    for loc in locations:
+        m = LOCATION_PATTERN.match(loc)
+        if not m:
+            raise ValueError(f"Vị trí {loc} không theo mẫu <tầng><số>")
+        floor, slot = m.group(1), int(m.group(2))
+        layout[floor] = max(layout.get(floor, 0), slot)
+    return layout
+
+
+def make_frame(floor, slot_count, bitmap, plates, now, seq=0, timestamp=None, lot_id=DEFAULT_LOT_ID):
+    """
+    Đóng gói một frame
+
+    Args:
+        bitmap (bytes): Bit i (LSB trước) = vị trí floor + str(i + 1) có xe
+        plates (list): Biển số của các vị trí có xe, theo thứ tự bit
+        now (float): Unix timestamp của frame
+        timestamp (str): Chuỗi thời gian hiển thị (mặc định: tạo từ now)
+        lot_id (str): Bãi đỗ của camera
+    """
+    if timestamp is None:
+        timestamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+    return {
+        "timestamp": timestamp,
+        "timestamp_unix": int(now),
+        "camera_id": f"cam-{floor}",
+        "lot_id": lot_id,
+        "floor": floor,
+        "seq": seq,
+        "slot_count": slot_count,
+        "bitmap": base64.b64encode(bitmap).decode('ascii'),
+        "plates": list(plates)
+    }
+
+
+def build_floor_frames(layout, occupied, now, seq=0, lot_id=DEFAULT_LOT_ID):
+    """
+    Tạo frame cho mọi tầng
+
+    Args:
+        layout (dict): {tầng: số vị trí} (xem floor_layout)
+        occupied (dict): {location: biển số} của các vị trí đang có xe
+        now (float): Unix timestamp của frame
+        seq (int): Số thứ tự frame của camera
+        lot_id (str): Bãi đỗ
+    """
+    timestamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+    by_floor = {floor: {} for floor in layout}
+    for location, plate in occupied.items():
+        m = LOCATION_PATTERN.match(location)
+        if m and m.group(1) in by_floor:
+            by_floor[m.group(1)][int(m.group(2)) - 1] = plate
+
+    frames = []
+    for floor in sorted(layout):
+        slot_count = layout[floor]
+        bits = bytearray((slot_count + 7) // 8)
+        slots = by_floor[floor]
+        for i in slots:
+            bits[i // 8] |= 1 << (i % 8)
+        frames.append(make_frame(floor, slot_count, bytes(bits), [slots[i] for i in sorted(slots)],
+                                 now, seq, timestamp, lot_id))
+    return frames
+
+
+def expand_frame(frame):
+    """
+    Trải frame thành {location: biển số hoặc None} cho mọi vị trí của tầng
+
+    None nghĩa là vị trí trống.
+    """
+    bits = base64.b64decode(frame["bitmap"])
+    plates = iter(frame.get("plates") or ())
+    floor = frame["floor"]
+    slots = {}
+    for i in range(frame["slot_count"]):
+        occupied = bits[i // 8] >> (i % 8) & 1
+        slots[f"{floor}{i + 1}"] = next(plates, None) if occupied else None
+    return slots
+
+
+def diff_frames(previous, current):
+    """
+    So sánh hai frame đã trải (kết quả của expand_frame) của cùng một tầng
+
+    Returns:
+        dict: {location: biển số hoặc None} chỉ gồm các vị trí thay đổi
+            (previous = None nghĩa là chưa có frame trước, mọi vị trí đều được coi là thay đổi)
+    """
+    if previous is None:
+        return dict(current)
+    return {loc: plate for loc, plate in current.items() if previous.get(loc, ...) != plate}
@@ -3,48 +3,118 @@ GUI Consumer - Hiển thị báo cáo real-time về trạng thái đỗ xe
 
 Đọc dữ liệu từ Kafka topic 'parking-status' và hiển thị:
 - Danh sách vị trí có xe (với thông tin: biển số, thời gian đỗ, tiền)
-- Danh sách vị trí trống
-- Cập nhật tự động theo thời gian thực
+- Sơ đồ bãi: mỗi vị trí một ô màu (đỏ: có xe, xanh: trống), nhóm theo tầng; sơ đồ lấy từ
+  --layout (cùng định dạng LOT_LAYOUT), chỉ các ô trong vùng đang nhìn thấy được vẽ nên
+  bãi hàng nghìn vị trí vẫn cuộn mượt (xem parking_floor_map.py)
+- Cập nhật tự động theo thời gian thực: chỉ vẽ lại các vị trí thay đổi, gom nhiều
+  message thành tối đa một lần vẽ mỗi REPAINT_INTERVAL_MS
+
+Thread Kafka đọc theo lô (poll max_records), giải mã và gộp mỗi lô thành một delta
+{lot_id: {location: dòng mới nhất}} rồi đưa qua hàng đợi có giới hạn; chỉ main thread
+(Tk) áp dụng delta vào dữ liệu hiển thị, nên hai thread không dùng chung dict nào.
+- Lọc theo bãi đỗ (lot_id): chọn bãi ở thanh trạng thái, mặc định --lot-id
+
+Nguồn dữ liệu: đọc thẳng Kafka (mọi partition của topic, không dùng consumer group nên
+nhiều GUI không chia nhau partition), hoặc kết nối tới dashboard server (--dashboard,
+xem parking_dashboard_server.py) để nhiều màn hình dùng chung một consumer Kafka.
+
+Snapshot (--snapshot): dữ liệu mọi bãi cùng offset đã đọc của từng partition, ghi nguyên tử
+mỗi --snapshot-interval giây và khi đóng. Lúc khởi động GUI nạp snapshot, hiển thị ngay
+bảng đầy đủ rồi đọc tiếp Kafka từ đúng các offset đó (chỉ phát lại phần thay đổi sau snapshot).
+Dữ liệu và offset trong snapshot luôn khớp nhau vì cả hai chỉ được cập nhật trên main thread
+khi áp dụng cùng một delta; main thread chỉ chép hai dict, việc ghi file + fsync chạy ở
+thread riêng để không làm khựng giao diện.
+
+    python parking_gui_consumer.py --kafka-broker 192.168.80.212:9092 --snapshot /tmp/parking-gui.snapshot
+    python parking_gui_consumer.py --dashboard 192.168.80.212:8765
 """
 
 import json
 import tkinter as tk
-from tkinter import ttk, scrolledtext
+from tkinter import ttk
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
+import queue
+import socket
 import threading
 import os
 import sys
+import time
+
+from parking_floor_map import FloorMap
+from parking_snapshot import PartitionWatcher, load_snapshot, save_snapshot
+from parking_status_feed import (
+    DASHBOARD_PORT, KAFKA_AVAILABLE, POLL_MAX_RECORDS, POLL_TIMEOUT_MS,
+    assign_partitions, merge_delta, parse_address, poll_delta
+)
+from parking_summary import DEFAULT_LAYOUT, layout_locations, parse_layout
+from parking_wire_format import DEFAULT_LOT_ID, validate_lot_id
+
+# Màu ô trên sơ đồ bãi
+OCCUPIED_COLOR = '#e74c3c'
+EMPTY_COLOR = '#27ae60'
 
-try:
-    from kafka import KafkaConsumer
-    KAFKA_AVAILABLE = True
-except ImportError:
-    KAFKA_AVAILABLE = False
-    print("Cảnh báo: kafka-python chưa được cài đặt. Chạy: pip install kafka-python")
+# Khoảng cách tối thiểu giữa hai lần vẽ lại (ms); message đến trong khoảng này được gom lại
+REPAINT_INTERVAL_MS = 100
+# Số delta tối đa đang chờ main thread; đầy thì thread Kafka gộp tiếp vào delta đang giữ
+DELTA_QUEUE_SIZE = 32
 
-# Tất cả các vị trí đỗ xe
-ALL_LOCATIONS = [
-    "A1", "A2", "A3", "A4", "A5", "A6", "A7", "A8", "A9", "A10",
-    "B1", "B2", "B3", "B4", "B5", "B6", "B7", "B8", "B9", "B10",
-    "C1", "C2", "C3", "C4", "C5", "C6", "C7", "C8", "C9", "C10",
-    "D1", "D2", "D3", "D4", "D5", "D6", "D7", "D8", "D9", "D10",
-    "E1", "E2", "E3", "E4", "E5", "E6", "E7", "E8", "E9", "E10",
-    "F1", "F2", "F3", "F4", "F5", "F6", "F7", "F8", "F9", "F10"
-]
 
 class ParkingGUI:
-    def __init__(self, root, kafka_broker='localhost:9092', topic='parking-status'):
+    def __init__(self, root, kafka_broker='localhost:9092', topic='parking-status', lot_id=DEFAULT_LOT_ID,
+                 repaint_interval_ms=REPAINT_INTERVAL_MS, max_records=POLL_MAX_RECORDS, layout=None,
+                 snapshot_path=None, snapshot_interval=10.0, dashboard=None):
         self.root = root
         self.kafka_broker = kafka_broker
+        self.dashboard = dashboard  # (host, port) của dashboard server, None = đọc thẳng Kafka
         self.topic = topic
+        self.lot_id = lot_id  # Bãi đang hiển thị
+        # Các vị trí trên sơ đồ bãi, từ layout {tầng: số vị trí}
+        self.locations = layout_locations(layout or parse_layout(DEFAULT_LAYOUT))
+        self.location_set = frozenset(self.locations)
         self.consumer = None
         self.running = False
-        self.parking_data = {}  # {location: {status, license_plate, duration, blocks, cost, ...}}
+        # {lot_id: {location: {status, license_plate, duration, blocks, cost, ...}}}, chỉ main thread dùng
+        self.lot_data = defaultdict(dict)
         self.update_thread = None
         
+        # Thread Kafka -> main thread
+        self.max_records = max_records
+        self.delta_queue = queue.Queue(maxsize=DELTA_QUEUE_SIZE)
+        self.consumed = 0               # Số message đã đọc (thread Kafka ghi, main thread đọc)
+        self.rate_mark = (time.time(), 0)
+        self.ingest_rate = 0.0
+        
+        # Snapshot: positions {"topic:partition": offset kế tiếp} khớp với lot_data
+        # Offset chỉ có nghĩa khi đọc thẳng Kafka
+        self.snapshot_path = None if dashboard else snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.positions = {}
+        self.last_snapshot = time.time()
+        self.snapshot_dirty = False
+        self.snapshot_thread = None     # Thread đang ghi snapshot (mỗi lúc tối đa một)
+        # Với --dashboard không nạp snapshot: server gửi snapshot của nó khi kết nối
+        snapshot = load_snapshot(self.snapshot_path) if self.snapshot_path else None
+        if snapshot:
+            for lot_id, rows in snapshot.get("lots", {}).items():
+                self.lot_data[lot_id].update(rows)
+            self.positions = dict(snapshot.get("positions", {}))
+            print(f"💾 Đã nạp snapshot {self.snapshot_path}: {sum(len(r) for r in self.lot_data.values())} vị trí, "
+                  f"{len(self.lot_data)} bãi")
+        
+        # Vẽ lại theo phần thay đổi
+        self.repaint_interval_ms = repaint_interval_ms
+        self.tree_items = {}            # {location: item id trong occupied_tree}
+        self.occupied_slots = 0         # Số vị trí của sơ đồ đang có xe (bãi đang hiển thị)
+        self.repaint_times = deque(maxlen=100)  # Thời gian các lần vẽ gần nhất (ms)
+        self.repaint_count = 0
+        
         self.setup_ui()
+        if self.lot_data:
+            self.lot_combo.config(values=sorted(set(self.lot_data) | {self.lot_id}))
+            self.refresh_ui(set(self.parking_data))
         self.connect_kafka()
+        self.root.after(self.repaint_interval_ms, self.process_deltas)
         
     def setup_ui(self):
         """Thiết lập giao diện"""
@@ -112,37 +182,46 @@ class ParkingGUI:
         self.occupied_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         occupied_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        # Right panel - Vị trí trống
+        # Right panel - Sơ đồ bãi
         right_frame = tk.Frame(main_frame, bg='white', relief=tk.RAISED, borderwidth=2)
         right_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(5, 0))
         
-        empty_label = tk.Label(
+        map_label = tk.Label(
             right_frame,
-            text="🚗 VỊ TRÍ TRỐNG",
+            text="🗺️ SƠ ĐỒ BÃI",
             font=('Arial', 14, 'bold'),
             bg='white',
             fg='#27ae60'
         )
-        empty_label.pack(pady=10)
+        map_label.pack(pady=10)
         
-        # Text widget cho vị trí trống
-        empty_text_frame = tk.Frame(right_frame)
-        empty_text_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.hover_label = tk.Label(right_frame, text="", font=('Arial', 10), bg='white', anchor='w')
+        self.hover_label.pack(fill=tk.X, padx=10)
         
-        self.empty_text = scrolledtext.ScrolledText(
-            empty_text_frame,
-            font=('Courier', 10),
-            bg='#f8f9fa',
-            wrap=tk.WORD,
-            height=15
-        )
-        self.empty_text.pack(fill=tk.BOTH, expand=True)
+        # Chỉ các ô trong vùng nhìn thấy được tạo; màu lấy từ dữ liệu của bãi đang hiển thị
+        self.floor_map = FloorMap(right_frame, self.cell_color, on_hover=self.on_cell_hover, bg='#f8f9fa')
+        self.floor_map.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.floor_map.set_locations(self.locations)
         
         # Status bar
         status_frame = tk.Frame(self.root, bg='#34495e', height=40)
         status_frame.pack(fill=tk.X, side=tk.BOTTOM)
         status_frame.pack_propagate(False)
         
+        tk.Label(
+            status_frame,
+            text="Bãi:",
+            font=('Arial', 10),
+            bg='#34495e',
+            fg='white'
+        ).pack(side=tk.LEFT, padx=(10, 0), pady=10)
+        
+        self.lot_var = tk.StringVar(value=self.lot_id)
+        self.lot_combo = ttk.Combobox(status_frame, textvariable=self.lot_var, values=[self.lot_id],
+                                      width=15, state='readonly')
+        self.lot_combo.pack(side=tk.LEFT, padx=5, pady=8)
+        self.lot_combo.bind('<<ComboboxSelected>>', self.on_lot_selected)
+        
         self.status_label = tk.Label(
             status_frame,
             text="⏰ Đang kết nối...",
@@ -164,134 +243,262 @@ class ParkingGUI:
         self.count_label.pack(side=tk.RIGHT, padx=10, pady=10)
         
     def connect_kafka(self):
-        """Kết nối đến Kafka"""
+        """Kết nối đến Kafka (hoặc dashboard server)"""
+        if self.dashboard:
+            self.status_label.config(text=f"🔌 Dashboard server: {self.dashboard[0]}:{self.dashboard[1]}")
+            self.start_consuming(self.consume_dashboard)
+            return
+        
         if not KAFKA_AVAILABLE:
             self.status_label.config(text="❌ kafka-python chưa được cài đặt")
             return
         
         try:
-            self.consumer = KafkaConsumer(
-                self.topic,
-                bootstrap_servers=self.kafka_broker,
-                value_deserializer=lambda m: json.loads(m.decode('utf-8')),
-                auto_offset_reset='latest',
-                consumer_timeout_ms=1000,
-                group_id='parking-gui-consumer'
-            )
+            # Không chờ topic (main thread): topic chưa có thì báo lỗi ngay trên thanh trạng thái
+            self.consumer = assign_partitions(self.kafka_broker, self.topic, self.positions, self.max_records,
+                                              wait_seconds=0)
             self.status_label.config(text=f"✅ Đã kết nối Kafka: {self.kafka_broker}")
-            self.start_consuming()
+            self.start_consuming(self.consume_messages)
         except Exception as e:
             self.status_label.config(text=f"❌ Lỗi kết nối Kafka: {e}")
             print(f"Lỗi: {e}")
     
-    def start_consuming(self):
-        """Bắt đầu đọc dữ liệu từ Kafka trong thread riêng"""
+    def start_consuming(self, target):
+        """Bắt đầu đọc dữ liệu trong thread riêng"""
         self.running = True
-        self.update_thread = threading.Thread(target=self.consume_messages, daemon=True)
+        self.update_thread = threading.Thread(target=target, daemon=True)
         self.update_thread.start()
     
     def consume_messages(self):
-        """Đọc messages từ Kafka"""
+        """
+        Thread Kafka: poll theo lô, gộp thành delta và đưa sang main thread
+
+        Hàng đợi đầy (main thread đang bận) thì delta chưa gửi được giữ lại và gộp tiếp
+        các lô sau vào đó, nên thread Kafka không bị chặn và main thread không bị dồn việc.
+        """
+        pending, offsets = {}, {}
+        watcher = PartitionWatcher([self.topic])
         while self.running:
             try:
-                if self.consumer:
-                    for message in self.consumer:
-                        if not self.running:
-                            break
-                        data = message.value
-                        self.update_parking_data(data)
+                delta, _, count = poll_delta(self.consumer, offsets, self.max_records, watcher)
+                merge_delta(pending, delta)
+                self.consumed += count
+                if offsets:
+                    self.delta_queue.put_nowait((pending, offsets))
+                    pending, offsets = {}, {}
+            except queue.Full:
+                pass
             except Exception as e:
                 print(f"Lỗi khi đọc từ Kafka: {e}")
-                import time
                 time.sleep(1)
+        self.consumer.close()
     
-    def update_parking_data(self, data):
-        """Cập nhật dữ liệu đỗ xe từ Kafka message"""
-        try:
-            location = data.get('location')
-            if not location:
-                return
-            
-            self.parking_data[location] = {
-                'status': data.get('status', 'UNKNOWN'),
-                'license_plate': data.get('license_plate', 'N/A'),
-                'parked_duration_minutes': data.get('parked_duration_minutes'),
-                'parked_blocks': data.get('parked_blocks', 0),
-                'total_cost': data.get('total_cost', 0.0),
-                'last_update': data.get('last_update', datetime.now().isoformat())
-            }
-            
-            # Cập nhật UI trong main thread
-            self.root.after(0, self.refresh_ui)
-        except Exception as e:
-            print(f"Lỗi khi cập nhật dữ liệu: {e}")
+    def consume_dashboard(self):
+        """
+        Thread client: nhận snapshot rồi delta (JSON mỗi dòng) từ dashboard server và đưa
+        sang main thread như delta đọc từ Kafka; mất kết nối thì nối lại (nhận lại snapshot)
+        """
+        pending = {}
+        while self.running:
+            try:
+                with socket.create_connection(self.dashboard, timeout=5) as sock:
+                    # Nhận mọi bãi: GUI cho chọn bãi ở thanh trạng thái
+                    sock.sendall(b'{"lot_id": null}\n')
+                    sock.settimeout(POLL_TIMEOUT_MS / 1000)
+                    buffer = b''
+                    while self.running:
+                        try:
+                            chunk = sock.recv(1 << 16)
+                        except socket.timeout:
+                            chunk = None
+                        if chunk == b'':
+                            raise ConnectionError("dashboard server đã đóng kết nối")
+                        if chunk:
+                            *lines, buffer = (buffer + chunk).split(b'\n')
+                            for line in lines:
+                                lots = json.loads(line).get('lots', {})
+                                merge_delta(pending, lots)
+                                self.consumed += sum(len(rows) for rows in lots.values())
+                        if pending:
+                            try:
+                                self.delta_queue.put_nowait((pending, {}))
+                                pending = {}
+                            except queue.Full:
+                                pass
+            except Exception as e:
+                print(f"Lỗi kết nối dashboard server: {e}")
+                time.sleep(1)
     
-    def refresh_ui(self):
-        """Làm mới giao diện"""
-        # Xóa dữ liệu cũ
-        for item in self.occupied_tree.get_children():
+    @property
+    def parking_data(self):
+        """Dữ liệu của bãi đang hiển thị"""
+        return self.lot_data[self.lot_id]
+    
+    def on_lot_selected(self, event=None):
+        """Đổi bãi đang hiển thị: vẽ lại toàn bộ"""
+        self.lot_id = self.lot_var.get()
+        for item in self.tree_items.values():
             self.occupied_tree.delete(item)
+        self.tree_items = {}
+        self.occupied_slots = 0
+        self.floor_map.recolor()
+        self.refresh_ui(set(self.parking_data))
+    
+    def apply_delta(self, delta, offsets, dirty):
+        """
+        Áp dụng một delta và offset đã đọc tương ứng vào dữ liệu (main thread)
+
+        Args:
+            dirty (set): Nhận thêm các vị trí đổi của bãi đang hiển thị
+        """
+        new_lot = False
+        for lot_id, rows in delta.items():
+            if lot_id not in self.lot_data:
+                new_lot = True
+            self.lot_data[lot_id].update(rows)
+            if lot_id == self.lot_id:
+                dirty.update(rows)
+        self.positions.update(offsets)
+        self.snapshot_dirty = True
+        if new_lot:
+            self.lot_combo.config(values=sorted(self.lot_data))
+    
+    def process_deltas(self):
+        """
+        Main thread, mỗi repaint_interval_ms: lấy hết delta đang chờ, gộp lại và vẽ một lần
+
+        Mỗi lượt chỉ lấy số delta đang có lúc bắt đầu, nên message đến liên tục không giữ
+        main thread mãi trong vòng lặp này.
+        """
+        dirty = set()
+        for _ in range(self.delta_queue.qsize()):
+            try:
+                self.apply_delta(*self.delta_queue.get_nowait(), dirty)
+            except queue.Empty:
+                break
         
-        # Cập nhật vị trí có xe
-        occupied_locations = []
-        for location, data in self.parking_data.items():
-            if data.get('status') == 'OCCUPIED':
-                duration = data.get('parked_duration_minutes')
-                if duration is None:
-                    duration = 0
+        now = time.time()
+        mark_time, mark_count = self.rate_mark
+        if now - mark_time >= 1.0:
+            consumed = self.consumed
+            self.ingest_rate = (consumed - mark_count) / (now - mark_time)
+            self.rate_mark = (now, consumed)
+        
+        if dirty:
+            self.refresh_ui(dirty)
+        if (self.snapshot_path and self.snapshot_dirty and now - self.last_snapshot >= self.snapshot_interval
+                and not (self.snapshot_thread and self.snapshot_thread.is_alive())):
+            self.snapshot_thread = threading.Thread(target=self.write_snapshot, args=self.copy_snapshot(),
+                                                    daemon=True)
+            self.snapshot_thread.start()
+        if self.running or not self.delta_queue.empty():
+            self.root.after(self.repaint_interval_ms, self.process_deltas)
+    
+    def copy_snapshot(self):
+        """
+        Bản sao dữ liệu + offset (main thread, nên hai phần khớp nhau); dòng của từng vị trí
+        chỉ bị thay chứ không bị sửa nên chép hai tầng dict là đủ
+        """
+        self.snapshot_dirty = False
+        self.last_snapshot = time.time()
+        return {lot_id: dict(rows) for lot_id, rows in self.lot_data.items()}, dict(self.positions)
+    
+    def write_snapshot(self, lot_data, positions):
+        """Ghi snapshot từ bản sao của copy_snapshot (chạy ở thread riêng)"""
+        try:
+            save_snapshot(self.snapshot_path, positions, lots=lot_data)
+        except OSError as e:
+            print(f"⚠️  Không ghi được snapshot {self.snapshot_path}: {e}")
+    
+    def is_occupied(self, location):
+        row = self.parking_data.get(location)
+        return row is not None and row.get('status') == 'OCCUPIED'
+    
+    def cell_color(self, location):
+        """Màu ô của một vị trí trên sơ đồ bãi"""
+        return OCCUPIED_COLOR if self.is_occupied(location) else EMPTY_COLOR
+    
+    def on_cell_hover(self, location):
+        """Hiện thông tin vị trí dưới con trỏ chuột"""
+        if location is None:
+            self.hover_label.config(text="")
+        elif self.is_occupied(location):
+            row = self.parking_data[location]
+            self.hover_label.config(
+                text=f"{location}: {row.get('license_plate', 'N/A')} - {row.get('total_cost', 0.0) or 0.0:,.0f} VNĐ")
+        else:
+            self.hover_label.config(text=f"{location}: trống")
+    
+    @staticmethod
+    def row_values(location, data):
+        """Giá trị các cột của một dòng trong occupied_tree"""
+        duration = data.get('parked_duration_minutes')
+        duration = 0 if duration is None else round(duration, 1)
+        return (
+            location,
+            data.get('license_plate', 'N/A'),
+            f"{duration:.1f}",
+            data.get('parked_blocks', 0),
+            f"{data.get('total_cost', 0.0) or 0.0:,.0f}"
+        )
+    
+    def refresh_ui(self, dirty):
+        """
+        Vẽ lại các vị trí đã đổi: sửa / thêm / xóa đúng dòng của occupied_tree
+        và đổi màu tại chỗ các ô tương ứng trên sơ đồ bãi
+        """
+        started = time.perf_counter()
+        data = self.parking_data
+        for location in dirty:
+            occupied = self.is_occupied(location)
+            item = self.tree_items.get(location)
+            if location in self.location_set:
+                self.occupied_slots += occupied - (item is not None)
+            if occupied:
+                values = self.row_values(location, data[location])
+                if item is None:
+                    self.tree_items[location] = self.occupied_tree.insert('', 'end', values=values)
                 else:
-                    duration = round(duration, 1)
-                
-                blocks = data.get('parked_blocks', 0)
-                cost = data.get('total_cost', 0.0)
-                license_plate = data.get('license_plate', 'N/A')
-                
-                self.occupied_tree.insert('', 'end', values=(
-                    location,
-                    license_plate,
-                    f"{duration:.1f}",
-                    blocks,
-                    f"{cost:,.0f}"
-                ))
-                occupied_locations.append(location)
-        
-        # Cập nhật vị trí trống
-        occupied_set = set(occupied_locations)
-        empty_locations = [loc for loc in ALL_LOCATIONS if loc not in occupied_set]
-        
-        self.empty_text.delete('1.0', tk.END)
-        
-        # Nhóm theo tầng
-        floors = {}
-        for loc in empty_locations:
-            floor = loc[0]
-            if floor not in floors:
-                floors[floor] = []
-            floors[floor].append(loc)
-        
-        for floor in sorted(floors.keys()):
-            self.empty_text.insert(tk.END, f"Tầng {floor}: ", 'floor_label')
-            self.empty_text.insert(tk.END, ', '.join(sorted(floors[floor])))
-            self.empty_text.insert(tk.END, '\n')
-        
-        self.empty_text.tag_config('floor_label', font=('Courier', 10, 'bold'))
+                    self.occupied_tree.item(item, values=values)
+            elif item is not None:
+                self.occupied_tree.delete(item)
+                del self.tree_items[location]
+        self.floor_map.update(dirty)
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.repaint_times.append(elapsed_ms)
+        self.repaint_count += 1
         
         # Cập nhật status bar
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.status_label.config(text=f"⏰ Cập nhật lúc: {current_time}")
+        avg_ms = sum(self.repaint_times) / len(self.repaint_times)
+        self.status_label.config(
+            text=f"⏰ Cập nhật lúc: {current_time} | Bãi: {self.lot_id} | "
+                 f"vẽ {len(dirty)} vị trí trong {elapsed_ms:.1f} ms "
+                 f"(TB {avg_ms:.1f} ms, max {max(self.repaint_times):.1f} ms) | "
+                 f"nhận {self.ingest_rate:,.0f} msg/s"
+        )
         
-        occupied_count = len(occupied_locations)
-        empty_count = len(empty_locations)
-        total_count = len(ALL_LOCATIONS)
         self.count_label.config(
-            text=f"Có xe: {occupied_count} | Trống: {empty_count} | Tổng: {total_count}"
+            text=f"Có xe: {len(self.tree_items)} | Trống: {len(self.locations) - self.occupied_slots} | "
+                 f"Tổng: {len(self.locations)}"
         )
     
     def on_closing(self):
         """Xử lý khi đóng cửa sổ"""
         self.running = False
-        if self.consumer:
-            self.consumer.close()
+        # Thread Kafka tự đóng consumer sau lần poll đang chạy
+        if self.update_thread:
+            self.update_thread.join(timeout=2)
+        if self.snapshot_path:
+            # Áp dụng nốt các delta đã đọc để snapshot không phải phát lại chúng
+            dirty = set()
+            while not self.delta_queue.empty():
+                self.apply_delta(*self.delta_queue.get_nowait(), dirty)
+            if self.snapshot_thread:
+                self.snapshot_thread.join()
+            if self.snapshot_dirty:
+                self.write_snapshot(*self.copy_snapshot())
         self.root.destroy()
 
 def main():
@@ -303,16 +510,40 @@ def main():
                        help='Địa chỉ Kafka broker')
     parser.add_argument('--topic', type=str, default='parking-status',
                        help='Tên Kafka topic để đọc')
+    parser.add_argument('--repaint-ms', type=int, default=REPAINT_INTERVAL_MS,
+                       help=f'Khoảng cách tối thiểu giữa hai lần vẽ lại, ms (mặc định: {REPAINT_INTERVAL_MS})')
+    parser.add_argument('--max-records', type=int, default=POLL_MAX_RECORDS,
+                       help=f'Số message tối đa mỗi lần poll Kafka (mặc định: {POLL_MAX_RECORDS})')
+    parser.add_argument('--lot-id', type=str, default=os.getenv('LOT_ID', DEFAULT_LOT_ID),
+                       help=f'Bãi đỗ hiển thị lúc đầu (mặc định: {DEFAULT_LOT_ID} hoặc từ biến môi trường LOT_ID)')
+    parser.add_argument('--layout', type=str, default=os.getenv('LOT_LAYOUT', DEFAULT_LAYOUT),
+                       help=f'Sơ đồ bãi dạng "A:10,B:10" (mặc định: {DEFAULT_LAYOUT} hoặc từ biến môi trường LOT_LAYOUT)')
+    parser.add_argument('--dashboard', type=str, default=os.getenv('DASHBOARD_ADDR'),
+                       help=f'Nhận dữ liệu từ dashboard server host:port thay vì đọc Kafka '
+                            f'(mặc định: đọc Kafka, cổng mặc định {DASHBOARD_PORT})')
+    parser.add_argument('--snapshot', type=str, default=os.getenv('GUI_SNAPSHOT'),
+                       help='File snapshot dữ liệu + offset để khởi động nhanh (mặc định: không lưu, '
+                            'hoặc từ biến môi trường GUI_SNAPSHOT)')
+    parser.add_argument('--snapshot-interval', type=float, default=10.0,
+                       help='Chu kỳ ghi snapshot, giây (mặc định: 10)')
     
     args = parser.parse_args()
+    try:
+        validate_lot_id(args.lot_id)
+    except ValueError as e:
+        parser.error(str(e))
     
-    if not KAFKA_AVAILABLE:
+    if not KAFKA_AVAILABLE and not args.dashboard:
         print("❌ Lỗi: kafka-python chưa được cài đặt")
         print("Chạy: pip install kafka-python")
         sys.exit(1)
     
     root = tk.Tk()
-    app = ParkingGUI(root, kafka_broker=args.kafka_broker, topic=args.topic)
+    app = ParkingGUI(root, kafka_broker=args.kafka_broker, topic=args.topic, lot_id=args.lot_id,
+                     repaint_interval_ms=args.repaint_ms, max_records=args.max_records,
+                     layout=parse_layout(args.layout),
+                     snapshot_path=args.snapshot, snapshot_interval=args.snapshot_interval,
+                     dashboard=parse_address(args.dashboard) if args.dashboard else None)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     
     try:
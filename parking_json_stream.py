@@ -2,9 +2,13 @@ import time
 import random
 import json
 import os
+import threading
 from datetime import datetime
 from enum import Enum
 
+from parking_frames import build_floor_frames, floor_layout
+from parking_wire_format import DEFAULT_LOT_ID, WIRE_FORMATS, encode_event, lot_key, validate_lot_id
+
 try:
     from kafka import KafkaProducer
     KAFKA_AVAILABLE = True
@@ -19,6 +23,88 @@ class ParkingStatus(Enum):
     MOVING = "Đang di chuyển"
     EXITING = "Đang ra"
 
+class FreePool:
+    """
+    Tập các phần tử còn trống (vị trí đỗ / biển số) với acquire ngẫu nhiên và
+    release đều O(1): mảng phần tử trống + map phần tử -> chỉ số trong mảng,
+    xóa bằng cách đổi chỗ với phần tử cuối rồi pop.
+    """
+
+    def __init__(self, items):
+        self.all_items = list(items)
+        self._free = list(self.all_items)
+        self._index = {item: i for i, item in enumerate(self._free)}
+
+    def __len__(self):
+        return len(self._free)
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def acquire(self):
+        """Lấy ngẫu nhiên một phần tử trống, trả về None nếu đã hết"""
+        if not self._free:
+            return None
+        i = random.randrange(len(self._free))
+        item = self._free[i]
+        self._remove_at(i)
+        return item
+
+    def take(self, item):
+        """Đánh dấu một phần tử cụ thể là đã dùng, trả về False nếu nó không còn trống"""
+        i = self._index.get(item)
+        if i is None:
+            return False
+        self._remove_at(i)
+        return True
+
+    def release(self, item):
+        """Trả phần tử về pool (bỏ qua nếu nó đã trống)"""
+        if item not in self._index:
+            self._index[item] = len(self._free)
+            self._free.append(item)
+
+    def _remove_at(self, i):
+        item = self._free[i]
+        last = self._free[-1]
+        self._free[i] = last
+        self._index[last] = i
+        self._free.pop()
+        del self._index[item]
+
+
+def generate_parking_locations(num_floors=6, slots_per_floor=10):
+    """
+    Sinh danh sách vị trí đỗ dạng "A1".."A{n}", "B1".. cho bãi lớn
+
+    Args:
+        num_floors (int): Số tầng (tối đa 26, đặt tên A-Z)
+        slots_per_floor (int): Số vị trí mỗi tầng
+    """
+    if not 1 <= num_floors <= 26:
+        raise ValueError("num_floors phải trong khoảng 1-26")
+    return [f"{chr(ord('A') + f)}{i}" for f in range(num_floors) for i in range(1, slots_per_floor + 1)]
+
+
+def generate_license_plates(count, seed=None):
+    """
+    Sinh `count` biển số không trùng nhau dạng "29A-12345"
+
+    Lấy mẫu không lặp trên không gian mã tỉnh (11-99) x chữ cái x 5 chữ số
+    nên chi phí chỉ phụ thuộc vào count.
+    """
+    rng = random.Random(seed)
+    space = 89 * 26 * 100000
+    if count > space:
+        raise ValueError(f"Tối đa {space} biển số")
+    plates = []
+    for n in rng.sample(range(space), count):
+        n, number = divmod(n, 100000)
+        province, letter = divmod(n, 26)
+        plates.append(f"{province + 11}{chr(ord('A') + letter)}-{number:05d}")
+    return plates
+
+
 class ParkingEvent:
     """Class đại diện cho một sự kiện đỗ xe"""
     
@@ -51,34 +137,42 @@ class ParkingEvent:
         "F1", "F2", "F3", "F4", "F5", "F6", "F7", "F8", "F9", "F10"
     ]
     
-    def __init__(self, occupied_locations=None, active_license_plates=None):
+    def __init__(self, location_pool=None, plate_pool=None):
+        """
+        Args:
+            location_pool (FreePool): Các vị trí còn trống, dùng chung với simulator
+            plate_pool (FreePool): Các biển số chưa có xe nào dùng, dùng chung với simulator
+        """
+        self.location_pool = location_pool
+        self.plate_pool = plate_pool
+        self._assign()
+
+    def _assign(self):
+        """Lấy biển số và vị trí trống từ pool (O(1)) và đặt xe về trạng thái vào bãi"""
         # Chọn biển số chưa được sử dụng
-        if active_license_plates:
-            available_plates = [plate for plate in self.LICENSE_PLATES if plate not in active_license_plates]
-            if available_plates:
-                self.license_plate = random.choice(available_plates)
-            else:
-                # Nếu hết biển số, chọn random (trường hợp này không nên xảy ra)
-                self.license_plate = random.choice(self.LICENSE_PLATES)
-        else:
-            self.license_plate = random.choice(self.LICENSE_PLATES)
-        
+        self.license_plate = self.plate_pool.acquire() if self.plate_pool is not None else None
+        if self.license_plate is None:
+            # Nếu hết biển số, chọn random (trường hợp này không nên xảy ra)
+            plates = self.plate_pool.all_items if self.plate_pool is not None else self.LICENSE_PLATES
+            self.license_plate = random.choice(plates)
+
         # Chọn vị trí còn trống
-        if occupied_locations:
-            available_locations = [loc for loc in self.PARKING_LOCATIONS if loc not in occupied_locations]
-            if available_locations:
-                self.location = random.choice(available_locations)
-            else:
-                # Nếu hết chỗ, chọn random (trường hợp này không nên xảy ra)
-                self.location = random.choice(self.PARKING_LOCATIONS)
-        else:
-            self.location = random.choice(self.PARKING_LOCATIONS)
-        
+        self.location = self.location_pool.acquire() if self.location_pool is not None else None
+        if self.location is None:
+            # Nếu hết chỗ, chọn random (trường hợp này không nên xảy ra)
+            locations = self.location_pool.all_items if self.location_pool is not None else self.PARKING_LOCATIONS
+            self.location = random.choice(locations)
+
         self.status = ParkingStatus.ENTERING
         self.parked_count = 0
         self.parked_duration = 0
-        
-    def next_status(self, occupied_locations=None, active_license_plates=None):
+
+    def release_plate(self):
+        """Trả biển số về pool khi xe rời khỏi mô phỏng"""
+        if self.plate_pool is not None:
+            self.plate_pool.release(self.license_plate)
+
+    def next_status(self):
         """Chuyển sang trạng thái tiếp theo theo logic"""
         if self.status == ParkingStatus.ENTERING:
             self.status = ParkingStatus.PARKED
@@ -93,84 +187,505 @@ class ParkingEvent:
                 
         elif self.status == ParkingStatus.MOVING:
             self.status = ParkingStatus.EXITING
+            # Xe đang ra - giải phóng vị trí (giữ biển số đến khi xe bị xóa)
+            if self.location_pool is not None:
+                self.location_pool.release(self.location)
             
         else:
             # Nếu đã ra, tạo xe mới với vị trí và biển số trống
-            self.__init__(occupied_locations, active_license_plates)
+            old_plate = self.license_plate
+            self._assign()
+            if self.plate_pool is not None:
+                self.plate_pool.release(old_plate)
     
-    def get_event_info(self):
-        """Lấy thông tin sự kiện dưới dạng dictionary"""
+    def get_event_info(self, now=None):
+        """
+        Lấy thông tin sự kiện dưới dạng dictionary
+
+        Args:
+            now (float): Unix timestamp gắn cho event (mặc định: time.time(), dùng SimClock để mô phỏng)
+        """
+        if now is None:
+            now = time.time()
         return {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "timestamp_unix": int(time.time()),
+            "timestamp": datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+            "timestamp_unix": int(now),
             "license_plate": self.license_plate,
             "location": self.location,
             "status_code": self.status.name
         }
 
-def parking_stream_realtime(duration_minutes=30, event_interval=3, kafka_broker=None, kafka_topic="parking-events"):
+class WallClock:
+    """Đồng hồ thực: now() = time.time(), sleep() ngủ thật"""
+
+    def now(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class SimClock:
+    """
+    Đồng hồ ảo cho mô phỏng nén thời gian
+
+    Thời gian ảo bắt đầu từ start và chỉ tiến khi simulator gọi sleep(); mỗi giây ảo
+    tương ứng 1/ratio giây thực (ratio = 0: không ngủ, chạy nhanh nhất có thể).
+    """
+
+    def __init__(self, start=None, ratio=0.0):
+        self._now = time.time() if start is None else start
+        self.start = self._now
+        self.ratio = ratio
+
+    def now(self):
+        return self._now
+
+    def sleep(self, seconds):
+        self._now += seconds
+        if self.ratio > 0:
+            time.sleep(seconds / self.ratio)
+
+
+class DeliveryStats:
+    """
+    Đếm số event đã gửi / đã được broker xác nhận / thất bại / đang chờ (in-flight).
+
+    Callback của kafka-python chạy trên thread I/O của producer nên mọi
+    cập nhật đều đi qua lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.delivered = 0
+        self.failed = 0
+        self.last_error = None
+
+    @property
+    def in_flight(self):
+        """Số event đã gửi nhưng chưa có kết quả (thành công hoặc lỗi)"""
+        with self._lock:
+            return self.sent - self.delivered - self.failed
+
+    def on_send(self):
+        with self._lock:
+            self.sent += 1
+
+    def on_success(self, record_metadata=None):
+        with self._lock:
+            self.delivered += 1
+
+    def on_error(self, exc):
+        with self._lock:
+            self.failed += 1
+            self.last_error = exc
+
+    def summary(self):
+        """Chuỗi tóm tắt để in ra console"""
+        with self._lock:
+            in_flight = self.sent - self.delivered - self.failed
+            return (f"đã gửi: {self.sent} | đã xác nhận: {self.delivered} | "
+                    f"lỗi: {self.failed} | đang chờ: {in_flight}")
+
+
+class ParkingSimulator:
+    """
+    Mô phỏng bãi đỗ: giữ danh sách xe đang hoạt động và sinh lần lượt từng event
+
+    Vị trí trống và biển số chưa dùng được quản lý bằng FreePool dùng chung
+    với các ParkingEvent, nên chi phí mỗi event không phụ thuộc kích thước bãi.
+    """
+
+    def __init__(self, locations=None, license_plates=None, max_vehicles=8, min_vehicles=3,
+                 initial_vehicles=5, lot_id=DEFAULT_LOT_ID):
+        self.lot_id = validate_lot_id(lot_id)
+        self.location_pool = FreePool(locations or ParkingEvent.PARKING_LOCATIONS)
+        self.plate_pool = FreePool(license_plates or ParkingEvent.LICENSE_PLATES)
+        self.max_vehicles = max_vehicles
+        self.min_vehicles = min_vehicles
+
+        # Tạo nhiều xe ngẫu nhiên để mô phỏng bãi đỗ thực tế
+        self.active_vehicles = []
+        for _ in range(initial_vehicles):
+            self._add_vehicle()
+
+    def _can_add(self):
+        # Chỉ thêm nếu còn chỗ trống VÀ còn biển số
+        return len(self.location_pool) > 0 and len(self.plate_pool) > 0
+
+    def _add_vehicle(self):
+        if self._can_add():
+            self.active_vehicles.append(ParkingEvent(self.location_pool, self.plate_pool))
+
+    def step(self, now=None):
+        """
+        Cập nhật trạng thái một xe ngẫu nhiên, trả về event trước khi chuyển trạng thái
+
+        Args:
+            now (float): Thời điểm gắn cho event (mặc định: thời gian thực)
+        """
+        # Chọn ngẫu nhiên một xe để cập nhật trạng thái
+        vehicle = random.choice(self.active_vehicles)
+        event_data = vehicle.get_event_info(now)
+        event_data["lot_id"] = self.lot_id
+
+        # Chuyển sang trạng thái tiếp theo (pool được cập nhật bên trong ParkingEvent)
+        vehicle.next_status()
+
+        # Thêm xe mới ngẫu nhiên (mô phỏng xe mới vào bãi)
+        if random.random() > 0.6 and len(self.active_vehicles) < self.max_vehicles:
+            self._add_vehicle()
+
+        # Xóa xe đã ra khỏi bãi
+        if random.random() > 0.5:
+            remaining = []
+            for v in self.active_vehicles:
+                if v.status == ParkingStatus.EXITING:
+                    v.release_plate()
+                else:
+                    remaining.append(v)
+            self.active_vehicles = remaining
+
+        # Đảm bảo luôn có ít nhất min_vehicles xe
+        while len(self.active_vehicles) < self.min_vehicles and self._can_add():
+            self._add_vehicle()
+
+        return event_data
+
+    def occupied_locations(self):
+        """{location: biển số} của các vị trí đang có xe (dùng để tạo occupancy frame)"""
+        return {v.location: v.license_plate for v in self.active_vehicles
+                if v.status != ParkingStatus.EXITING}
+
+
+def serialize_event(event_data):
+    """Serialize event thành JSON UTF-8 (value gửi lên Kafka)"""
+    return json.dumps(event_data, ensure_ascii=False).encode('utf-8')
+
+
+def create_kafka_producer(kafka_broker, fast_mode=False, linger_ms=20, batch_size=131072,
+                          compression_type=None, value_serializer=serialize_event, max_block_ms=60000):
+    """
+    Tạo KafkaProducer cho camera
+
+    Args:
+        kafka_broker (str): Địa chỉ Kafka broker
+        fast_mode (bool): True = gửi pipelined (fire-and-forget + callback),
+            idempotent producer thay cho max_in_flight=1; False = chế độ an toàn cũ
+        linger_ms (int): Thời gian chờ gom batch (chỉ dùng cho fast_mode)
+        batch_size (int): Kích thước batch tối đa mỗi partition (bytes)
+        compression_type (str): None, 'gzip', 'snappy', 'lz4' hoặc 'zstd'
+        value_serializer: Hàm serialize value, None = value đã là bytes
+        max_block_ms (int): Thời gian send()/flush chờ metadata tối đa khi broker không phản hồi
+    """
+    config = {
+        'bootstrap_servers': kafka_broker,
+        'value_serializer': value_serializer,
+        'acks': 'all',  # Đợi tất cả replicas xác nhận
+        'retries': 3,
+        'max_block_ms': max_block_ms,
+    }
+    if fast_mode:
+        # Idempotent producer giữ đúng thứ tự theo partition kể cả khi có
+        # tới 5 request đang bay, nên không cần khóa in-flight = 1
+        config.update({
+            'enable_idempotence': True,
+            'max_in_flight_requests_per_connection': 5,
+            'linger_ms': linger_ms,
+            'batch_size': batch_size,
+            'compression_type': compression_type,
+        })
+    else:
+        config['max_in_flight_requests_per_connection'] = 1
+    return KafkaProducer(**config)
+
+
+def event_send_kwargs(event_data, wire_format='json'):
+    """
+    Tham số value/headers cho producer.send theo wire format
+
+    'json' dùng value_serializer của producer; 'binary' mã hóa sẵn thành bytes
+    (producer phải được tạo với value_serializer=None) và gắn header content-type.
+    """
+    if wire_format == 'json':
+        return {'value': event_data}
+    value, headers = encode_event(event_data, wire_format)
+    return {'value': value, 'headers': headers}
+
+
+def send_event(producer, topic, event_data, stats, wire_format='json', on_failure=None):
+    """
+    Gửi một event không chờ xác nhận; kết quả được đếm qua callback vào stats
+
+    Args:
+        on_failure: Hàm nhận event_data khi gửi thất bại (ví dụ EventSpool.append)
+
+    on_failure chạy khi lỗi được báo về, lúc đó các event gửi sau nó có thể đã tới broker:
+    event được spool sẽ đến sau chúng, và nếu cùng vị trí đã có event mới hơn thì engine
+    bỏ qua nó (event cũ hơn event cuối của vị trí). Chỉ các event đang bay (cỡ một lượt
+    linger / batch) bị ảnh hưởng; cần đúng thứ tự tuyệt đối thì dùng chế độ chờ xác nhận.
+
+    Returns:
+        bool: False nếu producer từ chối ngay (ví dụ buffer đầy)
+    """
+    stats.on_send()
+    try:
+        # Key là lot_id để mọi event của một bãi vào cùng partition (giữ thứ tự theo location)
+        future = producer.send(topic, key=lot_key(event_data),
+                               **event_send_kwargs(event_data, wire_format))
+    except Exception as e:
+        stats.on_error(e)
+        if on_failure:
+            on_failure(event_data)
+        return False
+    future.add_callback(stats.on_success)
+    future.add_errback(stats.on_error)
+    if on_failure:
+        future.add_errback(lambda exc: on_failure(event_data))
+    return True
+
+
+def send_frames(producer, topic, frames, stats, wire_format='json'):
+    """
+    Gửi các occupancy frame (key là lot_id) không chờ xác nhận
+
+    Frame luôn là JSON (bitmap đã gọn); frame gửi lỗi không được spool
+    vì frame kế tiếp mang lại toàn bộ trạng thái của tầng.
+    """
+    for frame in frames:
+        stats.on_send()
+        try:
+            future = producer.send(topic, key=lot_key(frame),
+                                   **event_send_kwargs(frame, wire_format))
+        except Exception as e:
+            stats.on_error(e)
+            continue
+        future.add_callback(stats.on_success)
+        future.add_errback(stats.on_error)
+
+
+def drain_spool(spool, producer, topic, wire_format='json', batch_size=5000, timeout=10):
+    """
+    Gửi lại các event trong spool theo lô, đúng thứ tự
+
+    Mỗi lô được gửi pipelined rồi flush; chỉ khi cả lô được broker xác nhận
+    thì vị trí spool mới được commit.
+
+    Returns:
+        int: Số event đã gửi lại, -1 nếu broker vẫn lỗi
+    """
+    def send_batch(records):
+        futures = [
+            producer.send(topic, key=lot_key(event_data),
+                          **event_send_kwargs(event_data, wire_format))
+            for event_data in records
+        ]
+        producer.flush(timeout=timeout)
+        for future in futures:
+            future.get(timeout=0)
+
+    try:
+        return spool.drain(send_batch, batch_size)
+    except Exception as e:
+        print(f"⚠️  Chưa gửi lại được spool: {e}")
+        return -1
+
+
+def parking_stream_realtime(duration_minutes=30, event_interval=3, kafka_broker=None, kafka_topic="parking-events",
+                            fast_mode=False, linger_ms=20, batch_size=131072, compression_type=None,
+                            flush_interval=1.0, locations=None, license_plates=None, record_path=None,
+                            seed=None, wire_format='json', clock=None, sim_duration_hours=None,
+                            spool_dir=None, spool_max_bytes=1024 * 1024 * 1024, spool_fsync='interval',
+                            reconnect_interval=5.0, frame_interval=None, frames_topic="parking-frames",
+                            frames_only=False, lot_id=DEFAULT_LOT_ID):
     """
     Mô phỏng streaming các sự kiện đỗ xe trong thời gian thực và gửi lên Kafka
     
     Args:
         duration_minutes (int): Thời gian chạy streaming (phút)
-        event_interval (float): Thời gian trung bình giữa các sự kiện (giây)
+        event_interval (float): Thời gian trung bình giữa các sự kiện (giây), 0 = không nghỉ
         kafka_broker (str): Địa chỉ Kafka broker (ví dụ: "localhost:9092" hoặc "192.168.1.20:9092")
         kafka_topic (str): Tên Kafka topic để gửi dữ liệu
+        fast_mode (bool): Gửi pipelined, không chờ xác nhận từng event
+        linger_ms (int): Thời gian gom batch của producer (fast_mode)
+        batch_size (int): Kích thước batch của producer (fast_mode)
+        compression_type (str): Kiểu nén batch (fast_mode)
+        flush_interval (float): Chu kỳ flush producer (giây, fast_mode)
+        locations (list): Danh sách vị trí đỗ (mặc định: ParkingEvent.PARKING_LOCATIONS)
+        license_plates (list): Danh sách biển số (mặc định: ParkingEvent.LICENSE_PLATES)
+        record_path (str): Ghi các event đã phát vào event log để replay (xem parking_event_log.py)
+        seed (int): Seed cho random để tái tạo đúng cùng một chuỗi event
+        wire_format (str): 'json' hoặc 'binary' (xem parking_wire_format.py)
+        clock: Nguồn thời gian cho event (WallClock mặc định, SimClock để nén thời gian);
+            với SimClock, event_interval là số giây ảo trung bình giữa các event
+        sim_duration_hours (float): Dừng khi thời gian ảo đã chạy đủ số giờ này
+        spool_dir (str): Thư mục spool trên đĩa; event gửi lỗi hoặc phát sinh khi mất kết nối
+            được ghi vào đây và gửi lại khi broker hoạt động trở lại (xem parking_spool.py)
+        spool_max_bytes (int): Dung lượng spool tối đa; vượt ngưỡng thì tạm dừng sinh event
+        spool_fsync (str): Chính sách fsync của spool: 'always', 'interval' hoặc 'never'
+        reconnect_interval (float): Chu kỳ thử kết nối lại / gửi lại spool (giây)
+        frame_interval (float): Chu kỳ gửi occupancy frame của mỗi tầng (giây theo clock),
+            None = không gửi frame (xem parking_frames.py)
+        frames_topic (str): Topic nhận occupancy frame
+        frames_only (bool): Chỉ gửi frame, không gửi event từng xe
+        lot_id (str): Bãi đỗ gắn vào mọi event/frame, cũng là Kafka key
     """
-    # Khởi tạo Kafka Producer nếu có cấu hình
-    producer = None
-    if kafka_broker and KAFKA_AVAILABLE:
+    stats = DeliveryStats()
+    
+    spool = None
+    if spool_dir and kafka_broker and KAFKA_AVAILABLE:
+        from parking_spool import EventSpool
+        spool = EventSpool(spool_dir, max_bytes=spool_max_bytes, fsync_policy=spool_fsync)
+        print(f"💾 Spool: {spool_dir} (tối đa {spool_max_bytes / 1024 / 1024:,.0f} MB, fsync: {spool_fsync}, "
+              f"đang chờ gửi lại: {spool.pending_bytes():,} bytes)")
+        if fast_mode:
+            print("⚠️  --fast: event đang bay khi mất kết nối được spool sau các event đã tới broker, "
+                  "có thể bị engine bỏ qua (bỏ --fast để giữ đúng thứ tự)")
+    
+    def connect(verbose=True):
         try:
-            producer = KafkaProducer(
-                bootstrap_servers=kafka_broker,
-                value_serializer=lambda v: json.dumps(v, ensure_ascii=False).encode('utf-8'),
-                acks='all',  # Đợi tất cả replicas xác nhận
-                retries=3,
-                max_in_flight_requests_per_connection=1
+            producer = create_kafka_producer(
+                kafka_broker,
+                fast_mode=fast_mode,
+                linger_ms=linger_ms,
+                batch_size=batch_size,
+                compression_type=compression_type,
+                value_serializer=serialize_event if wire_format == 'json' else None,
+                # Có spool thì không để send() treo lâu khi broker mất kết nối
+                max_block_ms=2000 if spool else 60000
             )
-            print(f"✅ Đã kết nối Kafka broker: {kafka_broker}")
-            print(f"✅ Topic: {kafka_topic}")
         except Exception as e:
-            print(f"⚠️  Không thể kết nối Kafka: {e}")
-            print("⚠️  Sẽ chỉ in ra console thay vì gửi lên Kafka")
-            producer = None
+            if verbose:
+                print(f"⚠️  Không thể kết nối Kafka: {e}")
+                if spool:
+                    print(f"⚠️  Event sẽ được ghi vào spool, thử kết nối lại mỗi {reconnect_interval}s")
+                else:
+                    print("⚠️  Sẽ chỉ in ra console thay vì gửi lên Kafka")
+            return None
+        print(f"✅ Đã kết nối Kafka broker: {kafka_broker}")
+        print(f"✅ Topic: {kafka_topic} (định dạng: {wire_format})")
+        if fast_mode:
+            print(f"⚡ Chế độ gửi nhanh: linger={linger_ms}ms, batch={batch_size}B, "
+                  f"nén={compression_type or 'không'}, flush mỗi {flush_interval}s")
+        return producer
+    
+    # Khởi tạo Kafka Producer nếu có cấu hình
+    producer = None
+    if kafka_broker and KAFKA_AVAILABLE:
+        producer = connect()
     elif kafka_broker and not KAFKA_AVAILABLE:
         print("⚠️  kafka-python chưa được cài đặt. Chỉ in ra console.")
     
+    # Thread nền: thử kết nối lại và gửi lại spool, để camera không bị treo khi broker chậm/mất
+    connection = {'producer': producer}
+    stop_retry = threading.Event()
+    
+    def retry_loop():
+        while not stop_retry.wait(reconnect_interval):
+            if connection['producer'] is None:
+                connection['producer'] = connect(verbose=False)
+            if connection['producer'] is not None and spool.has_pending():
+                sent = drain_spool(spool, connection['producer'], kafka_topic, wire_format)
+                if sent > 0:
+                    print(f"🔁 Đã gửi lại {sent} events từ spool")
+    
+    retry_thread = None
+    if spool:
+        retry_thread = threading.Thread(target=retry_loop, daemon=True)
+        retry_thread.start()
+    
     start_time = time.time()
     end_time = start_time + (duration_minutes * 60)
     
-    # Theo dõi các vị trí và biển số đang được sử dụng
-    occupied_locations = set()
-    active_license_plates = set()
+    clock = clock or WallClock()
+    sim_end = None
+    if isinstance(clock, SimClock):
+        if event_interval <= 0:
+            raise ValueError("Đồng hồ ảo cần event_interval > 0 (số giây ảo giữa các event)")
+        if sim_duration_hours:
+            sim_end = clock.start + sim_duration_hours * 3600
+        ratio = f"x{clock.ratio:g}" if clock.ratio > 0 else "nhanh nhất có thể"
+        print(f"🕒 Đồng hồ ảo từ {datetime.fromtimestamp(clock.start):%Y-%m-%d %H:%M:%S}, tốc độ {ratio}")
+    
+    if seed is not None:
+        random.seed(seed)
+    simulator = ParkingSimulator(locations=locations, license_plates=license_plates, lot_id=lot_id)
+    print(f"🅿️  Bãi đỗ {lot_id}: {len(simulator.location_pool.all_items)} vị trí, "
+          f"{len(simulator.plate_pool.all_items)} biển số")
+    
+    recorder = None
+    if record_path:
+        from parking_event_log import EventLogWriter
+        recorder = EventLogWriter(record_path, metadata={
+            "source": "parking_json_stream",
+            "lot_id": lot_id,
+            "seed": seed,
+            "locations": len(simulator.location_pool.all_items),
+            "license_plates": len(simulator.plate_pool.all_items),
+            "event_interval": event_interval
+        })
+        print(f"💾 Ghi event log: {record_path}")
     
-    # Tạo nhiều xe ngẫu nhiên để mô phỏng bãi đỗ thực tế
-    active_vehicles = []
-    for _ in range(5):
-        vehicle = ParkingEvent(occupied_locations, active_license_plates)
-        active_vehicles.append(vehicle)
-        occupied_locations.add(vehicle.location)
-        active_license_plates.add(vehicle.license_plate)
+    layout = None
+    if frame_interval:
+        layout = floor_layout(simulator.location_pool.all_items)
+        print(f"📷 Occupancy frame: {len(layout)} tầng, mỗi {frame_interval}s -> topic {frames_topic}"
+              f"{' (không gửi event từng xe)' if frames_only else ''}")
     
     event_count = 0
+    frame_count = 0
+    last_frame = None
+    last_flush = time.time()
     try:
-        while time.time() < end_time:
-            # Chọn ngẫu nhiên một xe để cập nhật trạng thái
-            vehicle = random.choice(active_vehicles)
+        while time.time() < end_time and (sim_end is None or clock.now() < sim_end):
+            event_data = simulator.step(clock.now())
+            if recorder:
+                recorder.append(event_data, emit_time=clock.now())
             
-            # Lưu trạng thái, vị trí và biển số cũ
-            old_status = vehicle.status
-            old_location = vehicle.location
-            old_license_plate = vehicle.license_plate
+            if spool is not None:
+                producer = connection['producer']
             
-            event_data = vehicle.get_event_info()
+            # Ảnh chụp toàn bộ từng tầng theo chu kỳ cố định
+            if layout is not None and (last_frame is None or clock.now() - last_frame >= frame_interval):
+                last_frame = clock.now()
+                frames = build_floor_frames(layout, simulator.occupied_locations(), last_frame, seq=frame_count,
+                                            lot_id=lot_id)
+                if producer:
+                    send_frames(producer, frames_topic, frames, stats, wire_format)
+                elif not recorder:
+                    for frame in frames:
+                        print(json.dumps(frame, ensure_ascii=False))
+                frame_count += 1
             
             # Gửi lên Kafka hoặc in ra console
-            if producer:
+            if frames_only:
+                # Event từng xe chỉ dùng để cập nhật mô phỏng
+                pass
+            elif spool is not None and (producer is None or spool.has_pending()):
+                # Mất kết nối hoặc spool còn event cũ: ghi tiếp vào spool để giữ đúng thứ tự
+                spool.append(event_data)
+                event_count += 1
+                # Backpressure: spool đầy thì ngừng sinh event cho đến khi thread nền gửi lại được
+                while spool.over_capacity() and time.time() < end_time:
+                    print(f"⏸️  Spool đầy ({spool.pending_bytes():,} bytes), tạm dừng camera...")
+                    time.sleep(reconnect_interval)
+            elif producer and fast_mode:
+                # Không chờ xác nhận; kết quả được đếm qua callback. Event gửi lỗi được spool
+                # từ callback, từ đó các event sau đi vào spool (nhánh trên) theo đúng thứ tự
+                send_event(producer, kafka_topic, event_data, stats, wire_format,
+                           on_failure=spool.append if spool else None)
+                event_count += 1
+                now = time.time()
+                if now - last_flush >= flush_interval:
+                    producer.flush()
+                    last_flush = now
+                    print(f"📤 {stats.summary()}")
+            elif producer:
                 try:
-                    # Gửi lên Kafka với key là location để đảm bảo cùng location được xử lý trên cùng partition
-                    future = producer.send(kafka_topic, key=vehicle.location.encode('utf-8'), value=event_data)
+                    # Gửi lên Kafka với key là lot_id để cả bãi được xử lý trên cùng partition
+                    future = producer.send(kafka_topic, key=lot_key(event_data),
+                                           **event_send_kwargs(event_data, wire_format))
                     # Đợi xác nhận (non-blocking check)
                     future.get(timeout=1)
                     event_count += 1
@@ -178,66 +693,54 @@ def parking_stream_realtime(duration_minutes=30, event_interval=3, kafka_broker=
                         print(f"📤 Đã gửi {event_count} events lên Kafka...")
                 except Exception as e:
                     print(f"❌ Lỗi khi gửi lên Kafka: {e}")
-                    # Fallback: in ra console
-                    print(json.dumps(event_data, ensure_ascii=False))
+                    if spool:
+                        spool.append(event_data)
+                    else:
+                        # Fallback: in ra console
+                        print(json.dumps(event_data, ensure_ascii=False))
             else:
-                # Chế độ console (không có Kafka)
-                print(json.dumps(event_data, ensure_ascii=False))
+                # Chế độ console (không có Kafka); khi đang ghi log thì chỉ đếm
+                if not recorder:
+                    print(json.dumps(event_data, ensure_ascii=False))
                 event_count += 1
                 
-            # Chuyển sang trạng thái tiếp theo
-            vehicle.next_status(occupied_locations, active_license_plates)
-            
-            # Quản lý occupied_locations và active_license_plates
-            if old_status == ParkingStatus.EXITING and vehicle.status == ParkingStatus.ENTERING:
-                # Xe tạo mới với vị trí và biển số mới
-                occupied_locations.discard(old_location)
-                occupied_locations.add(vehicle.location)
-                active_license_plates.discard(old_license_plate)
-                active_license_plates.add(vehicle.license_plate)
-            elif vehicle.status == ParkingStatus.EXITING and old_status != ParkingStatus.EXITING:
-                # Xe vừa chuyển sang EXITING - giải phóng vị trí (giữ biển số đến khi xe bị xóa)
-                occupied_locations.discard(vehicle.location)
-            
-            # Thêm xe mới ngẫu nhiên (mô phỏng xe mới vào bãi)
-            if random.random() > 0.6 and len(active_vehicles) < 8:
-                # Chỉ thêm nếu còn chỗ trống VÀ còn biển số
-                if (len(occupied_locations) < len(ParkingEvent.PARKING_LOCATIONS) and 
-                    len(active_license_plates) < len(ParkingEvent.LICENSE_PLATES)):
-                    new_vehicle = ParkingEvent(occupied_locations, active_license_plates)
-                    active_vehicles.append(new_vehicle)
-                    occupied_locations.add(new_vehicle.location)
-                    active_license_plates.add(new_vehicle.license_plate)
-            
-            # Xóa xe đã ra khỏi bãi
-            if random.random() > 0.5:
-                vehicles_to_remove = [v for v in active_vehicles if v.status == ParkingStatus.EXITING]
-                for v in vehicles_to_remove:
-                    active_vehicles.remove(v)
-                    occupied_locations.discard(v.location)
-                    active_license_plates.discard(v.license_plate)
-            
-            # Đảm bảo luôn có ít nhất 3 xe
-            while (len(active_vehicles) < 3 and 
-                   len(occupied_locations) < len(ParkingEvent.PARKING_LOCATIONS) and
-                   len(active_license_plates) < len(ParkingEvent.LICENSE_PLATES)):
-                new_vehicle = ParkingEvent(occupied_locations, active_license_plates)
-                active_vehicles.append(new_vehicle)
-                occupied_locations.add(new_vehicle.location)
-                active_license_plates.add(new_vehicle.license_plate)
-            
             # Delay ngẫu nhiên giữa các sự kiện
-            delay = random.uniform(event_interval * 0.5, event_interval * 1.5)
-            time.sleep(delay)
+            if event_interval > 0:
+                delay = random.uniform(event_interval * 0.5, event_interval * 1.5)
+                clock.sleep(delay)
     
     except KeyboardInterrupt:
         print("\n⚠️  Đã dừng bởi người dùng (Ctrl+C)")
     
     finally:
+        if isinstance(clock, SimClock):
+            print(f"🕒 Thời gian ảo đã chạy: {(clock.now() - clock.start) / 3600:.2f} giờ "
+                  f"(thực: {(time.time() - start_time) / 60:.1f} phút)")
+        if recorder:
+            recorder.close()
+            print(f"💾 Đã ghi {recorder.count} events vào {record_path}")
+        if spool:
+            stop_retry.set()
+            retry_thread.join()
+            producer = connection['producer']
+            if producer:
+                producer.flush()
+                sent = drain_spool(spool, producer, kafka_topic, wire_format)
+                if sent > 0:
+                    print(f"🔁 Đã gửi lại {sent} events từ spool")
+            print(f"💾 Spool: đã ghi {spool.appended}, đã gửi lại {spool.drained}, "
+                  f"còn chờ {spool.pending_bytes():,} bytes")
+            spool.close()
+        if layout is not None:
+            print(f"📷 Đã tạo {frame_count} lượt frame ({frame_count * len(layout)} messages)")
         if producer:
             producer.flush()
             producer.close()
             print(f"\n✅ Hoàn thành! Tổng cộng đã gửi {event_count} events lên Kafka")
+            if fast_mode:
+                print(f"📊 {stats.summary()}")
+                if stats.last_error is not None:
+                    print(f"❌ Lỗi gần nhất: {stats.last_error}")
         else:
             print(f"\n✅ Hoàn thành! Tổng cộng đã tạo {event_count} events")
 
@@ -256,11 +759,72 @@ if __name__ == "__main__":
                        help='Thời gian trung bình giữa các sự kiện (giây, mặc định: 3.0)')
     parser.add_argument('--no-kafka', action='store_true',
                        help='Không gửi lên Kafka, chỉ in ra console')
+    parser.add_argument('--lot-id', type=str, default=os.getenv('LOT_ID', DEFAULT_LOT_ID),
+                       help=f'Mã bãi đỗ gắn vào event, cũng là Kafka key (mặc định: {DEFAULT_LOT_ID} hoặc từ biến môi trường LOT_ID)')
+    parser.add_argument('--floors', type=int, default=6,
+                       help='Số tầng của bãi đỗ (A, B, ..., mặc định: 6)')
+    parser.add_argument('--slots-per-floor', type=int, default=10,
+                       help='Số vị trí mỗi tầng (mặc định: 10)')
+    parser.add_argument('--num-plates', type=int, default=0,
+                       help='Số biển số sinh ngẫu nhiên (mặc định: 0 = dùng danh sách có sẵn)')
+    parser.add_argument('--record', type=str, default=None,
+                       help='Ghi các event vào file event log để replay (parking_event_log.py)')
+    parser.add_argument('--seed', type=int, default=None,
+                       help='Seed cho random để tái tạo cùng một chuỗi event')
+    parser.add_argument('--sim-ratio', type=float, default=None,
+                       help='Bật đồng hồ ảo: số giây ảo mỗi giây thực (0 = nhanh nhất có thể); '
+                            '--interval khi đó là số giây ảo giữa các event')
+    parser.add_argument('--sim-start', type=str, default=None,
+                       help='Thời điểm bắt đầu của đồng hồ ảo "YYYY-MM-DD HH:MM:SS" (mặc định: hiện tại)')
+    parser.add_argument('--sim-hours', type=float, default=None,
+                       help='Dừng sau số giờ ảo này (dùng với --sim-ratio)')
+    parser.add_argument('--wire-format', type=str, default='json', choices=WIRE_FORMATS,
+                       help='Định dạng message: json hoặc binary gọn (mặc định: json)')
+    parser.add_argument('--spool-dir', type=str, default=None,
+                       help='Thư mục spool trên đĩa để giữ event khi mất kết nối Kafka')
+    parser.add_argument('--spool-max-mb', type=float, default=1024,
+                       help='Dung lượng spool tối đa (MB, mặc định: 1024), vượt ngưỡng thì tạm dừng camera')
+    parser.add_argument('--spool-fsync', type=str, default='interval', choices=['always', 'interval', 'never'],
+                       help='Chính sách fsync của spool (mặc định: interval = mỗi giây)')
+    parser.add_argument('--frame-interval', type=float, default=None,
+                       help='Gửi occupancy frame của mỗi tầng theo chu kỳ này (giây, mặc định: tắt); '
+                            'frame chỉ được tạo sau mỗi event nên chu kỳ thực tế >= --interval')
+    parser.add_argument('--frames-topic', type=str, default='parking-frames',
+                       help='Topic nhận occupancy frame (mặc định: parking-frames)')
+    parser.add_argument('--frames-only', action='store_true',
+                       help='Chỉ gửi occupancy frame, không gửi event từng xe (dùng với --frame-interval)')
+    parser.add_argument('--fast', action='store_true',
+                       help='Gửi pipelined không chờ xác nhận từng event (idempotent producer)')
+    parser.add_argument('--linger-ms', type=int, default=20,
+                       help='Thời gian gom batch của producer (ms, mặc định: 20, dùng với --fast)')
+    parser.add_argument('--batch-size', type=int, default=131072,
+                       help='Kích thước batch mỗi partition (bytes, mặc định: 131072, dùng với --fast)')
+    parser.add_argument('--compression', type=str, default='none',
+                       choices=['none', 'gzip', 'snappy', 'lz4', 'zstd'],
+                       help='Kiểu nén batch (mặc định: none, dùng với --fast)')
+    parser.add_argument('--flush-interval', type=float, default=1.0,
+                       help='Chu kỳ flush producer (giây, mặc định: 1.0, dùng với --fast)')
     
     args = parser.parse_args()
+    try:
+        validate_lot_id(args.lot_id)
+    except ValueError as e:
+        parser.error(str(e))
     
     kafka_broker = None if args.no_kafka else args.kafka_broker
     
+    locations = None
+    if args.floors != 6 or args.slots_per_floor != 10:
+        locations = generate_parking_locations(args.floors, args.slots_per_floor)
+    license_plates = generate_license_plates(args.num_plates, seed=args.seed) if args.num_plates > 0 else None
+    
+    clock = None
+    if args.sim_ratio is not None:
+        sim_start = None
+        if args.sim_start:
+            sim_start = datetime.strptime(args.sim_start, "%Y-%m-%d %H:%M:%S").timestamp()
+        clock = SimClock(start=sim_start, ratio=args.sim_ratio)
+    
     print("=" * 60)
     print("🚗 HỆ THỐNG MÔ PHỎNG CAMERA AI - BÃI ĐỖ XE")
     print("=" * 60)
@@ -270,5 +834,24 @@ if __name__ == "__main__":
         duration_minutes=args.duration,
         event_interval=args.interval,
         kafka_broker=kafka_broker,
-        kafka_topic=args.topic
+        kafka_topic=args.topic,
+        fast_mode=args.fast,
+        linger_ms=args.linger_ms,
+        batch_size=args.batch_size,
+        compression_type=None if args.compression == 'none' else args.compression,
+        flush_interval=args.flush_interval,
+        locations=locations,
+        license_plates=license_plates,
+        record_path=args.record,
+        seed=args.seed,
+        wire_format=args.wire_format,
+        clock=clock,
+        sim_duration_hours=args.sim_hours,
+        spool_dir=args.spool_dir,
+        spool_max_bytes=int(args.spool_max_mb * 1024 * 1024),
+        spool_fsync=args.spool_fsync,
+        frame_interval=args.frame_interval,
+        frames_topic=args.frames_topic,
+        frames_only=args.frames_only,
+        lot_id=args.lot_id
     )
@@ -0,0 +1,412 @@
+"""
+Load Generator - Mô phỏng nhiều camera AI song song để tìm điểm bão hòa của pipeline
+
+- Mỗi camera worker là một process riêng, sở hữu một shard vị trí không giao nhau
+  (mặc định mỗi tầng A-F một camera) và một dải biển số riêng
+- Tốc độ tổng (events/s) được khống chế bằng một token bucket dùng chung giữa các process
+- Hỗ trợ profile tốc độ: constant, burst (đột biến định kỳ) và diurnal (ngày/đêm)
+- In ra tốc độ đạt được so với mục tiêu theo chu kỳ
+- Nhiều bãi (--lots N): camera được chia đều cho N bãi, mỗi bãi đủ mọi vị trí và là một
+  Kafka key riêng, nên event trải trên nhiều partition
+"""
+
+import json
+import math
+import multiprocessing as mp
+import os
+import sys
+import time
+
+from parking_json_stream import (
+    KAFKA_AVAILABLE, ParkingEvent, ParkingSimulator, DeliveryStats, serialize_event,
+    create_kafka_producer, send_event, generate_parking_locations, generate_license_plates
+)
+from parking_wire_format import DEFAULT_LOT_ID, WIRE_FORMATS, validate_lot_id
+
+# Thời gian chờ camera flush và thoát sau khi hết giờ (giây); quá thì dừng cưỡng bức
+SHUTDOWN_TIMEOUT = 10.0
+
+
+class RateProfile:
+    """
+    Tốc độ mục tiêu (events/s) theo thời gian kể từ lúc bắt đầu
+
+    - constant: luôn bằng base_rate
+    - burst: mỗi burst_period giây có burst_duration giây chạy ở base_rate x burst_factor
+    - diurnal: dao động hình cos giữa base_rate x min_factor (đêm) và base_rate (trưa),
+      một chu kỳ dài period giây
+    """
+
+    PROFILES = ('constant', 'burst', 'diurnal')
+
+    def __init__(self, base_rate, profile='constant', burst_factor=5.0, burst_period=60.0,
+                 burst_duration=10.0, period=3600.0, min_factor=0.1):
+        if profile not in self.PROFILES:
+            raise ValueError(f"profile phải là một trong {self.PROFILES}")
+        self.base_rate = base_rate
+        self.profile = profile
+        self.burst_factor = burst_factor
+        self.burst_period = burst_period
+        self.burst_duration = burst_duration
+        self.period = period
+        self.min_factor = min_factor
+
+    def rate_at(self, elapsed):
+        """Tốc độ mục tiêu tại thời điểm elapsed (giây kể từ lúc bắt đầu)"""
+        if self.profile == 'burst':
+            if elapsed % self.burst_period < self.burst_duration:
+                return self.base_rate * self.burst_factor
+            return self.base_rate
+        if self.profile == 'diurnal':
+            phase = (1 - math.cos(2 * math.pi * elapsed / self.period)) / 2
+            return self.base_rate * (self.min_factor + (1 - self.min_factor) * phase)
+        return self.base_rate
+
+    def expected_events(self, t0, t1, steps=100):
+        """Số event mục tiêu trong khoảng [t0, t1] (tích phân số của rate_at)"""
+        dt = (t1 - t0) / steps
+        return sum(self.rate_at(t0 + (i + 0.5) * dt) for i in range(steps)) * dt
+
+
+class TokenBucket:
+    """
+    Token bucket dùng chung giữa nhiều process (trạng thái nằm trong shared memory)
+
+    Worker lấy token theo lô để giảm tranh chấp lock; tốc độ nạp token lấy từ RateProfile
+    nên profile burst/diurnal được áp dụng toàn cục.
+    """
+
+    def __init__(self, profile, capacity, start_time):
+        self.profile = profile
+        self.capacity = capacity
+        self.start_time = start_time
+        self._lock = mp.Lock()
+        self._tokens = mp.Value('d', 0.0, lock=False)
+        self._last_refill = mp.Value('d', start_time, lock=False)
+
+    def acquire(self, n, stop_event=None):
+        """Chờ đến khi lấy đủ n token; trả về False nếu stop_event được set trong lúc chờ"""
+        while stop_event is None or not stop_event.is_set():
+            with self._lock:
+                now = time.time()
+                rate = self.profile.rate_at(now - self.start_time)
+                tokens = min(self.capacity, self._tokens.value + (now - self._last_refill.value) * rate)
+                self._last_refill.value = now
+                if tokens >= n:
+                    self._tokens.value = tokens - n
+                    return True
+                self._tokens.value = tokens
+                wait = (n - tokens) / rate if rate > 0 else 0.1
+            time.sleep(min(wait, 0.1))
+        return False
+
+
+def shard_locations(locations, num_shards):
+    """
+    Chia vị trí thành num_shards phần không giao nhau
+
+    Nếu số tầng >= num_shards thì chia theo tầng (mỗi camera một hoặc vài tầng),
+    ngược lại cắt danh sách thành các đoạn liên tiếp gần bằng nhau.
+    """
+    floors = {}
+    for loc in locations:
+        floors.setdefault(loc.rstrip('0123456789'), []).append(loc)
+
+    if len(floors) >= num_shards:
+        shards = [[] for _ in range(num_shards)]
+        for i, floor in enumerate(sorted(floors)):
+            shards[i % num_shards].extend(floors[floor])
+        return shards
+
+    size = math.ceil(len(locations) / num_shards)
+    return [locations[i:i + size] for i in range(0, len(locations), size)]
+
+
+# Trạng thái dùng chung, được gán trong mỗi process con bởi _init_worker
+_bucket = None
+_counters = None
+_stop_event = None
+
+
+def _init_worker(bucket, counters, stop_event):
+    global _bucket, _counters, _stop_event
+    _bucket = bucket
+    _counters = counters
+    _stop_event = stop_event
+
+
+def camera_worker(spec):
+    """
+    Một camera: sinh event cho shard của mình, xin token theo lô rồi gửi lên Kafka
+
+    _counters có 3 ô cho mỗi worker: đã gửi, đã xác nhận, lỗi.
+    """
+    worker_id = spec['worker_id']
+    simulator = ParkingSimulator(
+        locations=spec['locations'],
+        license_plates=spec['license_plates'],
+        max_vehicles=spec['max_vehicles'],
+        lot_id=spec['lot_id']
+    )
+
+    producer = None
+    stats = DeliveryStats()
+    if spec['kafka_broker'] and KAFKA_AVAILABLE:
+        producer = create_kafka_producer(
+            spec['kafka_broker'],
+            fast_mode=True,
+            linger_ms=spec['linger_ms'],
+            batch_size=spec['batch_size'],
+            compression_type=spec['compression_type'],
+            value_serializer=serialize_event if spec['wire_format'] == 'json' else None
+        )
+
+    chunk = spec['chunk_size']
+    base = worker_id * 3
+    try:
+        while _bucket.acquire(chunk, _stop_event):
+            for _ in range(chunk):
+                event_data = simulator.step()
+                if producer:
+                    send_event(producer, spec['kafka_topic'], event_data, stats, spec['wire_format'])
+                else:
+                    stats.on_send()
+                    stats.on_success()
+            _counters[base] = stats.sent
+            _counters[base + 1] = stats.delivered
+            _counters[base + 2] = stats.failed
+    finally:
+        if producer:
+            producer.flush()
+            producer.close()
+        _counters[base] = stats.sent
+        _counters[base + 1] = stats.delivered
+        _counters[base + 2] = stats.failed
+    return worker_id, stats.sent, stats.delivered, stats.failed
+
+
+def lot_ids(lot_id=DEFAULT_LOT_ID, num_lots=1):
+    """Mã các bãi: lot_id nếu chỉ một bãi, ngược lại lot_id-1 ... lot_id-N"""
+    if num_lots < 1:
+        raise ValueError("Số bãi phải >= 1")
+    if num_lots == 1:
+        return [validate_lot_id(lot_id)]
+    return [validate_lot_id(f"{lot_id}-{k + 1}") for k in range(num_lots)]
+
+
+def run_load_generator(num_workers=6, profile=None, duration_seconds=60, kafka_broker=None,
+                       kafka_topic="parking-events", locations=None, license_plates=None,
+                       max_vehicles=8, chunk_size=50, report_interval=5.0,
+                       linger_ms=20, batch_size=131072, compression_type=None, wire_format='json',
+                       lot_id=DEFAULT_LOT_ID, num_lots=1):
+    """
+    Chạy num_workers camera trong process pool với tốc độ tổng theo profile
+
+    Camera được chia đều cho num_lots bãi (xem lot_ids); vị trí của mỗi bãi được chia shard
+    cho các camera của bãi đó.
+
+    Returns:
+        dict: Tổng kết (sent, delivered, failed, achieved_rate, target_rate, error);
+            error là lỗi của camera (ví dụ không kết nối được broker), None nếu không có
+    """
+    profile = profile or RateProfile(1000)
+    locations = locations or ParkingEvent.PARKING_LOCATIONS
+    license_plates = license_plates or ParkingEvent.LICENSE_PLATES
+
+    lots = lot_ids(lot_id, num_lots)
+    if num_workers < len(lots):
+        raise ValueError("Số camera phải >= số bãi")
+    shard_lots, location_shards = [], []
+    for k, lot in enumerate(lots):
+        shards = shard_locations(locations, num_workers // len(lots) + (k < num_workers % len(lots)))
+        shard_lots.extend([lot] * len(shards))
+        location_shards.extend(shards)
+    num_workers = len(location_shards)
+    plate_size = len(license_plates) // num_workers
+    if plate_size < 1:
+        raise ValueError("Số biển số phải >= số camera")
+
+    specs = [{
+        'worker_id': i,
+        'lot_id': shard_lots[i],
+        'locations': location_shards[i],
+        'license_plates': license_plates[i * plate_size:(i + 1) * plate_size],
+        'max_vehicles': max_vehicles,
+        'kafka_broker': kafka_broker,
+        'kafka_topic': kafka_topic,
+        'chunk_size': chunk_size,
+        'linger_ms': linger_ms,
+        'batch_size': batch_size,
+        'compression_type': compression_type,
+        'wire_format': wire_format,
+    } for i in range(num_workers)]
+
+    start_time = time.time()
+    # Dung lượng bucket ~ 100ms ở tốc độ cao nhất, tối thiểu đủ cho một lô mỗi camera
+    peak_rate = profile.base_rate * (profile.burst_factor if profile.profile == 'burst' else 1)
+    bucket = TokenBucket(profile, max(chunk_size * num_workers, peak_rate * 0.1), start_time)
+    counters = mp.Array('q', num_workers * 3, lock=False)
+    stop_event = mp.Event()
+
+    print(f"🎥 {num_workers} camera, {len(lots)} bãi | profile: {profile.profile} | mục tiêu: {profile.base_rate:,.0f} events/s")
+    for spec in specs:
+        floors = sorted({loc.rstrip('0123456789') for loc in spec['locations']})
+        print(f"   Camera {spec['worker_id']}: bãi {spec['lot_id']}, {len(spec['locations'])} vị trí "
+              f"(tầng {', '.join(floors)})")
+
+    pool = mp.Pool(processes=num_workers, initializer=_init_worker,
+                   initargs=(bucket, counters, stop_event))
+    result = pool.map_async(camera_worker, specs)
+
+    end_time = start_time + duration_seconds
+    last_report = start_time
+    last_sent = 0
+    target_events = 0.0
+    try:
+        while time.time() < end_time and not result.ready():
+            time.sleep(min(report_interval, max(0.0, end_time - time.time())))
+            now = time.time()
+            sent = sum(counters[i * 3] for i in range(num_workers))
+            failed = sum(counters[i * 3 + 2] for i in range(num_workers))
+            expected = profile.expected_events(last_report - start_time, now - start_time)
+            target_events += expected
+            target = expected / max(now - last_report, 1e-9)
+            achieved = (sent - last_sent) / max(now - last_report, 1e-9)
+            ratio = f"{achieved / target:.0%}" if target > 0 else "-"
+            print(f"📈 Đạt: {achieved:,.0f} events/s | mục tiêu: {target:,.0f} events/s "
+                  f"({ratio}) | tổng: {sent} | lỗi: {failed}")
+            last_report, last_sent = now, sent
+    except KeyboardInterrupt:
+        print("\n⚠️  Đã dừng bởi người dùng (Ctrl+C)")
+    finally:
+        stop_event.set()
+        pool.close()
+
+    # Lấy kết quả để lỗi trong camera (ví dụ NoBrokersAvailable) không bị bỏ qua; camera còn
+    # treo (đang chờ kết nối broker) sau SHUTDOWN_TIMEOUT thì bị dừng để không vượt --duration
+    error = None
+    try:
+        result.get(timeout=SHUTDOWN_TIMEOUT)
+    except mp.TimeoutError:
+        error = f"camera không dừng sau {SHUTDOWN_TIMEOUT:.0f}s (broker không phản hồi?)"
+        pool.terminate()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        pool.terminate()
+    pool.join()
+
+    elapsed = time.time() - start_time
+    totals = {
+        'sent': sum(counters[i * 3] for i in range(num_workers)),
+        'delivered': sum(counters[i * 3 + 1] for i in range(num_workers)),
+        'failed': sum(counters[i * 3 + 2] for i in range(num_workers)),
+    }
+    totals['achieved_rate'] = totals['sent'] / max(elapsed, 1e-9)
+    totals['target_rate'] = target_events / max(last_report - start_time, 1e-9)
+    totals['error'] = error
+    if error:
+        print(f"\n❌ Lỗi camera sau {elapsed:.1f}s: {error}")
+        print(f"   {json.dumps(totals, ensure_ascii=False)}")
+    else:
+        print(f"\n✅ Hoàn thành sau {elapsed:.1f}s: {json.dumps(totals, ensure_ascii=False)}")
+    return totals
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Load generator: nhiều camera AI song song với tốc độ khống chế')
+    parser.add_argument('--kafka-broker', type=str,
+                       default=os.getenv('KAFKA_BROKER', 'localhost:9092'),
+                       help='Địa chỉ Kafka broker (mặc định: localhost:9092 hoặc từ biến môi trường KAFKA_BROKER)')
+    parser.add_argument('--topic', type=str, default='parking-events',
+                       help='Tên Kafka topic (mặc định: parking-events)')
+    parser.add_argument('--no-kafka', action='store_true',
+                       help='Chỉ sinh event (không gửi), để đo giới hạn của chính generator')
+    parser.add_argument('--workers', type=int, default=6,
+                       help='Số camera / process (mặc định: 6, mỗi tầng một camera)')
+    parser.add_argument('--rate', type=float, default=1000,
+                       help='Tốc độ mục tiêu tổng (events/s, mặc định: 1000)')
+    parser.add_argument('--profile', type=str, default='constant', choices=RateProfile.PROFILES,
+                       help='Profile tốc độ (mặc định: constant)')
+    parser.add_argument('--burst-factor', type=float, default=5.0,
+                       help='Hệ số nhân tốc độ khi burst (mặc định: 5)')
+    parser.add_argument('--burst-period', type=float, default=60.0,
+                       help='Chu kỳ burst (giây, mặc định: 60)')
+    parser.add_argument('--burst-duration', type=float, default=10.0,
+                       help='Độ dài mỗi burst (giây, mặc định: 10)')
+    parser.add_argument('--diurnal-period', type=float, default=3600.0,
+                       help='Độ dài một "ngày" của profile diurnal (giây, mặc định: 3600)')
+    parser.add_argument('--duration', type=float, default=60,
+                       help='Thời gian chạy (giây, mặc định: 60)')
+    parser.add_argument('--lot-id', type=str, default=os.getenv('LOT_ID', DEFAULT_LOT_ID),
+                       help=f'Mã bãi đỗ, cũng là Kafka key (mặc định: {DEFAULT_LOT_ID} hoặc từ biến môi trường LOT_ID)')
+    parser.add_argument('--lots', type=int, default=1,
+                       help='Số bãi đỗ; > 1 thì camera được chia đều cho các bãi <lot-id>-1 ... <lot-id>-N, '
+                            'mỗi bãi một Kafka key (mặc định: 1)')
+    parser.add_argument('--floors', type=int, default=6,
+                       help='Số tầng của bãi đỗ (mặc định: 6)')
+    parser.add_argument('--slots-per-floor', type=int, default=10,
+                       help='Số vị trí mỗi tầng (mặc định: 10)')
+    parser.add_argument('--num-plates', type=int, default=0,
+                       help='Số biển số sinh ngẫu nhiên (mặc định: 0 = dùng danh sách có sẵn)')
+    parser.add_argument('--vehicles-per-camera', type=int, default=8,
+                       help='Số xe tối đa mỗi camera theo dõi cùng lúc (mặc định: 8)')
+    parser.add_argument('--chunk-size', type=int, default=50,
+                       help='Số token mỗi lần camera xin từ bucket (mặc định: 50)')
+    parser.add_argument('--report-interval', type=float, default=5.0,
+                       help='Chu kỳ in tốc độ (giây, mặc định: 5)')
+    parser.add_argument('--wire-format', type=str, default='json', choices=WIRE_FORMATS,
+                       help='Định dạng message: json hoặc binary gọn (mặc định: json)')
+    parser.add_argument('--linger-ms', type=int, default=20,
+                       help='Thời gian gom batch của producer (ms, mặc định: 20)')
+    parser.add_argument('--batch-size', type=int, default=131072,
+                       help='Kích thước batch mỗi partition (bytes, mặc định: 131072)')
+    parser.add_argument('--compression', type=str, default='none',
+                       choices=['none', 'gzip', 'snappy', 'lz4', 'zstd'],
+                       help='Kiểu nén batch (mặc định: none)')
+
+    args = parser.parse_args()
+    try:
+        lot_ids(args.lot_id, args.lots)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.workers < args.lots:
+        parser.error("--workers phải >= --lots")
+
+    locations = None
+    if args.floors != 6 or args.slots_per_floor != 10:
+        locations = generate_parking_locations(args.floors, args.slots_per_floor)
+    license_plates = generate_license_plates(args.num_plates) if args.num_plates > 0 else None
+
+    print("=" * 60)
+    print("🚗 LOAD GENERATOR - NHIỀU CAMERA AI")
+    print("=" * 60)
+
+    totals = run_load_generator(
+        num_workers=args.workers,
+        profile=RateProfile(
+            args.rate,
+            profile=args.profile,
+            burst_factor=args.burst_factor,
+            burst_period=args.burst_period,
+            burst_duration=args.burst_duration,
+            period=args.diurnal_period
+        ),
+        duration_seconds=args.duration,
+        kafka_broker=None if args.no_kafka else args.kafka_broker,
+        kafka_topic=args.topic,
+        locations=locations,
+        license_plates=license_plates,
+        max_vehicles=args.vehicles_per_camera,
+        chunk_size=args.chunk_size,
+        report_interval=args.report_interval,
+        linger_ms=args.linger_ms,
+        batch_size=args.batch_size,
+        compression_type=None if args.compression == 'none' else args.compression,
+        wire_format=args.wire_format,
+        lot_id=args.lot_id,
+        num_lots=args.lots
+    )
+    if totals['error']:
+        sys.exit(1)
@@ -0,0 +1,161 @@
+"""
+Báo cáo theo ngày từ Parquet archive (xem parking_archive.py) - Spark batch job
+
+Mỗi ngày, mỗi bãi (lot_id), mỗi tầng:
+- stays: số lượt đỗ kết thúc (hóa đơn, bảng bills) trong ngày
+- revenue: tổng tiền hóa đơn của các lượt đỗ đó (VNĐ)
+- parked_hours: tổng giờ xe đỗ trong ngày của các lượt đỗ đã kết thúc (lượt đỗ qua nhiều
+  ngày được chia theo ngày; xe còn đang đỗ chưa được tính)
+- occupancy_rate: parked_hours / (số vị trí của tầng trong bãi x 24)
+- events, entries: số event (đã bỏ bản trùng giống hệt nhau) và số lượt xe vào
+
+Chỉ đọc các partition date/floor trong khoảng yêu cầu (partition pruning), nên thời gian
+chạy tỉ lệ với số ngày được hỏi chứ không phải toàn bộ lịch sử. Các bãi dùng chung tên vị
+trí ("A1" ở mọi bãi) nên mọi phép gộp đều theo lot_id; dữ liệu archive cũ (chưa có cột
+lot_id) thuộc bãi DEFAULT_LOT_ID. Doanh thu lấy từ bảng bills, nên Spark cần chạy với
+BILLS_TOPIC (mặc định parking-bills, trống = không có hóa đơn).
+
+Chạy:
+    spark-submit parking_report.py --archive /data/parking-archive --from 2026-01-01 --to 2026-01-07
+"""
+
+import os
+
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import (
+    col, lit, expr, to_date, when, coalesce,
+    count, countDistinct, sum as spark_sum, round as spark_round
+)
+
+from parking_archive import EVENTS_TABLE, BILLS_TABLE, TABLE_SCHEMAS, table_exists, table_path
+from parking_tariff import load_tariff
+from parking_wire_format import DEFAULT_LOT_ID
+
+
+def read_table(spark, archive_dir, table, start_date, end_date, floors=None, lots=None):
+    """
+    Đọc một bảng của archive, chỉ các partition trong [start_date, end_date], floors và lots;
+    bảng chưa có (archive mới, chưa lượt đỗ nào kết thúc) là DataFrame rỗng
+    """
+    path = table_path(archive_dir, table)
+    if table_exists(spark, path):
+        df = spark.read.option("mergeSchema", "true").parquet(path)
+    else:
+        print(f"⚠️  Chưa có bảng {path}, coi như không có dữ liệu")
+        df = spark.createDataFrame([], TABLE_SCHEMAS[table])
+    df = df.where((col("date") >= to_date(lit(start_date))) & (col("date") <= to_date(lit(end_date))))
+    lot_id = coalesce(col("lot_id"), lit(DEFAULT_LOT_ID)) if "lot_id" in df.columns else lit(DEFAULT_LOT_ID)
+    df = df.withColumn("lot_id", lot_id)
+    if floors:
+        df = df.where(col("floor").isin(list(floors)))
+    if lots:
+        df = df.where(col("lot_id").isin(list(lots)))
+    return df
+
+
+def daily_report(spark, archive_dir, start_date, end_date, floors=None, slots_per_floor=None,
+                 utc_offset_hours=7, lots=None):
+    """
+    Báo cáo doanh thu và công suất theo ngày, theo bãi và tầng
+
+    Args:
+        slots_per_floor (int): Số vị trí mỗi tầng (mặc định: số vị trí khác nhau xuất hiện
+            trong event của tầng, trong bãi, trong khoảng ngày)
+        utc_offset_hours (int): Múi giờ của ranh giới ngày (giống bảng giá)
+    """
+    bills = read_table(spark, archive_dir, BILLS_TABLE, start_date, end_date, floors, lots)
+    # Camera gửi lại, hoặc batch archive chạy lại sau sự cố, ghi lại đúng event đó: chỉ đếm một lần
+    events = read_table(spark, archive_dir, EVENTS_TABLE, start_date, end_date, floors, lots) \
+        .dropDuplicates(["lot_id", "location", "license_plate", "status_code", "event_timestamp_unix"])
+    offset = int(utc_offset_hours * 3600)
+
+    # Mỗi lượt đỗ kết thúc có một hóa đơn (bill_id = bãi, vị trí, giờ vào, biển số), tiền tính
+    # đến giờ ra; batch chạy lại sau sự cố có thể ghi trùng nên bỏ trùng theo bill_id
+    stays = bills.dropDuplicates(["lot_id", "location", "entry_time_unix", "license_plate"])
+
+    revenue = stays.groupBy("date", "lot_id", "floor").agg(
+        count("*").alias("stays"),
+        spark_sum("bill_amount").alias("revenue")
+    )
+
+    # Chia thời gian đỗ của từng lượt theo các ngày nó đi qua
+    parked = stays \
+        .withColumn("day", expr(
+            f"explode(sequence(floor((entry_time_unix + {offset}) / 86400), "
+            f"floor((exit_time_unix + {offset}) / 86400)))"
+        )) \
+        .withColumn("overlap_seconds", expr(
+            f"greatest(least(exit_time_unix, (day + 1) * 86400 - {offset}) "
+            f"- greatest(entry_time_unix, day * 86400 - {offset}), 0)"
+        )) \
+        .withColumn("date", expr("date_add(date'1970-01-01', cast(day as int))")) \
+        .where((col("date") >= to_date(lit(start_date))) & (col("date") <= to_date(lit(end_date)))) \
+        .groupBy("date", "lot_id", "floor") \
+        .agg((spark_sum("overlap_seconds") / 3600.0).alias("parked_hours"))
+
+    activity = events.groupBy("date", "lot_id", "floor").agg(
+        count("*").alias("events"),
+        count(when(col("status_code") == "ENTERING", 1)).alias("entries")
+    )
+
+    if slots_per_floor:
+        slots = events.select("lot_id", "floor").distinct().withColumn("slots", lit(slots_per_floor))
+    else:
+        slots = events.groupBy("lot_id", "floor").agg(countDistinct("location").alias("slots"))
+
+    return activity \
+        .join(revenue, ["date", "lot_id", "floor"], "full_outer") \
+        .join(parked, ["date", "lot_id", "floor"], "full_outer") \
+        .join(slots, ["lot_id", "floor"], "left") \
+        .select(
+            col("date"),
+            col("lot_id"),
+            col("floor"),
+            coalesce(col("stays"), lit(0)).alias("stays"),
+            coalesce(col("revenue"), lit(0.0)).alias("revenue"),
+            spark_round(coalesce(col("parked_hours"), lit(0.0)), 2).alias("parked_hours"),
+            spark_round(coalesce(col("parked_hours"), lit(0.0)) / (col("slots") * 24), 4).alias("occupancy_rate"),
+            coalesce(col("events"), lit(0)).alias("events"),
+            coalesce(col("entries"), lit(0)).alias("entries")
+        ) \
+        .orderBy("date", "lot_id", "floor")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Báo cáo doanh thu và công suất theo ngày từ Parquet archive')
+    parser.add_argument('--archive', type=str, default=os.getenv('ARCHIVE_DIR', '/tmp/parking-archive'),
+                       help='Thư mục archive (mặc định: ARCHIVE_DIR hoặc /tmp/parking-archive)')
+    parser.add_argument('--from', dest='start_date', type=str, required=True,
+                       help='Ngày bắt đầu YYYY-MM-DD')
+    parser.add_argument('--to', dest='end_date', type=str, default=None,
+                       help='Ngày kết thúc YYYY-MM-DD (mặc định: bằng --from)')
+    parser.add_argument('--floor', type=str, action='append', default=None,
+                       help='Chỉ báo cáo tầng này (lặp lại được, mặc định: mọi tầng)')
+    parser.add_argument('--lot-id', type=str, action='append', default=None,
+                       help='Chỉ báo cáo bãi này (lặp lại được, mặc định: mọi bãi)')
+    parser.add_argument('--slots-per-floor', type=int, default=None,
+                       help='Số vị trí mỗi tầng (mặc định: số vị trí xuất hiện trong event)')
+    parser.add_argument('--tariff', type=str, default=os.getenv('TARIFF_FILE'),
+                       help='File JSON bảng giá, dùng cho múi giờ ranh giới ngày (mặc định: TARIFF_FILE)')
+    parser.add_argument('--output', type=str, default=None,
+                       help='Ghi báo cáo ra thư mục CSV (mặc định: chỉ in ra màn hình)')
+
+    args = parser.parse_args()
+
+    spark = SparkSession.builder.appName("ParkingDailyReport").getOrCreate()
+    spark.sparkContext.setLogLevel("WARN")
+    try:
+        report = daily_report(
+            spark, args.archive, args.start_date, args.end_date or args.start_date,
+            floors=args.floor, slots_per_floor=args.slots_per_floor,
+            utc_offset_hours=load_tariff(args.tariff).utc_offset_hours,
+            lots=args.lot_id
+        )
+        report.show(1000, truncate=False)
+        if args.output:
+            report.coalesce(1).write.mode("overwrite").option("header", "true").csv(args.output)
+            print(f"💾 Đã ghi báo cáo: {args.output}")
+    finally:
+        spark.stop()
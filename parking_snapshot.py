@@ -0,0 +1,122 @@
+"""
+Snapshot - Lưu state cùng vị trí đọc Kafka để khởi động lại nhanh, dùng chung cho engine
+Python (parking_stream_processor.py), GUI và dashboard server
+
+Snapshot là một file JSON ghi nguyên tử (file tạm + fsync + rename):
+
+    {"version": 1, "saved_at": ..., "positions": {"topic:partition": offset kế tiếp}, <các phần state>}
+
+State và positions phải được lấy cùng lúc (cùng một delta / cùng một event), khi nạp lại
+thì đọc tiếp Kafka từ đúng positions bằng seek_partitions (PartitionWatcher gán thêm
+partition tạo sau khi khởi động).
+"""
+
+import json
+import os
+import sys
+import time
+
+SNAPSHOT_VERSION = 1
+# Thời gian chờ topic chưa có partition khi khởi động, chu kỳ kiểm tra partition mới (giây)
+PARTITION_WAIT_SECONDS = 30
+PARTITION_CHECK_SECONDS = 30
+
+
+def save_snapshot(path, positions, **sections):
+    """
+    Ghi snapshot nguyên tử
+
+    Args:
+        positions (dict): Vị trí đọc {"topic:partition": offset} (hoặc {"file": byte} với file)
+        sections: Các phần state, ví dụ lots={...} hoặc processor={...}
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": SNAPSHOT_VERSION, "saved_at": time.time(), "positions": positions, **sections},
+                  f, ensure_ascii=False, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_snapshot(path):
+    """Snapshot đã lưu, None nếu chưa có hoặc không đọc được"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        if os.path.exists(path):
+            print(f"⚠️  Không đọc được snapshot {path}: {e}", file=sys.stderr)
+        return None
+    if data.get("version") != SNAPSHOT_VERSION:
+        print(f"⚠️  Bỏ qua snapshot {path}: phiên bản {data.get('version')}", file=sys.stderr)
+        return None
+    return data
+
+
+def _topic_partitions(consumer, topics):
+    from kafka import TopicPartition
+
+    return [TopicPartition(topic, p)
+            for topic in topics for p in sorted(consumer.partitions_for_topic(topic) or ())]
+
+
+def seek_partitions(consumer, topics, positions=None, wait_seconds=PARTITION_WAIT_SECONDS):
+    """
+    Gán mọi partition của topics cho consumer (không dùng consumer group, nên nhiều tiến trình
+    cùng đọc không chia nhau partition) và đọc tiếp từ positions; partition chưa có vị trí
+    thì đọc từ cuối (như startingOffsets=latest của Spark)
+
+    Topic chưa có partition (chưa tạo) thì chờ tối đa wait_seconds rồi raise RuntimeError,
+    thay vì gán danh sách rỗng và không bao giờ đọc được gì. Partition thêm sau khi khởi
+    động được PartitionWatcher gán tiếp.
+    """
+    deadline = time.time() + wait_seconds
+    while True:
+        missing = [topic for topic in topics if not consumer.partitions_for_topic(topic)]
+        if not missing:
+            break
+        if time.time() >= deadline:
+            raise RuntimeError(f"Topic {', '.join(missing)} không tồn tại hoặc chưa có partition")
+        print(f"⏳ Chờ topic {', '.join(missing)}...", file=sys.stderr)
+        time.sleep(2)
+        consumer.topics()  # làm mới metadata
+
+    partitions = _topic_partitions(consumer, topics)
+    consumer.assign(partitions)
+    for tp in partitions:
+        offset = (positions or {}).get(f"{tp.topic}:{tp.partition}")
+        if offset is None:
+            consumer.seek_to_end(tp)
+        else:
+            consumer.seek(tp, offset)
+    return consumer
+
+
+class PartitionWatcher:
+    """
+    Định kỳ đọc lại metadata và gán thêm partition mới của topics (ví dụ khi tăng số partition
+    để mở rộng), đọc chúng từ đầu vì mọi message ở đó đều được ghi sau khi khởi động; gọi
+    check() trong thread đang poll consumer
+    """
+
+    def __init__(self, topics, interval=PARTITION_CHECK_SECONDS):
+        self.topics = list(topics)
+        self.interval = interval
+        self._last_check = time.time()
+
+    def check(self, consumer):
+        """Số partition mới được gán (0 nếu chưa tới kỳ kiểm tra hoặc không có)"""
+        now = time.time()
+        if now - self._last_check < self.interval:
+            return 0
+        self._last_check = now
+        consumer.topics()  # làm mới metadata
+        assigned = consumer.assignment()
+        new = [tp for tp in _topic_partitions(consumer, self.topics) if tp not in assigned]
+        if new:
+            consumer.assign(list(assigned) + new)
+            consumer.seek_to_beginning(*new)
+            print(f"➕ Gán thêm {len(new)} partition mới: "
+                  f"{', '.join(f'{tp.topic}:{tp.partition}' for tp in new)}", file=sys.stderr)
+        return len(new)
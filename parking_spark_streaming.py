@@ -10,31 +10,151 @@ Yêu cầu:
 
 from pyspark.sql import SparkSession
 from pyspark.sql.functions import (
-    from_json, col, window, current_timestamp, 
-    when, lit, expr, struct, to_json, max as spark_max
+    from_json, col, current_timestamp, 
+    when, lit, expr, struct, to_json, greatest as spark_greatest, max as spark_max,
+    array, encode, unhex, concat, coalesce, from_unixtime, explode, timestamp_seconds, pandas_udf
 )
+from pyspark.sql.streaming.state import GroupStateTimeout
 from pyspark.sql.types import (
     StructType, StructField, StringType, IntegerType, 
-    TimestampType, DoubleType, LongType
+    TimestampType, DoubleType, LongType, ArrayType
 )
+import json
 import os
 import sys
+import threading
+import time
+
+import pandas as pd
+from pyspark.sql.streaming import StreamingQueryListener
+
+from parking_archive import (
+    EVENTS_TABLE, BILLING_TABLE, BILLS_TABLE, table_path, with_partition_columns, append_partitioned, compact_table
+)
+from parking_summary import DEFAULT_LAYOUT, LotSummary, parse_layout
+from parking_tariff import Tariff, load_tariff, compute_fees, calculate_fee
+from parking_state import (
+    apply_event, completed_stay, visible_changed, output_status, billed_blocks, seconds_until_next_block
+)
+from parking_wire_format import (
+    CONTENT_TYPE_HEADER, JSON_CONTENT_TYPE, EVENT_V1_CONTENT_TYPE, STATUS_V1_CONTENT_TYPE,
+    EVENT_STATUS_CODES, OUTPUT_STATUS_CODES, NULL_U32, DEFAULT_LOT_ID, LEGACY_KEY_PATTERN, decode_status
+)
 
 # Cấu hình
 KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'localhost:9092')
 INPUT_TOPIC = os.getenv('INPUT_TOPIC', 'parking-events')
 OUTPUT_TOPIC = os.getenv('OUTPUT_TOPIC', 'parking-status')
+# Hóa đơn của lượt đỗ đã kết thúc (một record cho mỗi lượt), trống = không phát hóa đơn
+BILLS_TOPIC = os.getenv('BILLS_TOPIC', 'parking-bills')
+# Topic occupancy frame của camera (xem parking_frames.py), để trống = không đọc frame
+FRAMES_TOPIC = os.getenv('FRAMES_TOPIC', '')
 CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR', '/tmp/spark-checkpoint-parking')
-PRICE_PER_BLOCK = float(os.getenv('PRICE_PER_BLOCK', '15000'))  # Giá mỗi block 10 phút
+PRICE_PER_BLOCK = float(os.getenv('PRICE_PER_BLOCK', '15000'))  # Giá ban ngày mỗi block (tầng thường)
+# File JSON bảng giá (tầng, ngày/đêm, trần mỗi ngày, miễn phí ban đầu), trống = bảng giá có sẵn
+TARIFF_FILE = os.getenv('TARIFF_FILE', '')
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'json')  # 'json' hoặc 'binary' cho topic parking-status
+# TTL: xóa state của vị trí không có event trong khoảng thời gian này (phút, theo BILLING_CLOCK)
+STATE_TIMEOUT_MINUTES = float(os.getenv('STATE_TIMEOUT_MINUTES', '1440'))
+# Watermark theo thời gian event: event trễ hơn khoảng này so với event mới nhất bị bỏ
+EVENT_WATERMARK = os.getenv('EVENT_WATERMARK', '10 minutes')
+# Bỏ event trùng trước khi vào state: 'exact' = cùng vị trí, biển số, trạng thái và thời gian
+# (producer gửi lại), 'off' = không lọc
+DEDUP_MODE = os.getenv('DEDUP_MODE', 'exact')
+# State store: 'hdfs' (mặc định của Spark, giữ toàn bộ state trên heap) hoặc 'rocksdb'
+STATE_STORE = os.getenv('STATE_STORE', 'hdfs')
+ROCKSDB_MAX_MEMORY_MB = os.getenv('ROCKSDB_MAX_MEMORY_MB', '')  # trống = không giới hạn
+STATE_MIN_BATCHES_TO_RETAIN = os.getenv('STATE_MIN_BATCHES_TO_RETAIN', '100')
+# 'change' = chỉ gửi khi trạng thái / biển số / số block tính tiền khác lần gửi trước,
+# 'state' = gửi mỗi khi state của vị trí thay đổi (kể cả ENTERING -> PARKED)
+EMIT_MODE = os.getenv('EMIT_MODE', 'change')
+# Cấu hình producer của Kafka sink (topic parking-status)
+SINK_LINGER_MS = os.getenv('SINK_LINGER_MS', '20')
+SINK_BATCH_SIZE = os.getenv('SINK_BATCH_SIZE', '65536')
+SINK_COMPRESSION = os.getenv('SINK_COMPRESSION', 'none')  # none, gzip, snappy, lz4, zstd
+# 'processing' = tính tiền theo đồng hồ của Spark (unix_timestamp()),
+# 'event' = theo thời gian của event (dùng với đồng hồ ảo của producer: --sim-ratio)
+BILLING_CLOCK = os.getenv('BILLING_CLOCK', 'processing')
+
+# Giới hạn số offset (message) mỗi micro-batch, trống = không giới hạn
+MAX_OFFSETS_PER_TRIGGER = os.getenv('MAX_OFFSETS_PER_TRIGGER', '200000')
+# Gom tối thiểu số offset này mới chạy batch (chờ tối đa MAX_TRIGGER_DELAY), trống = không dùng
+MIN_OFFSETS_PER_TRIGGER = os.getenv('MIN_OFFSETS_PER_TRIGGER', '')
+MAX_TRIGGER_DELAY = os.getenv('MAX_TRIGGER_DELAY', '30 seconds')
+TRIGGER_INTERVAL = os.getenv('TRIGGER_INTERVAL', '5 seconds')  # trống = chạy batch liên tục
+# Thời gian batch mục tiêu (giây) cho bộ điều chỉnh maxOffsetsPerTrigger, trống = tắt
+LATENCY_TARGET_SECONDS = os.getenv('LATENCY_TARGET_SECONDS', '')
+SHUFFLE_PARTITIONS = os.getenv('SHUFFLE_PARTITIONS', '')  # trống = số partition của INPUT_TOPIC
+
+# Lưu event và dòng tính tiền dạng Parquet (xem parking_archive.py), trống = không lưu
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '')
+ARCHIVE_CHECKPOINT_DIR = os.getenv('ARCHIVE_CHECKPOINT_DIR', CHECKPOINT_DIR.rstrip('/') + '-archive')
+# Gộp file nhỏ của các ngày đã qua sau mỗi chừng này batch (0 = không gộp)
+ARCHIVE_COMPACT_EVERY = int(os.getenv('ARCHIVE_COMPACT_EVERY', '100'))
+ARCHIVE_COMPACT_MIN_FILES = int(os.getenv('ARCHIVE_COMPACT_MIN_FILES', '8'))
+
+# Tổng hợp theo tầng / toàn bãi (xem parking_summary.py) gửi định kỳ, trống = tắt
+SUMMARY_TOPIC = os.getenv('SUMMARY_TOPIC', 'parking-summary')
+SUMMARY_INTERVAL_SECONDS = float(os.getenv('SUMMARY_INTERVAL_SECONDS', '2'))
+SUMMARY_CHECKPOINT_DIR = os.getenv('SUMMARY_CHECKPOINT_DIR', CHECKPOINT_DIR.rstrip('/') + '-summary')
+# Số vị trí mỗi tầng, dùng cho số chỗ trống: "A:10,B:10,..."
+LOT_LAYOUT = parse_layout(os.getenv('LOT_LAYOUT', DEFAULT_LAYOUT))
+
+TARIFF = load_tariff(TARIFF_FILE or None, price_per_block=PRICE_PER_BLOCK)
+
+def get_topic_partition_count(topic):
+    """Số partition của Kafka topic (qua kafka-python), None nếu không lấy được"""
+    try:
+        from kafka import KafkaConsumer
+    except ImportError:
+        return None
+    try:
+        consumer = KafkaConsumer(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS, request_timeout_ms=10000)
+        try:
+            partitions = consumer.partitions_for_topic(topic)
+        finally:
+            consumer.close()
+    except Exception as e:
+        print(f"⚠️  Không lấy được số partition của {topic}: {e}")
+        return None
+    return len(partitions) if partitions else None
+
+def resolve_shuffle_partitions():
+    """
+    spark.sql.shuffle.partitions: SHUFFLE_PARTITIONS nếu có, ngược lại bằng số partition
+    của INPUT_TOPIC (độ song song của bước state bằng độ song song của bước đọc Kafka), mặc
+    định 3 nếu không hỏi được broker
+
+    State được băm theo (lot_id, location) nên các vị trí của một bãi rải đều trên mọi task
+    shuffle; key lot_id chỉ giữ thứ tự event của một bãi trong Kafka, không gắn bãi với task.
+    """
+    if SHUFFLE_PARTITIONS:
+        return int(SHUFFLE_PARTITIONS)
+    return get_topic_partition_count(INPUT_TOPIC) or 3
 
 def create_spark_session():
     """Tạo Spark Session với cấu hình phù hợp"""
-    spark = SparkSession.builder \
+    builder = SparkSession.builder \
         .appName("ParkingFeeCalculator") \
         .config("spark.sql.streaming.checkpointLocation", CHECKPOINT_DIR) \
-        .config("spark.sql.shuffle.partitions", "3") \
-        .config("spark.streaming.kafka.maxRatePerPartition", "100") \
-        .getOrCreate()
+        .config("spark.sql.shuffle.partitions", str(resolve_shuffle_partitions())) \
+        .config("spark.sql.streaming.minBatchesToRetain", STATE_MIN_BATCHES_TO_RETAIN)
+    
+    if STATE_STORE == 'rocksdb':
+        # State nằm ngoài heap (RocksDB); checkpoint chỉ ghi changelog của mỗi batch
+        # thay vì snapshot toàn bộ state, nên kích thước checkpoint tỉ lệ với số thay đổi
+        builder = builder \
+            .config("spark.sql.streaming.stateStore.providerClass",
+                    "org.apache.spark.sql.execution.streaming.state.RocksDBStateStoreProvider") \
+            .config("spark.sql.streaming.stateStore.rocksdb.changelogCheckpointing.enabled", "true")
+        if ROCKSDB_MAX_MEMORY_MB:
+            builder = builder \
+                .config("spark.sql.streaming.stateStore.rocksdb.boundedMemoryUsage", "true") \
+                .config("spark.sql.streaming.stateStore.rocksdb.maxMemoryUsageMB", ROCKSDB_MAX_MEMORY_MB)
+    elif STATE_STORE != 'hdfs':
+        raise ValueError(f"STATE_STORE phải là 'hdfs' hoặc 'rocksdb', nhận được: {STATE_STORE}")
+    
+    spark = builder.getOrCreate()
     
     spark.sparkContext.setLogLevel("WARN")
     return spark
@@ -46,119 +166,502 @@ def get_input_schema():
         StructField("timestamp_unix", LongType()),
         StructField("license_plate", StringType()),
         StructField("location", StringType()),
-        StructField("status_code", StringType())
+        StructField("status_code", StringType()),
+        StructField("lot_id", StringType())
     ])
 
-def calculate_parking_fee(entry_time_seconds, current_time_seconds, price_per_block):
+def get_frame_schema():
+    """Schema của occupancy frame (một message = toàn bộ một tầng)"""
+    return StructType([
+        StructField("timestamp", StringType()),
+        StructField("timestamp_unix", LongType()),
+        StructField("camera_id", StringType()),
+        StructField("lot_id", StringType()),
+        StructField("floor", StringType()),
+        StructField("seq", LongType()),
+        StructField("slot_count", IntegerType()),
+        StructField("bitmap", StringType()),
+        StructField("plates", ArrayType(StringType()))
+    ])
+
+def calculate_parking_fee(entry_time_seconds, current_time_seconds, location=None, tariff=None):
     """
-    Tính tiền đỗ xe theo block 10 phút
+    Tính tiền một lượt đỗ theo bảng giá (cùng engine với Spark, xem parking_tariff.py)
     
     Args:
         entry_time_seconds: Thời gian vào (Unix timestamp)
         current_time_seconds: Thời gian hiện tại (Unix timestamp)
-        price_per_block: Giá mỗi block 10 phút
+        location: Vị trí đỗ (để lấy giá theo tầng)
+        tariff: Bảng giá (mặc định: TARIFF)
     
     Returns:
         (parked_blocks, total_cost)
     """
-    duration_seconds = current_time_seconds - entry_time_seconds
-    duration_minutes = duration_seconds / 60.0
-    # Tính số block (làm tròn lên)
-    parked_blocks = int((duration_minutes + 9) // 10)  # Tương đương math.ceil(duration_minutes / 10)
-    if parked_blocks < 1:
-        parked_blocks = 1  # Tối thiểu 1 block
-    total_cost = parked_blocks * price_per_block
-    return parked_blocks, total_cost
+    return calculate_fee(location, entry_time_seconds, current_time_seconds, tariff or TARIFF)
 
-def process_parking_events(spark):
-    """Xử lý streaming dữ liệu đỗ xe với stateful processing"""
-    
-    print("=" * 60)
-    print("🚀 KHỞI ĐỘNG SPARK STREAMING - TÍNH TIỀN ĐỖ XE")
-    print("=" * 60)
-    print(f"📥 Kafka Input: {KAFKA_BOOTSTRAP_SERVERS}/{INPUT_TOPIC}")
-    print(f"📤 Kafka Output: {KAFKA_BOOTSTRAP_SERVERS}/{OUTPUT_TOPIC}")
-    print(f"💰 Giá mỗi block 10 phút: {PRICE_PER_BLOCK:,.0f} VNĐ")
-    print(f"💾 Checkpoint: {CHECKPOINT_DIR}")
-    print("=" * 60)
+def make_tariff_udf(spark, tariff):
+    """
+    pandas_udf tính (parked_blocks, total_cost) cho cả lô Arrow bằng parking_tariff.compute_fees
+
+    Bảng giá được broadcast một lần cho các executor; trong UDF chỉ có phép toán NumPy
+    trên cả cột, không gọi Python theo từng dòng.
+    """
+    tariff_broadcast = spark.sparkContext.broadcast(tariff.to_dict())
     
-    # Đọc stream từ Kafka
-    df = spark \
-        .readStream \
-        .format("kafka") \
-        .option("kafka.bootstrap.servers", KAFKA_BOOTSTRAP_SERVERS) \
-        .option("subscribe", INPUT_TOPIC) \
-        .option("startingOffsets", "latest") \
-        .option("failOnDataLoss", "false") \
-        .load()
+    @pandas_udf("parked_blocks int, total_cost double")
+    def tariff_udf(location: pd.Series, entry_time_unix: pd.Series, current_time_unix: pd.Series) -> pd.DataFrame:
+        blocks, cost = compute_fees(
+            Tariff.from_dict(tariff_broadcast.value),
+            location.str.slice(0, 1).fillna("*").to_numpy(),
+            entry_time_unix.astype("float64").to_numpy(),
+            current_time_unix.astype("float64").to_numpy()
+        )
+        return pd.DataFrame({"parked_blocks": blocks.astype("int32"), "total_cost": cost})
     
-    # Parse JSON từ value
+    return tariff_udf
+
+def _sql_string_array(values):
+    return "array(" + ", ".join(f"'{v}'" for v in values) + ")"
+
+def _binary_uint(pos, length):
+    """Số nguyên không dấu big-endian dài `length` bytes tại vị trí `pos` (tính từ 1) của value"""
+    return f"cast(conv(hex(substring(value, {pos}, {length})), 16, 10) as bigint)"
+
+def _hex_field(sql, length):
+    """Biểu thức SQL -> chuỗi hex big-endian dài `length` bytes (giá trị phải không âm)"""
+    return f"lpad(hex(cast({sql} as bigint)), {2 * length}, '0')"
+
+def _content_type_expr():
+    """Cột content_type từ Kafka headers (mặc định JSON)"""
+    return expr(
+        f"coalesce(cast(filter(headers, h -> h.key = '{CONTENT_TYPE_HEADER}')[0].value as string), "
+        f"'{JSON_CONTENT_TYPE}')"
+    )
+
+def _lot_id_expr(key, lot_id=None):
+    """
+    Cột lot_id: trường lot_id của JSON, nếu không có thì Kafka key (event nhị phân);
+    key cũ theo location/tầng hoặc không có key thuộc DEFAULT_LOT_ID
+    """
+    from_key = when(~key.rlike(LEGACY_KEY_PATTERN.pattern), key)
+    if lot_id is None:
+        return coalesce(from_key, lit(DEFAULT_LOT_ID))
+    return coalesce(lot_id, from_key, lit(DEFAULT_LOT_ID))
+
+def parse_input_events(df):
+    """
+    Parse value của topic parking-events theo header content-type
+
+    JSON (không có header) và event nhị phân v1 (xem parking_wire_format.py)
+    được giải mã cùng lúc; phần nhị phân chỉ dùng biểu thức SQL, không gọi Python.
+    """
     schema = get_input_schema()
-    df_parsed = df.select(
+    content_type = _content_type_expr()
+    is_binary = col("content_type") == lit(EVENT_V1_CONTENT_TYPE)
+    
+    plate_code = expr(_binary_uint(6, 4))
+    binary_plate = expr(
+        f"format_string('%02d%s-%05d', cast({_binary_uint(6, 4)} div 2600000 as int), "
+        f"char(65 + cast(({_binary_uint(6, 4)} div 100000) % 26 as int)), "
+        f"cast({_binary_uint(6, 4)} % 100000 as int))"
+    )
+    binary_location = expr(f"concat(char(65 + {_binary_uint(3, 1)}), cast({_binary_uint(4, 2)} as string))")
+    binary_status = expr(f"element_at({_sql_string_array(EVENT_STATUS_CODES)}, cast({_binary_uint(2, 1)} as int) + 1)")
+    binary_ts = expr(_binary_uint(10, 8))
+    
+    df_typed = df.select(
         col("key").cast("string").alias("kafka_key"),
-        from_json(col("value").cast("string"), schema).alias("data"),
+        col("value"),
+        content_type.alias("content_type"),
         col("timestamp").alias("processing_time")
-    ).select(
+    ).withColumn(
+        "data",
+        when(~is_binary, from_json(col("value").cast("string"), schema))
+    )
+    
+    return df_typed.select(
         col("kafka_key"),
-        col("data.timestamp").alias("event_timestamp"),
-        col("data.timestamp_unix").alias("event_timestamp_unix"),
-        col("data.license_plate").alias("license_plate"),
-        col("data.location").alias("location"),
-        col("data.status_code").alias("status_code"),
+        _lot_id_expr(col("kafka_key"), col("data.lot_id")).alias("lot_id"),
+        when(is_binary, from_unixtime(binary_ts)).otherwise(col("data.timestamp")).alias("event_timestamp"),
+        when(is_binary, binary_ts).otherwise(col("data.timestamp_unix")).alias("event_timestamp_unix"),
+        when(is_binary, when(plate_code != lit(NULL_U32), binary_plate))
+            .otherwise(col("data.license_plate")).alias("license_plate"),
+        when(is_binary, binary_location).otherwise(col("data.location")).alias("location"),
+        when(is_binary, binary_status).otherwise(col("data.status_code")).alias("status_code"),
         col("processing_time")
     )
+
+def get_location_state_schema():
+    """Schema state của mỗi vị trí (xem parking_state.STATE_FIELDS)"""
+    return StructType([
+        StructField("license_plate", StringType()),
+        StructField("status_code", StringType()),
+        StructField("entry_time_unix", LongType()),
+        StructField("last_event_unix", LongType()),
+        # Giá trị đã gửi lên parking-status lần cuối (cho EMIT_MODE=change)
+        StructField("published_status", StringType()),
+        StructField("published_plate", StringType()),
+        StructField("published_blocks", IntegerType()),
+        # Thời điểm (processing time, ms) nhận event cuối, để xóa state của vị trí không hoạt động
+        StructField("last_seen_ms", LongType())
+    ])
+
+def get_state_output_schema():
+    """
+    Schema dòng do update_location_state phát ra
+
+    record_type = 'status': thay đổi trạng thái của vị trí (các cột bill_* để trống)
+    record_type = 'bill': lượt đỗ vừa kết thúc, tiền tính cho [entry_time_unix, exit_time_unix)
+    """
+    return StructType([
+        StructField("lot_id", StringType()),
+        StructField("location", StringType()),
+        StructField("license_plate", StringType()),
+        StructField("status_code", StringType()),
+        StructField("event_timestamp_unix", LongType()),
+        StructField("entry_time_unix", LongType()),
+        StructField("record_type", StringType()),
+        StructField("exit_time_unix", LongType()),
+        StructField("bill_blocks", IntegerType()),
+        StructField("bill_amount", DoubleType())
+    ])
+
+def _state_tuple(row):
+    """Chuyển state của GroupState (các giá trị pandas/numpy) về tuple Python"""
+    fields = get_location_state_schema().fields
+    return tuple(
+        None if pd.isna(v) else (v if isinstance(f.dataType, StringType) else int(v))
+        for f, v in zip(fields, row)
+    )
+
+def update_location_state(key, pdf_iter, state):
+    """
+    Hàm cho applyInPandasWithState, gọi một lần cho mỗi vị trí (lot_id, location) có event
+    trong micro-batch (hoặc khi hẹn giờ của vị trí đến hạn)
+
+    Các event được áp dụng theo thứ tự thời gian vào state (parking_state.apply_event).
+    EMIT_MODE=change: chỉ phát dòng khi (trạng thái, biển số, số block) khác lần gửi trước;
+    hẹn giờ được đặt đến lúc số block tăng, nên tiền vẫn được cập nhật khi không có event.
+    EMIT_MODE=state: phát dòng khi biển số / trạng thái / giờ vào thay đổi.
+    Mỗi lượt đỗ kết thúc (parking_state.completed_stay) phát thêm một dòng hóa đơn.
+    TTL: vị trí không có event trong STATE_TIMEOUT_MINUTES phút thì state bị xóa; với
+    BILLING_CLOCK=event thời gian được đo bằng watermark (event-time timeout), ngược lại
+    bằng processing time hoặc khi event cuối đã cũ hơn watermark quá TTL.
+    """
+    lot_id, location = key
+    now_ms = state.getCurrentProcessingTimeMs()
+    idle_timeout_ms = int(STATE_TIMEOUT_MINUTES * 60 * 1000)
+    
+    stored = _state_tuple(state.get) if state.exists else None
+    old_state = stored[:4] if stored else None
+    published = stored[4:7] if stored else (None, None, None)
+    last_seen_ms = stored[7] if stored else now_ms
     
-    # Xử lý stateful với mapGroupsWithState
-    # Tuy nhiên, Spark Structured Streaming không hỗ trợ mapGroupsWithState trực tiếp trong Python
-    # Sử dụng cách tiếp cận với window và aggregation
+    new_state = old_state
+    bills = []
+    if state.hasTimedOut:
+        idle_event_ms = state.getCurrentWatermarkMs() - old_state[3] * 1000
+        if (BILLING_CLOCK == 'event' or now_ms - last_seen_ms >= idle_timeout_ms
+                or idle_event_ms >= idle_timeout_ms):
+            state.remove()
+            return
+    else:
+        pdf = pd.concat(list(pdf_iter), ignore_index=True).sort_values("event_timestamp_unix", kind="stable")
+        for plate, status_code, ts in zip(pdf["license_plate"], pdf["status_code"], pdf["event_timestamp_unix"]):
+            previous = new_state
+            new_state = apply_event(new_state, None if pd.isna(plate) else plate, status_code, int(ts))
+            stay = completed_stay(previous, new_state) if BILLS_TOPIC else None
+            if stay:
+                bills.append(stay)
+        last_seen_ms = now_ms
     
-    # Tạo watermark để xử lý late data
-    df_with_watermark = df_parsed \
-        .withWatermark("processing_time", "10 minutes") \
+    plate, status_code, entry_time, last_event = new_state
+    now_unix = last_event if BILLING_CLOCK == 'event' else now_ms // 1000
+    current = (output_status(status_code), plate, billed_blocks(status_code, entry_time, now_unix, TARIFF))
+    if EMIT_MODE == 'change':
+        emit = current != published
+    else:
+        emit = visible_changed(old_state, new_state)
+    if emit:
+        published = current
+    
+    state.update(new_state + published + (last_seen_ms,))
+    if BILLING_CLOCK == 'event':
+        # Hết hạn khi watermark vượt quá event cuối + TTL
+        state.setTimeoutTimestamp(max(last_event * 1000 + idle_timeout_ms, state.getCurrentWatermarkMs() + 1))
+    else:
+        timeout_ms = last_seen_ms + idle_timeout_ms - now_ms
+        if EMIT_MODE == 'change':
+            next_block = seconds_until_next_block(status_code, entry_time, now_unix, TARIFF)
+            if next_block is not None:
+                timeout_ms = min(timeout_ms, next_block * 1000)
+        state.setTimeoutDuration(max(int(timeout_ms), 1))
+    
+    rows = [
+        (lot_id, location, bill_plate, 'EXITING', exit_time, entry, 'bill', exit_time)
+        + TARIFF.fee(location[0], entry, exit_time)
+        for bill_plate, entry, exit_time in bills
+    ]
+    if emit:
+        rows.append((lot_id, location, plate, status_code, last_event, entry_time, 'status', None, None, None))
+    if rows:
+        yield pd.DataFrame.from_records(rows, columns=get_state_output_schema().fieldNames()).astype({
+            "entry_time_unix": "Int64", "exit_time_unix": "Int64", "bill_blocks": "Int64"
+        })
+
+def with_event_time(df_parsed):
+    """
+    Cột cần cho state kèm event_time và watermark (EVENT_WATERMARK) trên thời gian event,
+    không phải thời điểm Kafka nhận
+    """
+    return df_parsed \
         .select(
+            col("lot_id"),
             col("location"),
             col("license_plate"),
             col("status_code"),
             col("event_timestamp_unix"),
-            col("processing_time")
+            timestamp_seconds(col("event_timestamp_unix")).alias("event_time")
+        ) \
+        .where(col("location").isNotNull() & col("event_timestamp_unix").isNotNull()) \
+        .withWatermark("event_time", EVENT_WATERMARK)
+
+def deduplicate_events(df_events):
+    """
+    Bỏ event trùng trước khi shuffle vào state theo vị trí
+
+    Khóa trùng là (bãi, vị trí, biển số, trạng thái, thời gian event): bản gửi lại của cùng
+    một event (retries của producer, camera gửi lại cùng một frame). Không gộp theo khoảng
+    thời gian: ENTERING -> EXITING -> ENTERING thật của cùng xe trong vài giây vẫn phải vào
+    state. Các frame liên tiếp cùng biển số / trạng thái nhưng khác thời gian vẫn đi tiếp và
+    được state hấp thụ (apply_event không đổi trạng thái hiển thị, EMIT_MODE không phát dòng).
+    State của bước lọc chỉ giữ khóa trong phạm vi watermark nên bộ nhớ có giới hạn. Số record
+    bị bỏ có trong progress của query (numDroppedDuplicateRows), được DedupCounter cộng dồn.
+    """
+    keys = ["lot_id", "location", "license_plate", "status_code", "event_timestamp_unix"]
+    if hasattr(df_events, "dropDuplicatesWithinWatermark"):
+        # Spark 3.5+: khóa không cần chứa cột watermark
+        return df_events.dropDuplicatesWithinWatermark(keys)
+    return df_events.dropDuplicates(keys + ["event_time"])
+
+def track_location_state(df_events):
+    """
+    Theo dõi trạng thái từng vị trí bằng applyInPandasWithState (Spark 3.4+)
+
+    State mỗi vị trí chỉ gồm biển số, trạng thái, giờ vào và thời điểm event cuối;
+    mỗi micro-batch phát tối đa một dòng cho mỗi vị trí có thay đổi.
+    Khóa state là (lot_id, location): các bãi dùng chung tên vị trí mà không lẫn nhau.
+    df_events là kết quả của with_event_time (đã có watermark).
+    """
+    return df_events \
+        .groupBy(col("lot_id"), col("location")) \
+        .applyInPandasWithState(
+            update_location_state,
+            outputStructType=get_state_output_schema(),
+            stateStructType=get_location_state_schema(),
+            outputMode="update",
+            timeoutConf=GroupStateTimeout.EventTimeTimeout if BILLING_CLOCK == 'event'
+            else GroupStateTimeout.ProcessingTimeTimeout
         )
+
+def get_summary_state_schema():
+    """State của bãi: LotSummary dạng JSON (kích thước thay đổi theo số xe đang đỗ) và đồng hồ"""
+    return StructType([
+        StructField("summary_json", StringType(), True),
+        StructField("clock_unix", LongType(), True)
+    ])
+
+def get_summary_output_schema():
+    """Dòng tổng hợp của một tầng (floor = '*' cho toàn bãi), xem parking_summary.py"""
+    return StructType([
+        StructField("lot_id", StringType(), True),
+        StructField("floor", StringType(), True),
+        StructField("capacity", IntegerType(), True),
+        StructField("occupied", IntegerType(), True),
+        StructField("free", IntegerType(), True),
+        StructField("occupancy_rate", DoubleType(), True),
+        StructField("accrued_cost", DoubleType(), True),
+        StructField("completed_stays", IntegerType(), True),
+        StructField("completed_revenue", DoubleType(), True),
+        StructField("revenue_today", DoubleType(), True),
+        StructField("avg_dwell_minutes", DoubleType(), True),
+        StructField("timestamp_unix", LongType(), True)
+    ])
+
+def update_lot_summary(key, pdf_iter, state):
+    """
+    Hàm cho applyInPandasWithState trên luồng parking-status, một nhóm cho mỗi bãi (lot_id)
+
+    Các dòng status được áp dụng theo thứ tự (partition, offset), tức đúng thứ tự của từng
+    vị trí. Hẹn giờ SUMMARY_INTERVAL_SECONDS nên bãi không có thay đổi vẫn phát tổng hợp
+    đều đặn. Với BILLING_CLOCK=event, ranh giới ngày theo thời gian event thay vì đồng hồ Spark.
+    Mọi bãi dùng chung LOT_LAYOUT.
+    """
+    (lot_id,) = key
+    if state.exists:
+        summary_json, clock_unix = state.get
+        summary = LotSummary.from_dict(json.loads(summary_json), LOT_LAYOUT, TARIFF)
+    else:
+        summary, clock_unix = LotSummary(LOT_LAYOUT, TARIFF), 0
     
-    # Group by location và lấy event mới nhất cho mỗi location
-    # Sử dụng window để nhóm theo location
-    df_grouped = df_with_watermark \
-        .groupBy(
-            col("location"),
-            window(col("processing_time"), "5 minutes", "1 minute").alias("time_window")
-        ) \
-        .agg(
-            spark_max("event_timestamp_unix").alias("latest_timestamp"),
-            spark_max(struct(
-                col("event_timestamp_unix"),
-                col("license_plate"),
-                col("status_code")
-            )).alias("latest_event")
-        ) \
+    rows = []
+    if not state.hasTimedOut:
+        pdf = pd.concat(list(pdf_iter), ignore_index=True).sort_values(["partition", "offset"], kind="stable")
+        for value, content_type in zip(pdf["value"], pdf["content_type"]):
+            rows.append(decode_status(bytes(value), [(CONTENT_TYPE_HEADER, content_type)]))
+    
+    if BILLING_CLOCK == 'event':
+        clock_unix = max([clock_unix] + [int(r.get("event_timestamp_unix") or 0) for r in rows])
+    else:
+        clock_unix = state.getCurrentProcessingTimeMs() // 1000
+    summary.roll_day(clock_unix)
+    for row in rows:
+        summary.apply_status(row)
+    
+    state.update((json.dumps(summary.to_dict(), separators=(',', ':')), clock_unix))
+    state.setTimeoutDuration(max(int(SUMMARY_INTERVAL_SECONDS * 1000), 1))
+    rows = [dict(row, lot_id=lot_id) for row in summary.rows(clock_unix)]
+    yield pd.DataFrame(rows, columns=get_summary_output_schema().fieldNames())
+
+def summarize_status(df_status):
+    """
+    Luồng parking-status (Kafka) -> dòng tổng hợp theo tầng và toàn bãi, cho từng bãi
+
+    Bãi lấy từ Kafka key (lot_id, xem encode_output); dòng cũ có key là location thuộc
+    DEFAULT_LOT_ID.
+    """
+    return df_status \
         .select(
-            col("location"),
-            col("latest_event.license_plate").alias("license_plate"),
-            col("latest_event.status_code").alias("status_code"),
-            col("latest_timestamp").alias("event_timestamp_unix")
+            col("value"),
+            _content_type_expr().alias("content_type"),
+            col("partition"),
+            col("offset"),
+            _lot_id_expr(col("key").cast("string")).alias("lot_id")
+        ) \
+        .groupBy(col("lot_id")) \
+        .applyInPandasWithState(
+            update_lot_summary,
+            outputStructType=get_summary_output_schema(),
+            stateStructType=get_summary_state_schema(),
+            outputMode="update",
+            timeoutConf=GroupStateTimeout.ProcessingTimeTimeout
+        )
+
+def parse_frames(df):
+    """
+    Trải occupancy frame thành từng dòng cho mỗi vị trí của tầng
+
+    Kết quả có cùng cột với parse_input_events: vị trí có xe mang status_code PARKED
+    và biển số tương ứng, vị trí trống mang EXITING (-> EMPTY ở output).
+    Bitmap được giải mã bằng hàm bậc cao của SQL (filter/zip_with), không gọi Python.
+    """
+    bit = "shiftright(cast(conv(hex(substring(bits, cast({i} div 8 + 1 as int), 1)), 16, 10) as int), {i} % 8) & 1"
+    slots = "sequence(0, data.slot_count - 1)"
+    occupied = f"filter({slots}, i -> {bit.format(i='i')} = 1)"
+    empty = f"filter({slots}, i -> {bit.format(i='i')} = 0)"
+    slot_rows = expr(
+        f"concat("
+        f"zip_with({occupied}, data.plates, (i, p) -> named_struct('slot', i, 'plate', p)), "
+        f"transform({empty}, i -> named_struct('slot', i, 'plate', cast(null as string)))"
+        f")"
+    )
+    
+    df_frames = df.select(
+        from_json(col("value").cast("string"), get_frame_schema()).alias("data"),
+        col("key").cast("string").alias("frame_key"),
+        col("timestamp").alias("processing_time")
+    ).where(
+        col("data.floor").isNotNull() & (col("data.slot_count") > 0)
+    ).withColumn("bits", expr("unbase64(data.bitmap)"))
+    
+    location = concat(col("data.floor"), (col("slot_row.slot") + 1).cast("string"))
+    return df_frames.select(
+        col("data"),
+        _lot_id_expr(col("frame_key"), col("data.lot_id")).alias("lot_id"),
+        col("processing_time"),
+        explode(slot_rows).alias("slot_row")
+    ).where(
+        # zip_with đệm null khi số biển số ít hơn số bit (frame lỗi)
+        col("slot_row.slot").isNotNull()
+    ).select(
+        location.alias("kafka_key"),
+        col("lot_id"),
+        col("data.timestamp").alias("event_timestamp"),
+        col("data.timestamp_unix").alias("event_timestamp_unix"),
+        col("slot_row.plate").alias("license_plate"),
+        location.alias("location"),
+        when(col("slot_row.plate").isNotNull(), lit("PARKED")).otherwise(lit("EXITING")).alias("status_code"),
+        col("processing_time")
+    )
+
+def encode_output(df_output):
+    """
+    Tạo cột key/value (và headers nếu OUTPUT_FORMAT=binary) cho Kafka sink
+
+    Dòng có location/biển số không theo mẫu của định dạng nhị phân (và hóa đơn) vẫn được
+    gửi JSON, header content-type cho consumer biết cách giải mã từng message.
+    Cột topic chọn topic đích của từng dòng (parking-status hoặc parking-bills).
+    Key là lot_id: mọi dòng của một bãi vào cùng partition, đúng thứ tự theo vị trí.
+    """
+    if OUTPUT_FORMAT != 'binary':
+        return df_output.select(
+            col("lot_id").alias("key"),
+            col("output_json").alias("value"),
+            col("topic")
         )
     
-    # Tính toán thời gian đỗ và tiền
-    current_time_expr = expr("unix_timestamp()").cast("long")
+    status_index = "CASE status " + " ".join(
+        f"WHEN '{name}' THEN {i}" for i, name in enumerate(OUTPUT_STATUS_CODES)
+    ) + " END"
+    plate_code = (
+        f"CASE WHEN license_plate IS NULL THEN {NULL_U32} ELSE "
+        "(cast(substring(license_plate, 1, 2) as bigint) * 26 + ascii(substring(license_plate, 3, 1)) - 65) "
+        "* 100000 + cast(substring(license_plate, 5, 5) as bigint) END"
+    )
+    fits = expr(
+        "record_type = 'status' AND location rlike '^[A-Z][0-9]{1,5}$' AND cast(substring(location, 2) as int) <= 65535 "
+        "AND (license_plate IS NULL OR license_plate rlike '^[0-9]{2}[A-Z]-[0-9]{5}$') "
+        f"AND status IN ({', '.join(repr(s) for s in OUTPUT_STATUS_CODES)})"
+    )
+    binary_value = unhex(concat(
+        lit("01"),
+        expr(_hex_field(status_index, 1)),
+        expr(_hex_field("ascii(location) - 65", 1)),
+        expr(_hex_field("substring(location, 2)", 2)),
+        expr(_hex_field(plate_code, 4)),
+        expr(_hex_field(f"coalesce(round(parked_duration_minutes * 60), {NULL_U32})", 4)),
+        expr(_hex_field("coalesce(parked_blocks, 0)", 2)),
+        expr(_hex_field("greatest(round(coalesce(total_cost, 0)), 0)", 8)),
+        expr(_hex_field("coalesce(event_timestamp_unix, 0)", 8)),
+        expr(_hex_field("unix_millis(last_update)", 8))
+    ))
+    content_type = when(fits, lit(STATUS_V1_CONTENT_TYPE)).otherwise(lit(JSON_CONTENT_TYPE))
     
-    df_calculated = df_grouped \
+    return df_output.select(
+        col("lot_id").alias("key"),
+        when(fits, binary_value).otherwise(encode(col("output_json"), "UTF-8")).alias("value"),
+        array(struct(
+            lit(CONTENT_TYPE_HEADER).alias("key"),
+            encode(content_type, "UTF-8").alias("value")
+        )).alias("headers"),
+        col("topic")
+    )
+
+def calculate_billing(df_state, tariff_udf):
+    """Thêm cột thời gian đỗ, số block, tiền (qua tariff_udf) và trạng thái hiển thị"""
+    if BILLING_CLOCK == 'event':
+        # Thời điểm "hiện tại" là event mới nhất của vị trí,
+        # nên kết quả không phụ thuộc tốc độ phát lại
+        current_time_expr = col("event_timestamp_unix")
+    else:
+        current_time_expr = expr("unix_timestamp()").cast("long")
+    
+    billed = col("status_code").isin(["PARKED", "MOVING"])
+    return df_state \
         .withColumn("current_timestamp_unix", current_time_expr) \
-        .withColumn(
-            "entry_time_unix",
-            when(col("status_code").isin(["ENTERING", "PARKED"]), col("event_timestamp_unix"))
-            .otherwise(None)
-        ) \
         .withColumn(
             "parked_duration_seconds",
-            when(col("status_code").isin(["PARKED", "MOVING"]), 
-                 col("current_timestamp_unix") - col("entry_time_unix"))
+            when(billed, spark_greatest(col("current_timestamp_unix") - col("entry_time_unix"), lit(0)))
             .otherwise(None)
         ) \
         .withColumn(
@@ -168,33 +671,146 @@ def process_parking_events(spark):
             .otherwise(None)
         ) \
         .withColumn(
-            "parked_blocks",
-            when(col("parked_duration_minutes").isNotNull(),
-                 expr(f"cast(ceiling((parked_duration_minutes + 9) / 10) as int)"))
-            .otherwise(None)
-        ) \
-        .withColumn(
-            "parked_blocks",
-            when(col("parked_blocks").isNull(), lit(1))
-            .when(col("parked_blocks") < 1, lit(1))
-            .otherwise(col("parked_blocks"))
-        ) \
-        .withColumn(
-            "total_cost",
-            when(col("parked_blocks").isNotNull(),
-                 col("parked_blocks") * lit(PRICE_PER_BLOCK))
-            .otherwise(lit(0.0))
+            "fee",
+            tariff_udf(
+                col("location"),
+                when(billed, col("entry_time_unix")),
+                col("current_timestamp_unix")
+            )
         ) \
+        .withColumn("parked_blocks", col("fee.parked_blocks")) \
+        .withColumn("total_cost", col("fee.total_cost")) \
         .withColumn(
             "status",
             when(col("status_code") == "EXITING", lit("EMPTY"))
             .when(col("status_code").isin(["ENTERING", "PARKED", "MOVING"]), lit("OCCUPIED"))
             .otherwise(lit("UNKNOWN"))
         )
+
+STATUS_QUERY_NAME = "parking-status"
+ARCHIVE_QUERY_NAME = "parking-archive"
+SUMMARY_QUERY_NAME = "parking-summary"
+
+class AdaptiveRateController(StreamingQueryListener):
+    """
+    Điều chỉnh maxOffsetsPerTrigger để thời gian mỗi batch không vượt latency mục tiêu
+
+    Chỉ theo dõi query status (query archive giữ giới hạn ban đầu). Kafka source chỉ đọc
+    maxOffsetsPerTrigger khi query khởi động, nên listener chỉ đề xuất giới hạn mới
+    (requested); vòng lặp chính dừng query status và chạy lại từ checkpoint với giới hạn đó.
+    Để tránh khởi động lại liên tục, chỉ đổi khi lệch quá `tolerance` và cách lần đổi trước
+    ít nhất `cooldown_seconds`.
+    - Batch chậm hơn mục tiêu: giảm về throughput x mục tiêu x headroom
+    - Batch đầy giới hạn (đang đuổi backlog) và nhanh hơn nửa mục tiêu: tăng tối đa gấp đôi
+    """
+
+    def __init__(self, initial_limit, target_seconds, min_limit=1000, max_limit=50000000,
+                 headroom=0.8, tolerance=0.25, cooldown_seconds=60):
+        self.limit = int(initial_limit)
+        self.target_seconds = target_seconds
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.headroom = headroom
+        self.tolerance = tolerance
+        self.cooldown_seconds = cooldown_seconds
+        self.requested = None
+        self._last_change = time.time()
+        self._lock = threading.Lock()
+
+    def propose(self, rows, seconds):
+        """Giới hạn mới sau một batch `rows` dòng chạy trong `seconds` giây, None nếu giữ nguyên"""
+        if rows <= 0 or seconds <= 0:
+            return None
+        throughput = rows / seconds
+        if seconds > self.target_seconds:
+            desired = throughput * self.target_seconds * self.headroom
+        elif rows >= 0.9 * self.limit and seconds < 0.5 * self.target_seconds:
+            desired = min(self.limit * 2, throughput * self.target_seconds * self.headroom)
+        else:
+            return None
+        desired = int(min(max(desired, self.min_limit), self.max_limit))
+        if abs(desired - self.limit) <= self.tolerance * self.limit:
+            return None
+        return desired
+
+    def onQueryStarted(self, event):
+        pass
+
+    def onQueryProgress(self, event):
+        progress = event.progress
+        if progress.name != STATUS_QUERY_NAME:
+            return
+        desired = self.propose(progress.numInputRows, progress.batchDuration / 1000.0)
+        if desired is None:
+            return
+        with self._lock:
+            if self.requested is None and time.time() - self._last_change >= self.cooldown_seconds:
+                self.requested = desired
+
+    def onQueryTerminated(self, event):
+        pass
+
+    def take_request(self):
+        """Lấy giới hạn đang được đề xuất (None nếu không có) và ghi nhận đã áp dụng"""
+        with self._lock:
+            desired, self.requested = self.requested, None
+            if desired is not None:
+                self.limit = desired
+                self._last_change = time.time()
+            return desired
+
+def read_parking_events(spark, max_offsets_per_trigger=None):
+    """Đọc stream từ Kafka và parse thành các dòng event theo vị trí"""
+    reader = spark \
+        .readStream \
+        .format("kafka") \
+        .option("kafka.bootstrap.servers", KAFKA_BOOTSTRAP_SERVERS) \
+        .option("subscribe", f"{INPUT_TOPIC},{FRAMES_TOPIC}" if FRAMES_TOPIC else INPUT_TOPIC) \
+        .option("startingOffsets", "latest") \
+        .option("failOnDataLoss", "false") \
+        .option("includeHeaders", "true")
+    if max_offsets_per_trigger:
+        reader = reader.option("maxOffsetsPerTrigger", str(max_offsets_per_trigger))
+    if MIN_OFFSETS_PER_TRIGGER:
+        reader = reader \
+            .option("minOffsetsPerTrigger", MIN_OFFSETS_PER_TRIGGER) \
+            .option("maxTriggerDelay", MAX_TRIGGER_DELAY)
+    df = reader.load()
     
-    # Tạo output JSON
+    # Parse JSON hoặc nhị phân từ value (theo header content-type)
+    if FRAMES_TOPIC:
+        # Event từng xe và frame từng tầng cùng đi vào một luồng dòng theo vị trí
+        df_parsed = parse_input_events(df.where(col("topic") == INPUT_TOPIC)).unionByName(
+            parse_frames(df.where(col("topic") == FRAMES_TOPIC))
+        )
+    else:
+        df_parsed = parse_input_events(df)
+    return df_parsed
+
+def build_status_output(df_calculated):
+    """
+    Dòng tính tiền -> key/value (và headers) cho topic parking-status, dòng hóa đơn ->
+    JSON cho topic parking-bills (cùng một projection, để state chỉ được tính một lần)
+    """
+    is_bill = col("record_type") == "bill"
+    bill_json = to_json(struct(
+        expr("concat_ws('-', lot_id, location, cast(entry_time_unix as string), license_plate)").alias("bill_id"),
+        col("lot_id"),
+        col("license_plate"),
+        col("location"),
+        expr("substring(location, 1, 1)").alias("floor"),
+        col("entry_time_unix"),
+        col("exit_time_unix"),
+        from_unixtime(col("entry_time_unix")).alias("entry_time"),
+        from_unixtime(col("exit_time_unix")).alias("exit_time"),
+        ((col("exit_time_unix") - col("entry_time_unix")) / 60.0).alias("duration_minutes"),
+        col("bill_blocks").alias("blocks"),
+        col("bill_amount").alias("amount"),
+        current_timestamp().alias("issued_at")
+    ))
     df_output = df_calculated \
         .select(
+            col("lot_id"),
             col("location"),
             col("status"),
             col("license_plate"),
@@ -202,11 +818,15 @@ def process_parking_events(spark):
             col("parked_blocks"),
             col("total_cost"),
             col("event_timestamp_unix"),
-            current_timestamp().alias("last_update")
+            current_timestamp().alias("last_update"),
+            col("record_type"),
+            when(is_bill, bill_json).alias("bill_json"),
+            when(is_bill, lit(BILLS_TOPIC)).otherwise(lit(OUTPUT_TOPIC)).alias("topic")
         ) \
         .withColumn(
             "output_json",
-            to_json(struct(
+            when(col("bill_json").isNotNull(), col("bill_json")).otherwise(to_json(struct(
+                col("lot_id"),
                 col("location"),
                 col("status"),
                 col("license_plate"),
@@ -215,29 +835,326 @@ def process_parking_events(spark):
                 col("total_cost"),
                 col("event_timestamp_unix"),
                 col("last_update")
-            ))
+            )))
         )
+    return encode_output(df_output)
+
+def kafka_sink_options():
+    """
+    Option của Kafka sink (dùng cho cả writeStream lẫn ghi batch trong foreachBatch);
+    topic lấy từ cột topic của từng dòng
+    """
+    return {
+        "kafka.bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS,
+        "kafka.linger.ms": SINK_LINGER_MS,
+        "kafka.batch.size": SINK_BATCH_SIZE,
+        "kafka.compression.type": SINK_COMPRESSION
+    }
+
+def _interval_seconds(text):
+    """Khoảng thời gian kiểu Spark ("10 minutes", "1 hour 30 minutes") -> số giây"""
+    units = {"second": 1, "minute": 60, "hour": 3600, "day": 86400, "week": 604800}
+    parts = text.lower().replace("interval", "").split()
+    try:
+        return sum(float(amount) * units[unit.rstrip("s")] for amount, unit in zip(parts[::2], parts[1::2]))
+    except (KeyError, ValueError):
+        raise ValueError(f"Không hiểu khoảng thời gian '{text}'")
+
+# Thời điểm lớn nhất đã ghi vào từng bảng archive (theo cột chia partition date của bảng)
+_archive_clock = {}
+
+class ArchiveCompactor:
+    """
+    Gộp file archive trong một thread nền, để foreachBatch (nhất là của query status, cần
+    latency thấp) không phải chờ ghi lại cả partition
+
+    Mỗi lúc tối đa một thread; bảng được yêu cầu trong lúc thread đang chạy được gộp nốt
+    trong cùng thread. Thread là daemon: bị dừng giữa chừng khi tắt ứng dụng thì lần gộp
+    sau làm nốt (compact_table an toàn khi bị dừng).
+    """
+
+    def __init__(self):
+        self.pending = {}   # {path: before_date}
+        self.thread = None
+        self._lock = threading.Lock()
+
+    def request(self, spark, path, before_date):
+        with self._lock:
+            self.pending[path] = before_date
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, args=(spark,),
+                                               name="archive-compaction", daemon=True)
+                self.thread.start()
+
+    def _run(self, spark):
+        while True:
+            with self._lock:
+                if not self.pending:
+                    self.thread = None
+                    return
+                path, before_date = self.pending.popitem()
+            try:
+                compacted = compact_table(spark, path, before_date, ARCHIVE_COMPACT_MIN_FILES)
+                if compacted:
+                    print(f"🗜️  Đã gộp {compacted} partition của {path}")
+            except Exception as e:
+                print(f"⚠️  Lỗi khi gộp file {path}: {e}")
+
+_compactor = ArchiveCompactor()
+
+def _maybe_compact(batch_df, path, unix_col, batch_id):
+    """
+    Yêu cầu gộp file của các ngày đã đóng sau mỗi ARCHIVE_COMPACT_EVERY batch (chạy nền,
+    xem ArchiveCompactor)
+
+    Ngày hiện tại lấy theo đồng hồ của chính bảng (cột unix_col dùng để chia partition date:
+    thời gian event, hoặc đồng hồ tính tiền), không theo đồng hồ máy: với đồng hồ ảo hoặc
+    BILLING_CLOCK=event, ngày của dữ liệu khác ngày thực. Một ngày chỉ được coi là đã đóng
+    khi thời điểm lớn nhất đã ghi trừ EVENT_WATERMARK đã sang ngày sau (event trễ trong
+    watermark vẫn ghi vào ngày trước).
+    """
+    if not ARCHIVE_COMPACT_EVERY or batch_id == 0 or batch_id % ARCHIVE_COMPACT_EVERY:
+        return
+    latest = batch_df.agg(spark_max(unix_col)).first()[0]
+    if latest is not None:
+        _archive_clock[path] = max(latest, _archive_clock.get(path, latest))
+    if path not in _archive_clock:
+        # Chưa biết đồng hồ của bảng (vừa khởi động, batch rỗng): để lần sau
+        return
+    closed_until = _archive_clock[path] - _interval_seconds(EVENT_WATERMARK) + TARIFF.utc_offset_hours * 3600
+    today = time.strftime("%Y-%m-%d", time.gmtime(closed_until))
+    _compactor.request(batch_df.sparkSession, path, today)
+
+def write_status_batch(batch_df, batch_id):
+    """
+    foreachBatch của query chính khi bật ARCHIVE_DIR: gửi dòng tính tiền / hóa đơn lên Kafka
+    và lưu vào bảng billing (theo ngày tính tiền, tầng) và bills (theo ngày ra, tầng)
+    """
+    batch_df.persist()
+    try:
+        build_status_output(batch_df).write.format("kafka").options(**kafka_sink_options()).save()
+        df_status = batch_df.where(col("record_type") == "status")
+        df_bills = batch_df.where(col("record_type") == "bill")
+        append_partitioned(
+            with_partition_columns(df_bills, "exit_time_unix", TARIFF.utc_offset_hours).select(
+                "lot_id", "location", "license_plate", "entry_time_unix", "exit_time_unix",
+                "bill_blocks", "bill_amount", "date", "floor"
+            ),
+            table_path(ARCHIVE_DIR, BILLS_TABLE)
+        )
+        path = table_path(ARCHIVE_DIR, BILLING_TABLE)
+        append_partitioned(
+            with_partition_columns(df_status, "current_timestamp_unix", TARIFF.utc_offset_hours).select(
+                "lot_id", "location", "license_plate", "status_code", "status", "entry_time_unix",
+                "event_timestamp_unix", "current_timestamp_unix", "parked_duration_seconds",
+                "parked_blocks", "total_cost", "date", "floor"
+            ),
+            path
+        )
+        _maybe_compact(df_status, path, "current_timestamp_unix", batch_id)
+        _maybe_compact(df_bills, table_path(ARCHIVE_DIR, BILLS_TABLE), "exit_time_unix", batch_id)
+    finally:
+        batch_df.unpersist()
+
+def write_events_batch(batch_df, batch_id):
+    """foreachBatch của query archive: lưu event đã parse vào bảng events (theo ngày event, tầng)"""
+    path = table_path(ARCHIVE_DIR, EVENTS_TABLE)
+    append_partitioned(
+        with_partition_columns(batch_df, "event_timestamp_unix", TARIFF.utc_offset_hours).select(
+            "lot_id", "location", "license_plate", "status_code", "event_timestamp", "event_timestamp_unix",
+            "processing_time", "date", "floor"
+        ),
+        path
+    )
+    _maybe_compact(batch_df, path, "event_timestamp_unix", batch_id)
+
+def start_archive_query(spark, max_offsets_per_trigger=None):
+    """Query thứ hai (checkpoint riêng): lưu event đã parse dạng Parquet, không qua state"""
+    df_parsed = read_parking_events(spark, max_offsets_per_trigger) \
+        .where(col("location").isNotNull() & col("event_timestamp_unix").isNotNull())
+    writer = df_parsed.writeStream \
+        .queryName(ARCHIVE_QUERY_NAME) \
+        .foreachBatch(write_events_batch) \
+        .option("checkpointLocation", ARCHIVE_CHECKPOINT_DIR)
+    if TRIGGER_INTERVAL:
+        writer = writer.trigger(processingTime=TRIGGER_INTERVAL)
+    return writer.start()
+
+class DedupCounter(StreamingQueryListener):
+    """Cộng dồn số record vào / số bản trùng bị bỏ của query parking-status"""
+
+    def __init__(self):
+        self.input_rows = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def onQueryStarted(self, event):
+        pass
+
+    def onQueryProgress(self, event):
+        progress = event.progress
+        if progress.name != STATUS_QUERY_NAME:
+            return
+        dropped = sum(op.customMetrics.get("numDroppedDuplicateRows", 0) for op in progress.stateOperators)
+        with self._lock:
+            self.input_rows += progress.numInputRows
+            self.dropped += dropped
+
+    def onQueryTerminated(self, event):
+        pass
+
+    def summary(self):
+        with self._lock:
+            ratio = self.dropped / self.input_rows * 100 if self.input_rows else 0.0
+            return f"đã bỏ {self.dropped:,} bản trùng / {self.input_rows:,} records ({ratio:.1f}%)"
+
+def start_summary_query(spark):
+    """
+    Query tổng hợp: đọc lại topic parking-status (như mọi consumer khác) và gửi tổng hợp
+    theo tầng / toàn bãi lên SUMMARY_TOPIC mỗi SUMMARY_INTERVAL_SECONDS giây
+
+    Lần chạy đầu đọc topic từ đầu để dựng lại các vị trí đang có xe.
+    """
+    df_status = spark \
+        .readStream \
+        .format("kafka") \
+        .option("kafka.bootstrap.servers", KAFKA_BOOTSTRAP_SERVERS) \
+        .option("subscribe", OUTPUT_TOPIC) \
+        .option("startingOffsets", "earliest") \
+        .option("failOnDataLoss", "false") \
+        .option("includeHeaders", "true") \
+        .load()
+    
+    df_summary = summarize_status(df_status)
     
-    # Ghi kết quả lên Kafka
-    query = df_output \
+    return df_summary \
         .select(
-            col("location").alias("key"),
-            col("output_json").alias("value")
+            col("lot_id").alias("key"),
+            to_json(struct(*[col(name) for name in get_summary_output_schema().fieldNames()])).alias("value")
         ) \
         .writeStream \
+        .queryName(SUMMARY_QUERY_NAME) \
         .format("kafka") \
         .option("kafka.bootstrap.servers", KAFKA_BOOTSTRAP_SERVERS) \
-        .option("topic", OUTPUT_TOPIC) \
-        .option("checkpointLocation", CHECKPOINT_DIR) \
+        .option("topic", SUMMARY_TOPIC) \
+        .option("checkpointLocation", SUMMARY_CHECKPOINT_DIR) \
         .outputMode("update") \
+        .trigger(processingTime=f"{SUMMARY_INTERVAL_SECONDS:g} seconds") \
         .start()
+
+def start_status_query(spark, max_offsets_per_trigger=None):
+    """Dựng toàn bộ pipeline Kafka -> state -> tính tiền -> Kafka và khởi động query"""
+    df_events = with_event_time(read_parking_events(spark, max_offsets_per_trigger))
+    
+    # Bỏ event trùng (producer gửi lại, camera lặp lại cùng một lần nhận diện)
+    if DEDUP_MODE != 'off':
+        df_events = deduplicate_events(df_events)
+    
+    # Xử lý stateful theo từng vị trí: chỉ có dòng khi trạng thái vị trí thay đổi
+    df_state = track_location_state(df_events)
+    
+    # Tính toán thời gian đỗ và tiền theo bảng giá
+    df_calculated = calculate_billing(df_state, make_tariff_udf(spark, TARIFF))
+    
+    if ARCHIVE_DIR:
+        # Gửi Kafka và lưu Parquet trong cùng một batch, state chỉ tính một lần
+        writer = df_calculated.writeStream \
+            .foreachBatch(write_status_batch)
+    else:
+        # Ghi kết quả lên Kafka
+        writer = build_status_output(df_calculated) \
+            .writeStream \
+            .format("kafka") \
+            .options(**kafka_sink_options())
+    writer = writer \
+        .queryName(STATUS_QUERY_NAME) \
+        .option("checkpointLocation", CHECKPOINT_DIR) \
+        .outputMode("update")
+    if TRIGGER_INTERVAL:
+        writer = writer.trigger(processingTime=TRIGGER_INTERVAL)
+    return writer.start()
+
+def process_parking_events(spark):
+    """Xử lý streaming dữ liệu đỗ xe với stateful processing"""
+    
+    print("=" * 60)
+    print("🚀 KHỞI ĐỘNG SPARK STREAMING - TÍNH TIỀN ĐỖ XE")
+    print("=" * 60)
+    print(f"📥 Kafka Input: {KAFKA_BOOTSTRAP_SERVERS}/{INPUT_TOPIC}")
+    if FRAMES_TOPIC:
+        print(f"📷 Kafka Frames: {KAFKA_BOOTSTRAP_SERVERS}/{FRAMES_TOPIC}")
+    print(f"📤 Kafka Output: {KAFKA_BOOTSTRAP_SERVERS}/{OUTPUT_TOPIC}")
+    if BILLS_TOPIC:
+        print(f"🧾 Hóa đơn: {KAFKA_BOOTSTRAP_SERVERS}/{BILLS_TOPIC}")
+    print(f"💰 Bảng giá: {TARIFF_FILE or 'mặc định'} | block {TARIFF.block_minutes} phút, "
+          f"miễn phí {TARIFF.grace_minutes} phút, "
+          + ", ".join(f"{floor}: {r['day_price']:,.0f}/{r['night_price']:,.0f} VNĐ"
+                      for floor, r in TARIFF.rates.items()))
+    print(f"📦 Định dạng output: {OUTPUT_FORMAT}")
+    print(f"🕒 Đồng hồ tính tiền: {BILLING_CLOCK}")
+    print(f"🔔 Chế độ gửi: {EMIT_MODE} | sink: linger={SINK_LINGER_MS}ms, batch={SINK_BATCH_SIZE}B, "
+          f"nén={SINK_COMPRESSION}")
+    print(f"💾 Checkpoint: {CHECKPOINT_DIR} | state store: {STATE_STORE} | "
+          f"watermark: {EVENT_WATERMARK} | TTL: {STATE_TIMEOUT_MINUTES:g} phút")
+    print(f"🎚️  Ingest: maxOffsetsPerTrigger={MAX_OFFSETS_PER_TRIGGER or 'không giới hạn'}, "
+          f"minOffsetsPerTrigger={MIN_OFFSETS_PER_TRIGGER or 'không'}, trigger={TRIGGER_INTERVAL or 'liên tục'}, "
+          f"latency mục tiêu={LATENCY_TARGET_SECONDS or 'tắt'}, "
+          f"shuffle partitions={spark.conf.get('spark.sql.shuffle.partitions')}")
+    print(f"🧹 Lọc trùng: {DEDUP_MODE}")
+    if SUMMARY_TOPIC:
+        print(f"📈 Tổng hợp: {KAFKA_BOOTSTRAP_SERVERS}/{SUMMARY_TOPIC} mỗi {SUMMARY_INTERVAL_SECONDS:g} giây, "
+              f"sức chứa {sum(LOT_LAYOUT.values())} vị trí")
+    if ARCHIVE_DIR:
+        print(f"🗄️  Archive Parquet: {ARCHIVE_DIR} (checkpoint: {ARCHIVE_CHECKPOINT_DIR}, "
+              f"gộp file mỗi {ARCHIVE_COMPACT_EVERY} batch, ngày đã đóng sau "
+              f"{_interval_seconds(EVENT_WATERMARK) / 60:g} phút của ngày sau)")
+    print("=" * 60)
+    
+    limit = int(MAX_OFFSETS_PER_TRIGGER) if MAX_OFFSETS_PER_TRIGGER else None
+    query = start_status_query(spark, limit)
+    # Query archive giữ nguyên MAX_OFFSETS_PER_TRIGGER ban đầu (không có state, batch nhanh);
+    # bộ điều chỉnh latency chỉ áp dụng cho query status
+    others = []
+    if ARCHIVE_DIR:
+        others.append(start_archive_query(spark, limit))
+    if SUMMARY_TOPIC:
+        others.append(start_summary_query(spark))
+    
+    controller = None
+    if LATENCY_TARGET_SECONDS and limit:
+        controller = AdaptiveRateController(limit, float(LATENCY_TARGET_SECONDS))
+        spark.streams.addListener(controller)
+    dedup_counter = None
+    if DEDUP_MODE != 'off':
+        dedup_counter = DedupCounter()
+        spark.streams.addListener(dedup_counter)
     
     print("\n✅ Spark Streaming đang chạy...")
     print("📊 Xem Spark UI tại: http://localhost:4040")
     print("⚠️  Nhấn Ctrl+C để dừng\n")
     
-    # Đợi query
-    query.awaitTermination()
+    # Đợi query status (raise nếu query lỗi); khởi động lại khi bộ điều chỉnh đề xuất giới hạn
+    # mới. Query archive / tổng hợp dừng thì dừng cả ứng dụng, không để chúng chết âm thầm
+    last_report = time.time()
+    while not query.awaitTermination(5):
+        stopped = [q for q in others if not q.isActive]
+        if stopped:
+            for q in stopped:
+                error = q.exception()
+                print(f"❌ Query {q.name} đã dừng" + (f": {error}" if error else ""))
+            query.stop()
+            for q in others:
+                q.stop()
+            raise RuntimeError(f"Query {', '.join(q.name for q in stopped)} đã dừng, dừng Spark Streaming")
+        if dedup_counter and time.time() - last_report >= 60:
+            print(f"🧹 Lọc trùng: {dedup_counter.summary()}")
+            last_report = time.time()
+        new_limit = controller.take_request() if controller else None
+        if new_limit is not None:
+            print(f"🎚️  maxOffsetsPerTrigger: {limit} -> {new_limit}, khởi động lại query từ checkpoint")
+            limit = new_limit
+            query.stop()
+            query = start_status_query(spark, limit)
 
 def main():
     """Hàm main"""
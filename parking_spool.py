@@ -0,0 +1,238 @@
+"""
+Event Spool - Write-ahead spool trên đĩa cho producer khi mất kết nối Kafka
+
+Event gửi thất bại (hoặc phát sinh khi broker không truy cập được) được ghi vào
+các file segment trên đĩa theo thứ tự, rồi được gửi lại theo lô, đúng thứ tự,
+khi broker hoạt động trở lại.
+
+Định dạng thư mục spool:
+- segment-<id>.log : các record length (uint32) | crc32 (uint32) | JSON compact của event
+- position         : vị trí đã gửi xong {"segment": id, "offset": bytes}, ghi nguyên tử
+
+Record bị ghi dở ở cuối segment (producer bị kill) được phát hiện nhờ length/crc và bỏ qua.
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+RECORD_HEADER = struct.Struct("<II")
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class EventSpool:
+    """
+    Spool append-only chia segment, an toàn khi gọi từ nhiều thread
+    (callback lỗi của kafka-python chạy trên thread I/O của producer)
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, max_bytes=1024 * 1024 * 1024,
+                 fsync_policy='interval', fsync_interval=1.0):
+        """
+        Args:
+            directory (str): Thư mục chứa segment
+            segment_bytes (int): Kích thước tối đa mỗi segment trước khi mở segment mới
+            max_bytes (int): Ngưỡng dung lượng chưa gửi; vượt ngưỡng thì over_capacity() = True
+            fsync_policy (str): 'always' (fsync mỗi record), 'interval' (mỗi fsync_interval giây), 'never'
+            fsync_interval (float): Chu kỳ fsync cho policy 'interval' (giây)
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy phải là một trong {FSYNC_POLICIES}")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self._lock = threading.RLock()
+        self._last_fsync = time.time()
+        self.appended = 0
+        self.drained = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments = []
+        # Kích thước từng segment giữ trong bộ nhớ: has_pending() được gọi với mỗi event
+        # nên không được flush / stat file
+        self._sizes = {}
+        for name in sorted(os.listdir(directory)):
+            if not (name.startswith("segment-") and name.endswith(".log")):
+                continue
+            path = os.path.join(directory, name)
+            if os.path.getsize(path) == 0:
+                # Segment rỗng của lần chạy trước
+                os.remove(path)
+                continue
+            segment_id = int(name[len("segment-"):-len(".log")])
+            self._segments.append(segment_id)
+            self._sizes[segment_id] = os.path.getsize(path)
+        self._position = self._load_position()
+        # Luôn ghi vào segment mới, để record ghi dở của lần chạy trước nằm yên ở segment cũ
+        last_id = max(self._segments + [self._position[0] if self._position else 0])
+        self._open_segment(last_id + 1)
+        if self._position is None:
+            self._position = (self._segments[0], 0)
+        self._pending_bytes = self._count_pending()
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.directory, f"segment-{segment_id:09d}.log")
+
+    def _load_position(self):
+        try:
+            with open(os.path.join(self.directory, "position")) as f:
+                data = json.load(f)
+            return data["segment"], data["offset"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_position(self):
+        path = os.path.join(self.directory, "position")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"segment": self._position[0], "offset": self._position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _open_segment(self, segment_id):
+        self._active_id = segment_id
+        self._active = open(self._segment_path(segment_id), "ab")
+        if segment_id not in self._segments:
+            self._segments.append(segment_id)
+        self._sizes.setdefault(segment_id, self._active.tell())
+
+    def _sync(self, force=False):
+        self._active.flush()
+        now = time.time()
+        if self.fsync_policy == 'always' or force or (
+                self.fsync_policy == 'interval' and now - self._last_fsync >= self.fsync_interval):
+            if self.fsync_policy != 'never':
+                os.fsync(self._active.fileno())
+            self._last_fsync = now
+
+    def append(self, event_data):
+        """Ghi một event (dict) vào cuối spool"""
+        payload = json.dumps(event_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            if self._active.tell() >= self.segment_bytes:
+                self._sync(force=True)
+                self._active.close()
+                self._open_segment(self._active_id + 1)
+            self._active.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+            self._active.write(payload)
+            size = RECORD_HEADER.size + len(payload)
+            self._sizes[self._active_id] += size
+            self._pending_bytes += size
+            self.appended += 1
+            self._sync()
+
+    def _count_pending(self):
+        segment_id, offset = self._position
+        pending = sum(size for s, size in self._sizes.items() if s >= segment_id)
+        return pending - (offset if segment_id in self._sizes else 0)
+
+    def pending_bytes(self):
+        """Số bytes chưa gửi (tính cả header record), đếm trong bộ nhớ nên không có I/O"""
+        return self._pending_bytes
+
+    def has_pending(self):
+        return self._pending_bytes > 0
+
+    def over_capacity(self):
+        return self._pending_bytes >= self.max_bytes
+
+    def _read_segment(self, segment_id, offset, max_records, records, chunk_size=1024 * 1024):
+        """Đọc record từ segment bắt đầu tại offset, trả về offset sau record hợp lệ cuối cùng"""
+        path = self._segment_path(segment_id)
+        if not os.path.exists(path):
+            return offset
+        with open(path, "rb") as f:
+            f.seek(offset)
+            buf = b""
+            pos = 0
+            eof = False
+            while len(records) < max_records:
+                if pos + RECORD_HEADER.size <= len(buf):
+                    length, crc = RECORD_HEADER.unpack_from(buf, pos)
+                    end = pos + RECORD_HEADER.size + length
+                    if end <= len(buf):
+                        payload = buf[pos + RECORD_HEADER.size:end]
+                        if zlib.crc32(payload) != crc:
+                            break
+                        records.append(json.loads(payload.decode('utf-8')))
+                        pos = end
+                        continue
+                if eof:
+                    break
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    eof = True
+                buf = buf[pos:] + chunk
+                offset += pos
+                pos = 0
+            return offset + pos
+
+    def read_batch(self, max_records):
+        """
+        Đọc tối đa max_records event tính từ vị trí đã gửi
+
+        Returns:
+            (list, position): Các event và vị trí ngay sau record cuối (truyền cho commit)
+        """
+        with self._lock:
+            self._active.flush()
+            records = []
+            segment_id, offset = self._position
+            while True:
+                offset = self._read_segment(segment_id, offset, max_records, records)
+                if len(records) >= max_records or segment_id == self._active_id:
+                    break
+                # Hết segment (hoặc phần đuôi ghi dở): chuyển sang segment kế tiếp
+                later = [s for s in self._segments if s > segment_id]
+                if not later:
+                    break
+                segment_id, offset = later[0], 0
+            return records, (segment_id, offset)
+
+    def commit(self, position):
+        """Đánh dấu đã gửi xong đến position và xóa các segment đã gửi hết"""
+        with self._lock:
+            self._position = position
+            self._save_position()
+            for segment_id in [s for s in self._segments if s < position[0]]:
+                try:
+                    os.remove(self._segment_path(segment_id))
+                except OSError:
+                    pass
+                self._segments.remove(segment_id)
+                self._sizes.pop(segment_id, None)
+            self._pending_bytes = self._count_pending()
+
+    def drain(self, send_batch, batch_size=5000):
+        """
+        Gửi lại toàn bộ event đang chờ theo lô, đúng thứ tự
+
+        Args:
+            send_batch: Hàm nhận list event, chỉ return khi cả lô đã được broker xác nhận
+                (raise exception nếu lỗi; vị trí khi đó không được commit)
+
+        Returns:
+            int: Số event đã gửi lại
+        """
+        count = 0
+        while True:
+            records, position = self.read_batch(batch_size)
+            if not records:
+                if position != self._position:
+                    self.commit(position)
+                return count
+            send_batch(records)
+            self.commit(position)
+            count += len(records)
+            self.drained += len(records)
+
+    def close(self):
+        with self._lock:
+            self._sync(force=True)
+            self._active.close()
@@ -0,0 +1,111 @@
+"""
+Location State - Trạng thái gọn của một vị trí đỗ và logic cập nhật theo event
+
+State của mỗi vị trí là tuple (license_plate, status_code, entry_time_unix, last_event_unix):
+- entry_time_unix chỉ được đặt khi một lượt đỗ mới bắt đầu (vị trí chuyển từ trống
+  sang có xe, hoặc đổi biển số), nên thời gian đỗ không bị reset bởi các event PARKED lặp lại
+- event cũ hơn last_event_unix (đến trễ, sai thứ tự) bị bỏ qua
+
+Số block tính tiền (billed_blocks) dùng cùng bảng giá với Spark (parking_tariff.py),
+để chế độ emit-on-change biết khi nào tiền thay đổi mà không cần event mới.
+
+Không phụ thuộc Spark: dùng được cả trong applyInPandasWithState lẫn xử lý Python thuần.
+"""
+
+from parking_tariff import load_tariff
+
+OCCUPIED_STATUS_CODES = ('ENTERING', 'PARKED', 'MOVING')
+
+# Trạng thái được tính tiền theo thời gian (ENTERING chưa tính)
+BILLED_STATUS_CODES = ('PARKED', 'MOVING')
+
+DEFAULT_TARIFF = load_tariff()
+
+STATE_FIELDS = ('license_plate', 'status_code', 'entry_time_unix', 'last_event_unix')
+
+
+def is_occupied(status_code):
+    return status_code in OCCUPIED_STATUS_CODES
+
+
+def apply_event(state, license_plate, status_code, timestamp_unix):
+    """
+    Cập nhật state của một vị trí với một event
+
+    Args:
+        state (tuple): State hiện tại (xem STATE_FIELDS), None nếu chưa có
+        license_plate (str): Biển số trong event (None với vị trí trống của occupancy frame)
+        status_code (str): ENTERING / PARKED / MOVING / EXITING
+        timestamp_unix (int): Thời gian của event
+
+    Returns:
+        tuple: State mới (chính là state cũ nếu event bị bỏ qua)
+    """
+    if state is not None and timestamp_unix < state[3]:
+        return state
+
+    if not is_occupied(status_code):
+        return (license_plate, status_code, None, timestamp_unix)
+
+    entry_time = None
+    if state is not None and is_occupied(state[1]) and state[0] == license_plate:
+        entry_time = state[2]
+    if entry_time is None:
+        # Lượt đỗ mới
+        entry_time = timestamp_unix
+    return (license_plate, status_code, entry_time, timestamp_unix)
+
+
+def completed_stay(old_state, new_state):
+    """
+    Lượt đỗ vừa kết thúc khi state chuyển từ old_state sang new_state
+
+    Lượt đỗ kết thúc khi vị trí đang có xe chuyển sang trống (EXITING) hoặc có lượt đỗ
+    mới (đổi biển số); thời điểm ra là thời gian của event gây ra chuyển đổi.
+
+    Returns:
+        tuple: (license_plate, entry_time_unix, exit_time_unix), None nếu không có lượt nào kết thúc
+    """
+    if old_state is None or new_state is old_state:
+        return None
+    plate, status_code, entry_time, _ = old_state
+    if not is_occupied(status_code) or entry_time is None:
+        return None
+    if is_occupied(new_state[1]) and new_state[2] == entry_time:
+        return None
+    return (plate, entry_time, new_state[3])
+
+
+def visible_changed(old_state, new_state):
+    """True nếu biển số, trạng thái hoặc giờ vào thay đổi (bỏ qua thời điểm event cuối)"""
+    if old_state is None:
+        return new_state is not None
+    return old_state[:3] != new_state[:3]
+
+
+def output_status(status_code):
+    """Trạng thái hiển thị trên topic parking-status"""
+    if status_code == 'EXITING':
+        return 'EMPTY'
+    if is_occupied(status_code):
+        return 'OCCUPIED'
+    return 'UNKNOWN'
+
+
+def billed_blocks(status_code, entry_time_unix, now_unix, tariff=None):
+    """Số block phải trả tại thời điểm now_unix theo bảng giá (0 nếu chưa tính tiền)"""
+    if status_code not in BILLED_STATUS_CODES or entry_time_unix is None:
+        return 0
+    return (tariff or DEFAULT_TARIFF).blocks_for(max(now_unix - entry_time_unix, 0))
+
+
+def seconds_until_next_block(status_code, entry_time_unix, now_unix, tariff=None):
+    """Số giây đến khi billed_blocks tăng thêm 1, None nếu không tăng theo thời gian"""
+    if status_code not in BILLED_STATUS_CODES or entry_time_unix is None:
+        return None
+    tariff = tariff or DEFAULT_TARIFF
+    duration = max(now_unix - entry_time_unix, 0)
+    blocks = tariff.blocks_for(duration)
+    # Block đầu tiên bắt đầu tính sau thời gian miễn phí, các block sau sau mỗi block_minutes
+    boundary = tariff.grace_minutes * 60 if blocks == 0 else blocks * tariff.block_minutes * 60
+    return max(boundary + 1 - duration, 1)
@@ -0,0 +1,113 @@
+"""
+Status Feed - Phần đọc parking-status dùng chung cho GUI và dashboard server (không cần Tk)
+
+- fold_records: gộp một lô Kafka record thành delta {lot_id: {location: dòng mới nhất}}
+- assign_partitions: gán mọi partition của topic (không dùng consumer group, nên nhiều
+  tiến trình cùng đọc không chia nhau partition) và đọc tiếp từ offset đã lưu
+- Snapshot dữ liệu mọi bãi + offset: parking_snapshot.py, phần state là "lots"
+
+Giao thức dashboard (parking_dashboard_server.py): mỗi message là một dòng JSON
+    {"type": "snapshot", "lots": {lot_id: {location: dòng}}}   (đầu tiên, toàn bộ)
+    {"type": "delta", "lots": {lot_id: {location: dòng}}}      (các vị trí đã đổi)
+"""
+
+from datetime import datetime
+
+from parking_snapshot import PARTITION_WAIT_SECONDS, seek_partitions
+from parking_wire_format import decode_status, record_lot_id
+
+try:
+    from kafka import KafkaConsumer
+    KAFKA_AVAILABLE = True
+except ImportError:
+    KAFKA_AVAILABLE = False
+    print("Cảnh báo: kafka-python chưa được cài đặt. Chạy: pip install kafka-python")
+
+# Số message tối đa mỗi lần poll và thời gian chờ của poll (ms)
+POLL_MAX_RECORDS = 5000
+POLL_TIMEOUT_MS = 200
+DASHBOARD_PORT = 8765
+
+
+def status_row(data):
+    """Dòng hiển thị của một vị trí từ message parking-status đã giải mã"""
+    return {
+        'status': data.get('status', 'UNKNOWN'),
+        'license_plate': data.get('license_plate') or 'N/A',
+        'parked_duration_minutes': data.get('parked_duration_minutes'),
+        'parked_blocks': data.get('parked_blocks', 0),
+        'total_cost': data.get('total_cost', 0.0),
+        'last_update': data.get('last_update', datetime.now().isoformat())
+    }
+
+
+def fold_records(delta, records):
+    """
+    Gộp một lô Kafka record vào delta {lot_id: {location: dòng}}, message sau ghi đè
+    message trước của cùng vị trí (record của một partition đã theo thứ tự offset)
+
+    Returns:
+        int: Số record đã đọc
+    """
+    count = 0
+    for record in records:
+        count += 1
+        try:
+            data = decode_status(record.value, record.headers)
+        except Exception as e:
+            print(f"Lỗi khi giải mã message: {e}")
+            continue
+        location = data.get('location')
+        if location:
+            delta.setdefault(record_lot_id(data, record.key), {})[location] = status_row(data)
+    return count
+
+
+def merge_delta(delta, lots):
+    """Gộp {lot_id: {location: dòng}} vào delta (dòng sau ghi đè dòng trước)"""
+    for lot_id, rows in lots.items():
+        delta.setdefault(lot_id, {}).update(rows)
+
+
+def assign_partitions(kafka_broker, topic, positions=None, max_records=POLL_MAX_RECORDS,
+                      wait_seconds=PARTITION_WAIT_SECONDS):
+    """
+    Consumer đọc mọi partition của topic, tiếp tục từ positions {"topic:partition": offset};
+    partition chưa có offset thì đọc từ cuối (như auto_offset_reset='latest'). Topic chưa có
+    partition sau wait_seconds thì raise RuntimeError
+    """
+    consumer = KafkaConsumer(
+        bootstrap_servers=kafka_broker,
+        # Giải mã theo header content-type (JSON hoặc nhị phân), xem fold_records
+        auto_offset_reset='latest',
+        enable_auto_commit=False,
+        max_poll_records=max_records
+    )
+    return seek_partitions(consumer, [topic], positions, wait_seconds)
+
+
+def poll_delta(consumer, positions, max_records=POLL_MAX_RECORDS, watcher=None):
+    """
+    Một lần poll: delta đã gộp, cập nhật positions với offset kế tiếp của từng partition;
+    watcher (PartitionWatcher) gán thêm partition mới trước khi poll
+
+    Returns:
+        tuple: (delta, offsets của lần poll này, số record đã đọc)
+    """
+    if watcher:
+        watcher.check(consumer)
+    batches = consumer.poll(timeout_ms=POLL_TIMEOUT_MS, max_records=max_records)
+    delta, offsets, count = {}, {}, 0
+    for tp, records in batches.items():
+        count += fold_records(delta, records)
+        offsets[f"{tp.topic}:{tp.partition}"] = records[-1].offset + 1
+    positions.update(offsets)
+    return delta, offsets, count
+
+
+def parse_address(text, default_port=DASHBOARD_PORT):
+    """"host:port" -> (host, port)"""
+    host, _, port = text.rpartition(':')
+    if not host:
+        return text, default_port
+    return host, int(port)
@@ -0,0 +1,597 @@
+"""
+Stream Processor - Engine xử lý thuần Python (asyncio) thay cho Spark với bãi nhỏ
+
+Đọc parking-events (và parking-frames nếu có), giữ state từng vị trí trong dict,
+tính tiền theo cùng quy tắc với Spark (parking_state.py, parking_tariff.py), ghi
+parking-status và hóa đơn lượt đỗ đã kết thúc (parking-bills) cùng định dạng, nên GUI
+và bên thanh toán dùng được với cả hai engine. Không cần JVM /
+spark-submit: khởi động dưới một giây, mỗi event được xử lý ngay khi đến (không có
+micro-batch).
+
+Transport:
+- Kafka (mặc định): kafka-python, poll chạy trong thread pool để không chặn event loop
+- File / pipe (--input): mỗi dòng một event JSON (ví dụ stdout của
+  `parking_event_log.py --no-kafka`), ghi status dạng JSON lines ra --output,
+  hóa đơn ra --bills-output
+
+Mỗi tiến trình xử lý một bãi (--lot-id); event của bãi khác bị bỏ qua, nên có thể chạy
+một tiến trình cho mỗi bãi trên cùng topic.
+
+Snapshot (--snapshot): state các vị trí và vị trí đọc (offset Kafka hoặc byte của file)
+được ghi nguyên tử định kỳ; khởi động lại sẽ nạp state và đọc tiếp từ vị trí đó.
+
+Chạy:
+    python parking_stream_processor.py --kafka-broker 192.168.80.212:9092 --snapshot /tmp/parking.snapshot
+    python parking_event_log.py events.log --no-kafka --speed 0 | python parking_stream_processor.py --input -
+"""
+
+import asyncio
+import heapq
+import json
+import os
+import struct
+import sys
+import time
+from datetime import datetime
+
+from parking_frames import expand_frame
+from parking_json_stream import create_kafka_producer
+from parking_snapshot import PartitionWatcher, load_snapshot, save_snapshot, seek_partitions
+from parking_state import (
+    apply_event, completed_stay, visible_changed, output_status, billed_blocks, seconds_until_next_block,
+    BILLED_STATUS_CODES
+)
+from parking_tariff import load_tariff, calculate_fee
+from parking_wire_format import (
+    DEFAULT_LOT_ID, decode_event, encode_status, lot_key, record_lot_id, validate_lot_id
+)
+
+try:
+    from kafka import KafkaConsumer
+    KAFKA_AVAILABLE = True
+except ImportError:
+    KAFKA_AVAILABLE = False
+    print("Cảnh báo: kafka-python chưa được cài đặt. Chạy: pip install kafka-python")
+
+EMIT_MODES = ('change', 'state')
+BILLING_CLOCKS = ('processing', 'event')
+
+
+class LocationProcessor:
+    """
+    State và logic phát dòng status của mọi vị trí (đồng bộ, không I/O)
+
+    Cùng hành vi với update_location_state của Spark:
+    - emit_mode 'change': phát khi (trạng thái, biển số, số block) khác lần gửi trước,
+      hẹn giờ đến lúc số block tăng để tiền được cập nhật khi không có event
+    - emit_mode 'state': phát khi biển số / trạng thái / giờ vào thay đổi
+    - Mỗi lượt đỗ kết thúc (completed_stay) tạo một hóa đơn, lấy qua take_bills()
+    - TTL: state của vị trí không có event trong state_timeout_minutes bị xóa
+    Chỉ xử lý event của bãi lot_id.
+    """
+
+    def __init__(self, tariff=None, emit_mode='change', billing_clock='processing',
+                 state_timeout_minutes=1440, lot_id=DEFAULT_LOT_ID):
+        if emit_mode not in EMIT_MODES:
+            raise ValueError(f"emit_mode phải là một trong {EMIT_MODES}")
+        if billing_clock not in BILLING_CLOCKS:
+            raise ValueError(f"billing_clock phải là một trong {BILLING_CLOCKS}")
+        self.tariff = tariff or load_tariff()
+        self.lot_id = validate_lot_id(lot_id)
+        self.emit_mode = emit_mode
+        self.billing_clock = billing_clock
+        self.state_timeout = state_timeout_minutes * 60
+        self.states = {}       # {location: (license_plate, status_code, entry_time_unix, last_event_unix)}
+        self.published = {}    # {location: (status, license_plate, blocks)} của dòng gửi gần nhất
+        self.last_seen = {}    # {location: thời điểm xử lý event cuối}, cho TTL theo processing time
+        self.max_event_unix = 0
+        self._timers = []      # heap (thời điểm, location) hẹn giờ tăng block
+        self._bills = []       # hóa đơn chưa được lấy (take_bills)
+
+    def status_row(self, location, now):
+        """Dòng status (dict cùng key với JSON của Spark) của một vị trí"""
+        plate, status_code, entry_time, last_event = self.states[location]
+        current = last_event if self.billing_clock == 'event' else int(now)
+        if status_code in BILLED_STATUS_CODES and entry_time is not None:
+            minutes = max(current - entry_time, 0) / 60.0
+            blocks, cost = calculate_fee(location, entry_time, current, self.tariff)
+        else:
+            minutes, blocks, cost = None, 0, 0.0
+        return {
+            "lot_id": self.lot_id,
+            "location": location,
+            "status": output_status(status_code),
+            "license_plate": plate,
+            "parked_duration_minutes": minutes,
+            "parked_blocks": blocks,
+            "total_cost": cost,
+            "event_timestamp_unix": last_event,
+            "last_update": datetime.now().isoformat()
+        }
+
+    def bill_row(self, location, plate, entry_time, exit_time):
+        """Hóa đơn của một lượt đỗ (cùng key với JSON parking-bills của Spark)"""
+        blocks, amount = calculate_fee(location, entry_time, exit_time, self.tariff)
+        return {
+            "bill_id": f"{self.lot_id}-{location}-{entry_time}-{plate}",
+            "lot_id": self.lot_id,
+            "license_plate": plate,
+            "location": location,
+            "floor": location[0],
+            "entry_time_unix": entry_time,
+            "exit_time_unix": exit_time,
+            "entry_time": datetime.fromtimestamp(entry_time).strftime("%Y-%m-%d %H:%M:%S"),
+            "exit_time": datetime.fromtimestamp(exit_time).strftime("%Y-%m-%d %H:%M:%S"),
+            "duration_minutes": (exit_time - entry_time) / 60.0,
+            "blocks": blocks,
+            "amount": amount,
+            "issued_at": datetime.now().isoformat()
+        }
+
+    def take_bills(self):
+        """Các hóa đơn phát sinh từ lần gọi trước"""
+        bills, self._bills = self._bills, []
+        return bills
+
+    def _publish(self, location, old_state, now):
+        """Quyết định phát dòng sau khi state của vị trí đổi (hoặc hẹn giờ đến hạn)"""
+        plate, status_code, entry_time, last_event = self.states[location]
+        now_unix = last_event if self.billing_clock == 'event' else int(now)
+        current = (output_status(status_code), plate,
+                   billed_blocks(status_code, entry_time, now_unix, self.tariff))
+        if self.emit_mode == 'change':
+            emit = current != self.published.get(location)
+            if self.billing_clock == 'processing':
+                next_block = seconds_until_next_block(status_code, entry_time, now_unix, self.tariff)
+                if next_block is not None:
+                    heapq.heappush(self._timers, (now + next_block, location))
+        else:
+            emit = visible_changed(old_state, self.states[location])
+        if not emit:
+            return None
+        self.published[location] = current
+        return self.status_row(location, now)
+
+    def process_event(self, event, now):
+        """
+        Áp dụng một event (hoặc occupancy frame) và trả về các dòng status cần gửi
+
+        Args:
+            event (dict): Event như get_event_info, hoặc frame (xem parking_frames.py)
+            now (float): Thời điểm xử lý (Unix timestamp)
+        """
+        if record_lot_id(event) != self.lot_id:
+            return []
+        if "bitmap" in event:
+            # Frame: mỗi vị trí của tầng là một event PARKED (có xe) hoặc EXITING (trống)
+            ts = event.get("timestamp_unix")
+            events = [(loc, plate, 'PARKED' if plate else 'EXITING', ts)
+                      for loc, plate in expand_frame(event).items()]
+        else:
+            events = [(event.get("location"), event.get("license_plate"),
+                       event.get("status_code"), event.get("timestamp_unix"))]
+
+        rows = []
+        for location, plate, status_code, ts in events:
+            if not location or ts is None:
+                continue
+            ts = int(ts)
+            self.max_event_unix = max(self.max_event_unix, ts)
+            old_state = self.states.get(location)
+            new_state = apply_event(old_state, plate, status_code, ts)
+            if new_state is old_state:
+                continue
+            stay = completed_stay(old_state, new_state)
+            if stay:
+                self._bills.append(self.bill_row(location, *stay))
+            self.states[location] = new_state
+            self.last_seen[location] = now
+            row = self._publish(location, old_state, now)
+            if row:
+                rows.append(row)
+        return rows
+
+    def due_rows(self, now):
+        """Dòng status của các vị trí đến hạn tăng block (chỉ emit_mode 'change' + processing clock)"""
+        rows = []
+        while self._timers and self._timers[0][0] <= now:
+            _, location = heapq.heappop(self._timers)
+            if location not in self.states:
+                continue
+            row = self._publish(location, self.states[location], now)
+            if row:
+                rows.append(row)
+        # Mỗi vị trí chỉ cần một hẹn giờ: bỏ các hẹn giờ trùng do event đến trước hạn
+        if len(self._timers) > 4 * max(len(self.states), 1):
+            latest = {}
+            for due, location in self._timers:
+                latest[location] = max(due, latest.get(location, due))
+            self._timers = [(due, location) for location, due in latest.items()]
+            heapq.heapify(self._timers)
+        return rows
+
+    def expire(self, now):
+        """Xóa state quá TTL (theo processing time, hoặc thời gian event với billing_clock 'event')"""
+        expired = []
+        for location, (_, _, _, last_event) in self.states.items():
+            if self.billing_clock == 'event':
+                idle = self.max_event_unix - last_event
+            else:
+                idle = now - self.last_seen.get(location, now)
+            if idle >= self.state_timeout:
+                expired.append(location)
+        for location in expired:
+            del self.states[location]
+            self.published.pop(location, None)
+            self.last_seen.pop(location, None)
+        return len(expired)
+
+    def snapshot(self):
+        return {
+            "states": {loc: list(state) for loc, state in self.states.items()},
+            "published": {loc: list(pub) for loc, pub in self.published.items()},
+            "max_event_unix": self.max_event_unix
+        }
+
+    def restore(self, data, now):
+        self.states = {loc: tuple(state) for loc, state in data.get("states", {}).items()}
+        self.published = {loc: tuple(pub) for loc, pub in data.get("published", {}).items()}
+        self.max_event_unix = data.get("max_event_unix", 0)
+        self.last_seen = {loc: now for loc in self.states}
+        self._timers = []
+        if self.emit_mode == 'change' and self.billing_clock == 'processing':
+            # Hẹn giờ lại: vị trí nào có số block khác lần gửi trước sẽ được phát ở lần tick đầu
+            self._timers = [(now, location) for location in self.states]
+            heapq.heapify(self._timers)
+
+
+def decode_input(value, headers=None):
+    """
+    Event đã giải mã, None nếu record hỏng (không phải JSON / nhị phân hợp lệ, hoặc không
+    phải object); record hỏng được bỏ qua nhưng vẫn tính vào vị trí đọc, nên khởi động lại
+    từ snapshot không đọc lại nó
+    """
+    try:
+        event = decode_event(value, headers)
+    except (ValueError, TypeError, KeyError, IndexError, struct.error) as e:
+        print(f"⚠️  Bỏ qua event không giải mã được: {e}", file=sys.stderr)
+        return None
+    if not isinstance(event, dict):
+        print(f"⚠️  Bỏ qua event không phải object: {type(event).__name__}", file=sys.stderr)
+        return None
+    return event
+
+
+class KafkaTransport:
+    """Đọc parking-events / parking-frames, ghi parking-status qua kafka-python"""
+
+    def __init__(self, kafka_broker, input_topic, output_topic, frames_topic=None, output_format='json',
+                 bills_topic=None):
+        self.kafka_broker = kafka_broker
+        self.topics = [input_topic] + ([frames_topic] if frames_topic else [])
+        self.output_topic = output_topic
+        self.bills_topic = bills_topic
+        self.output_format = output_format
+        self.consumer = None
+        self.producer = None
+        self.skipped = 0
+        self._offsets = {}
+        self._watcher = PartitionWatcher(self.topics)
+
+    async def start(self, positions=None):
+        """
+        Gán mọi partition của các topic input; đọc tiếp từ positions của snapshot,
+        partition chưa có vị trí thì đọc từ cuối (như startingOffsets=latest của Spark),
+        partition thêm sau đó được gán trong read
+        """
+        loop = asyncio.get_running_loop()
+
+        def connect():
+            consumer = KafkaConsumer(bootstrap_servers=self.kafka_broker, enable_auto_commit=False)
+            return seek_partitions(consumer, self.topics, positions)
+
+        self.consumer = await loop.run_in_executor(None, connect)
+        self.producer = create_kafka_producer(self.kafka_broker, fast_mode=True, value_serializer=None)
+
+    async def read(self):
+        """Các event đã giải mã của lần poll tiếp theo (list rỗng nếu chưa có)"""
+        loop = asyncio.get_running_loop()
+
+        def poll():
+            self._watcher.check(self.consumer)
+            return self.consumer.poll(timeout_ms=100, max_records=1000)
+
+        batches = await loop.run_in_executor(None, poll)
+        events = []
+        for tp, records in batches.items():
+            for record in records:
+                self._offsets[f"{tp.topic}:{tp.partition}"] = record.offset + 1
+                event = decode_input(record.value, record.headers)
+                if event is None:
+                    self.skipped += 1
+                    continue
+                # Event nhị phân không mang lot_id: lấy từ Kafka key
+                event["lot_id"] = record_lot_id(event, record.key)
+                events.append(event)
+        return events
+
+    def write(self, row):
+        value, headers = encode_status(row) if self.output_format == 'binary' else (
+            json.dumps(row, ensure_ascii=False).encode('utf-8'), None)
+        self.producer.send(self.output_topic, key=lot_key(row),
+                           value=value, headers=headers)
+
+    def write_bill(self, bill):
+        # Hóa đơn luôn là JSON (như Spark), kể cả khi --output-format binary
+        if self.bills_topic:
+            self.producer.send(self.bills_topic, key=lot_key(bill),
+                               value=json.dumps(bill, ensure_ascii=False).encode('utf-8'))
+
+    def flush(self):
+        # producer.send không chặn; dòng được gửi theo linger_ms của producer
+        pass
+
+    async def sync(self):
+        """Chờ broker xác nhận mọi dòng đã send (trước khi lưu offset vào snapshot)"""
+        await asyncio.get_running_loop().run_in_executor(None, self.producer.flush)
+
+    def positions(self):
+        return dict(self._offsets)
+
+    def close(self):
+        if self.producer:
+            self.producer.flush()
+            self.producer.close()
+        if self.consumer:
+            self.consumer.close()
+
+
+class FileTransport:
+    """
+    Đọc event JSON lines từ file / pipe ('-' = stdin), ghi status JSON lines ('-' = stdout)
+    và hóa đơn JSON lines ra bills_path (None = bỏ hóa đơn)
+    """
+
+    def __init__(self, input_path, output_path='-', follow=False, bills_path=None):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.bills_path = bills_path
+        self.follow = follow
+        self._in = None
+        self._out = None
+        self._bills = None
+        self.skipped = 0
+        self._position = 0
+        self._pending = b""
+
+    async def start(self, positions=None):
+        if self.input_path == '-':
+            self._in = sys.stdin.buffer
+        else:
+            self._in = open(self.input_path, "rb")
+            if positions and "file" in positions:
+                self._in.seek(positions["file"])
+                self._position = positions["file"]
+        self._out = sys.stdout if self.output_path == '-' else open(self.output_path, "a", encoding="utf-8")
+        if self.bills_path:
+            self._bills = open(self.bills_path, "a", encoding="utf-8")
+
+    async def read(self):
+        """
+        Các event của những dòng đã có sẵn; None khi hết input (không --follow)
+
+        read1 trả về ngay phần dữ liệu đang có (không chờ đủ buffer), nên với pipe
+        mỗi event được xử lý ngay mà vẫn đọc theo lô khi input dồn dập.
+        """
+        loop = asyncio.get_running_loop()
+        chunk = await loop.run_in_executor(None, self._in.read1, 65536)
+        if not chunk:
+            if self.follow:
+                await asyncio.sleep(0.2)
+                return []
+            if not self._pending:
+                return None
+            # Hết input: dòng cuối không có '\n' vẫn là một event (với --follow thì chờ
+            # phần còn lại của dòng)
+            lines, self._pending = [self._pending], b""
+        else:
+            *lines, self._pending = (self._pending + chunk).split(b"\n")
+        events = []
+        for line in lines:
+            self._position += len(line) + (1 if chunk else 0)
+            line = line.strip()
+            if not line:
+                continue
+            event = decode_input(line)
+            if event is None:
+                self.skipped += 1
+            else:
+                events.append(event)
+        return events
+
+    def write(self, row):
+        self._out.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def write_bill(self, bill):
+        if self._bills is not None:
+            self._bills.write(json.dumps(bill, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self._out.flush()
+        if self._bills is not None:
+            self._bills.flush()
+
+    async def sync(self):
+        self.flush()
+
+    def positions(self):
+        # Vị trí byte chỉ có nghĩa với file thường (pipe không seek được)
+        return {} if self.input_path == '-' else {"file": self._position}
+
+    def close(self):
+        if self._in is not None and self._in is not sys.stdin.buffer:
+            self._in.close()
+        if self._out is not None and self._out is not sys.stdout:
+            self._out.close()
+        if self._bills is not None:
+            self._bills.close()
+
+
+async def run_processor(processor, transport, snapshot_path=None, snapshot_interval=10.0,
+                        tick_interval=0.5, report_interval=10.0):
+    """
+    Vòng lặp chính: đọc event, phát status ngay; tick định kỳ cho hẹn giờ tăng block,
+    TTL, snapshot và thống kê độ trễ
+
+    Returns:
+        int: Số event đã xử lý
+    """
+    started = time.time()
+    positions = None
+    if snapshot_path:
+        data = load_snapshot(snapshot_path)
+        if data:
+            processor.restore(data["processor"], time.time())
+            positions = data.get("positions")
+            print(f"💾 Đã nạp snapshot {snapshot_path}: {len(processor.states)} vị trí", file=sys.stderr)
+    await transport.start(positions)
+    print(f"✅ Sẵn sàng sau {(time.time() - started) * 1000:.0f} ms", file=sys.stderr)
+
+    stats = {"events": 0, "rows": 0, "bills": 0, "latency_sum": 0.0, "latency_max": 0.0}
+    done = asyncio.Event()
+
+    async def checkpoint():
+        """
+        Lưu snapshot: lấy state + vị trí đọc trước, chờ mọi dòng đã ghi được xác nhận
+        (transport.sync) rồi mới ghi file, nên snapshot không bao giờ vượt qua dòng
+        status chưa tới broker; event đọc trong lúc chờ thuộc snapshot sau
+        """
+        state, positions = processor.snapshot(), transport.positions()
+        await transport.sync()
+        save_snapshot(snapshot_path, positions, processor=state)
+
+    async def ticker():
+        last_snapshot = last_report = time.time()
+        reported_events = 0
+        while not done.is_set():
+            await asyncio.sleep(tick_interval)
+            now = time.time()
+            for row in processor.due_rows(now):
+                transport.write(row)
+                stats["rows"] += 1
+            transport.flush()
+            processor.expire(now)
+            if snapshot_path and now - last_snapshot >= snapshot_interval:
+                await checkpoint()
+                last_snapshot = now
+            if now - last_report >= report_interval:
+                count = stats["events"] - reported_events
+                if count:
+                    print(f"📊 {count} events ({count / (now - last_report):.0f}/s) | "
+                          f"{stats['rows']} dòng status, {stats['bills']} hóa đơn, "
+                          f"{transport.skipped} event hỏng | độ trễ xử lý TB "
+                          f"{stats['latency_sum'] / count * 1000:.3f} ms, max {stats['latency_max'] * 1000:.3f} ms",
+                          file=sys.stderr)
+                reported_events = stats["events"]
+                stats["latency_sum"] = stats["latency_max"] = 0.0
+                last_report = now
+
+    tick_task = asyncio.create_task(ticker())
+    try:
+        while True:
+            events = await transport.read()
+            if events is None:
+                break
+            for event in events:
+                received = time.time()
+                for row in processor.process_event(event, received):
+                    transport.write(row)
+                    stats["rows"] += 1
+                for bill in processor.take_bills():
+                    transport.write_bill(bill)
+                    stats["bills"] += 1
+                latency = time.time() - received
+                stats["events"] += 1
+                stats["latency_sum"] += latency
+                stats["latency_max"] = max(stats["latency_max"], latency)
+            transport.flush()
+    finally:
+        done.set()
+        await tick_task
+        if snapshot_path:
+            await checkpoint()
+        transport.close()
+    return stats["events"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Engine xử lý thuần Python (thay cho Spark) cho bãi nhỏ')
+    parser.add_argument('--kafka-broker', type=str, default=os.getenv('KAFKA_BROKER', 'localhost:9092'),
+                       help='Địa chỉ Kafka broker (mặc định: localhost:9092)')
+    parser.add_argument('--input-topic', type=str, default='parking-events',
+                       help='Topic event (mặc định: parking-events)')
+    parser.add_argument('--frames-topic', type=str, default=None,
+                       help='Topic occupancy frame, bỏ trống = không đọc frame (mặc định: không)')
+    parser.add_argument('--output-topic', type=str, default='parking-status',
+                       help='Topic status (mặc định: parking-status)')
+    parser.add_argument('--output-format', type=str, default='json', choices=['json', 'binary'],
+                       help='Định dạng topic status (mặc định: json)')
+    parser.add_argument('--bills-topic', type=str, default=os.getenv('BILLS_TOPIC', 'parking-bills'),
+                       help='Topic hóa đơn, trống = không gửi (mặc định: parking-bills hoặc BILLS_TOPIC)')
+    parser.add_argument('--input', type=str, default=None,
+                       help="Đọc event JSON lines từ file / pipe thay vì Kafka ('-' = stdin)")
+    parser.add_argument('--output', type=str, default='-',
+                       help="Ghi status JSON lines ra file khi dùng --input ('-' = stdout, mặc định)")
+    parser.add_argument('--bills-output', type=str, default=None,
+                       help='Ghi hóa đơn JSON lines ra file khi dùng --input (mặc định: không ghi)')
+    parser.add_argument('--follow', action='store_true',
+                       help='Với --input: chờ dòng mới khi hết file (như tail -f)')
+    parser.add_argument('--snapshot', type=str, default=None,
+                       help='File snapshot state (mặc định: không lưu)')
+    parser.add_argument('--snapshot-interval', type=float, default=10.0,
+                       help='Chu kỳ ghi snapshot, giây (mặc định: 10)')
+    parser.add_argument('--lot-id', type=str, default=os.getenv('LOT_ID', DEFAULT_LOT_ID),
+                       help=f'Bãi đỗ cần xử lý (mặc định: {DEFAULT_LOT_ID} hoặc từ biến môi trường LOT_ID)')
+    parser.add_argument('--emit-mode', type=str, default=os.getenv('EMIT_MODE', 'change'), choices=EMIT_MODES,
+                       help='change hoặc state, như EMIT_MODE của Spark (mặc định: change)')
+    parser.add_argument('--billing-clock', type=str, default=os.getenv('BILLING_CLOCK', 'processing'),
+                       choices=BILLING_CLOCKS,
+                       help='processing hoặc event, như BILLING_CLOCK của Spark (mặc định: processing)')
+    parser.add_argument('--state-timeout-minutes', type=float,
+                       default=float(os.getenv('STATE_TIMEOUT_MINUTES', '1440')),
+                       help='TTL state của vị trí không có event (mặc định: 1440)')
+    parser.add_argument('--tariff', type=str, default=os.getenv('TARIFF_FILE'),
+                       help='File JSON bảng giá (mặc định: TARIFF_FILE hoặc bảng giá có sẵn)')
+    parser.add_argument('--price-per-block', type=float, default=float(os.getenv('PRICE_PER_BLOCK', '15000')),
+                       help='Giá ban ngày mỗi block của tầng thường (mặc định: 15000)')
+
+    args = parser.parse_args()
+    try:
+        validate_lot_id(args.lot_id)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.input:
+        transport = FileTransport(args.input, args.output, follow=args.follow, bills_path=args.bills_output)
+    elif KAFKA_AVAILABLE:
+        transport = KafkaTransport(args.kafka_broker, args.input_topic, args.output_topic,
+                                   frames_topic=args.frames_topic, output_format=args.output_format,
+                                   bills_topic=args.bills_topic)
+    else:
+        print("❌ Cần kafka-python hoặc --input")
+        sys.exit(1)
+
+    processor = LocationProcessor(
+        tariff=load_tariff(args.tariff, price_per_block=args.price_per_block),
+        emit_mode=args.emit_mode,
+        billing_clock=args.billing_clock,
+        state_timeout_minutes=args.state_timeout_minutes,
+        lot_id=args.lot_id
+    )
+    try:
+        count = asyncio.run(run_processor(processor, transport, args.snapshot, args.snapshot_interval))
+        print(f"✅ Đã xử lý {count} events", file=sys.stderr)
+    except KeyboardInterrupt:
+        print("\n⚠️  Đã dừng bởi người dùng (Ctrl+C)", file=sys.stderr)
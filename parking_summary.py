@@ -0,0 +1,162 @@
+"""
+Lot Summary - Tổng hợp theo tầng và toàn bãi từ luồng parking-status
+
+Mỗi dòng tổng hợp (topic parking-summary, key = lot_id, floor '*' = toàn bãi):
+
+    {
+        "lot_id": "default",
+        "floor": "C",
+        "capacity": 10, "occupied": 6, "free": 4, "occupancy_rate": 0.6,
+        "accrued_cost": 240000.0,      # tiền hiện tại của các xe đang đỗ
+        "completed_stays": 12,         # lượt đỗ đã kết thúc trong ngày
+        "completed_revenue": 910000.0, # tiền của các lượt đó
+        "revenue_today": 1150000.0,    # completed_revenue + accrued_cost
+        "avg_dwell_minutes": 47.5,     # thời gian đỗ trung bình của các lượt đã kết thúc trong ngày
+        "timestamp_unix": 1767229200
+    }
+
+Chỉ cần nhớ vị trí đang có xe (biển số, giờ vào) và bộ đếm của ngày hiện tại (giờ địa
+phương của bảng giá), nên state nhỏ và lưu được dạng JSON. Tiền được tính lại bằng bảng giá
+từ giờ vào (không lấy total_cost của dòng status), nên đúng với cả EMIT_MODE=change lẫn
+state và khớp với hóa đơn. Không phụ thuộc Spark.
+"""
+
+from parking_tariff import load_tariff
+from parking_wire_format import LOCATION_PATTERN
+
+DEFAULT_LAYOUT = "A:10,B:10,C:10,D:10,E:10,F:10"
+LOT_KEY = "*"
+
+
+def parse_layout(text):
+    """"A:10,B:10" -> {"A": 10, "B": 10}"""
+    layout = {}
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        floor, _, slots = part.partition(":")
+        layout[floor.strip()] = int(slots)
+    return layout
+
+
+def layout_locations(layout):
+    """{"A": 2, "B": 1} -> ["A1", "A2", "B1"]"""
+    return [f"{floor}{i}" for floor, slots in layout.items() for i in range(1, slots + 1)]
+
+
+class LotSummary:
+    """Vị trí đang có xe và bộ đếm lượt đỗ đã kết thúc trong ngày của một bãi"""
+
+    def __init__(self, layout, tariff=None, occupied=None, completed=None, day=None):
+        """
+        Args:
+            layout (dict): {tầng: số vị trí} (xem parse_layout)
+            tariff (Tariff): Bảng giá, cũng cho ranh giới ngày (mặc định: load_tariff())
+            occupied (dict): {location: [biển số, giờ vào (Unix)]}
+            completed (dict): {tầng: [số lượt, tổng tiền, tổng thời gian đỗ (phút)]}
+            day (int): Ngày (số ngày từ 1970-01-01, giờ địa phương) của completed
+        """
+        self.layout = dict(layout)
+        self.tariff = tariff or load_tariff()
+        self.utc_offset_hours = self.tariff.utc_offset_hours
+        self.occupied = occupied or {}
+        self.completed = completed or {}
+        self.day = day
+
+    @classmethod
+    def from_dict(cls, data, layout, tariff=None):
+        # State cũ lưu [biển số, tiền, phút] (không có giờ vào): lượt đó được tính tiền 0
+        occupied = {location: [values[0], values[1] if len(values) == 2 else None]
+                    for location, values in (data.get("occupied") or {}).items()}
+        return cls(layout, tariff, occupied, data.get("completed"), data.get("day"))
+
+    def to_dict(self):
+        return {"occupied": self.occupied, "completed": self.completed, "day": self.day}
+
+    def _local_day(self, now_unix):
+        return int((now_unix + self.utc_offset_hours * 3600) // 86400)
+
+    def roll_day(self, now_unix):
+        """Sang ngày mới (giờ địa phương) thì bắt đầu lại bộ đếm lượt đỗ đã kết thúc"""
+        day = self._local_day(now_unix)
+        if self.day != day:
+            self.day = day
+            self.completed = {}
+
+    def _fee(self, location, entry_unix, now_unix):
+        return self.tariff.fee(location[0], entry_unix, now_unix)[1]
+
+    def _complete(self, location, stay, exit_unix):
+        _, entry_unix = stay
+        counters = self.completed.setdefault(location[0], [0, 0.0, 0.0])
+        counters[0] += 1
+        if entry_unix is not None and exit_unix is not None:
+            counters[1] += self._fee(location, entry_unix, exit_unix)
+            counters[2] += max(exit_unix - entry_unix, 0) / 60.0
+
+    def apply_status(self, row):
+        """
+        Cập nhật với một dòng của parking-status (dict, xem parking_wire_format.decode_status)
+
+        Lượt đỗ bắt đầu ở dòng OCCUPIED đầu tiên của biển số (event vào, được phát ở cả hai
+        EMIT_MODE) và kết thúc khi vị trí chuyển sang EMPTY hoặc đổi biển số; tiền của lượt đỗ
+        tính theo bảng giá từ giờ vào đến event_timestamp_unix của dòng kết thúc, giống
+        completed_stay / hóa đơn. Lượt đỗ đã bắt đầu trước khi tổng hợp chạy lần đầu tính từ
+        dòng đầu tiên nhận được.
+        """
+        location = row.get("location")
+        if not location or not LOCATION_PATTERN.match(location):
+            return
+        status = row.get("status")
+        event_unix = row.get("event_timestamp_unix")
+        previous = self.occupied.get(location)
+        if status == "OCCUPIED":
+            plate = row.get("license_plate")
+            if previous is not None and previous[0] == plate:
+                return
+            if previous is not None:
+                self._complete(location, previous, event_unix)
+            self.occupied[location] = [plate, event_unix]
+        elif status == "EMPTY" and previous is not None:
+            self._complete(location, self.occupied.pop(location), event_unix)
+
+    def rows(self, now_unix):
+        """
+        Dòng tổng hợp cho mỗi tầng (theo layout và các tầng đã gặp) và dòng toàn bãi;
+        accrued_cost là tiền các xe đang đỗ tính đến now_unix
+        """
+        floors = sorted(set(self.layout) | {loc[0] for loc in self.occupied} | set(self.completed))
+        per_floor = {floor: [0, 0.0] for floor in floors}
+        for location, (_, entry_unix) in self.occupied.items():
+            per_floor[location[0]][0] += 1
+            if entry_unix is not None:
+                per_floor[location[0]][1] += self._fee(location, entry_unix, now_unix)
+
+        rows = []
+        totals = [0, 0, 0.0, 0, 0.0, 0.0]
+        for floor in floors:
+            occupied, accrued = per_floor[floor]
+            stays, revenue, minutes = self.completed.get(floor, (0, 0.0, 0.0))
+            capacity = self.layout.get(floor, 0)
+            rows.append(self._row(floor, capacity, occupied, accrued, stays, revenue, minutes, now_unix))
+            for i, value in enumerate((capacity, occupied, accrued, stays, revenue, minutes)):
+                totals[i] += value
+        rows.append(self._row(LOT_KEY, *totals, now_unix))
+        return rows
+
+    @staticmethod
+    def _row(floor, capacity, occupied, accrued, stays, revenue, minutes, now_unix):
+        return {
+            "floor": floor,
+            "capacity": capacity,
+            "occupied": occupied,
+            "free": max(capacity - occupied, 0),
+            "occupancy_rate": round(occupied / capacity, 4) if capacity else None,
+            "accrued_cost": accrued,
+            "completed_stays": stays,
+            "completed_revenue": revenue,
+            "revenue_today": revenue + accrued,
+            "avg_dwell_minutes": round(minutes / stays, 1) if stays else None,
+            "timestamp_unix": int(now_unix)
+        }
@@ -0,0 +1,254 @@
+"""
+Tariff Engine - Tính tiền đỗ xe theo bảng giá (tầng, ngày/đêm, trần mỗi ngày, miễn phí ban đầu)
+
+Quy tắc:
+- Thời gian đỗ <= grace_minutes: miễn phí (0 block)
+- Ngược lại tính ceil(thời gian đỗ / block_minutes) block, mỗi block lấy giá ngày hoặc
+  đêm theo giờ địa phương lúc block bắt đầu (ngày: [day_start_hour, night_start_hour))
+- Tổng tiền các block bắt đầu trong cùng một ngày (giờ địa phương) không vượt daily_cap
+- Giá theo tầng (ví dụ tầng F VIP), tầng không có trong bảng dùng dòng '*'
+
+Bảng giá là dict nhỏ (xem DEFAULT_TARIFF), đọc được từ file JSON và broadcast được cho
+Spark executor. compute_fees tính cho cả mảng lượt đỗ bằng NumPy, không lặp Python theo
+từng dòng: mỗi lượt đỗ được trải theo số ngày nó đi qua, số block ngày/đêm trong mỗi ngày
+được tính bằng công thức.
+"""
+
+import json
+import math
+import os
+from datetime import datetime
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("Cảnh báo: numpy chưa được cài đặt. Chạy: pip install numpy")
+
+DEFAULT_TARIFF = {
+    "block_minutes": 10,
+    "grace_minutes": 5,
+    "day_start_hour": 6,
+    "night_start_hour": 22,
+    "utc_offset_hours": 7,
+    "rates": {
+        # tầng: giá block ban ngày, giá block ban đêm, trần mỗi ngày (0 = không giới hạn)
+        "*": {"day_price": 15000, "night_price": 10000, "daily_cap": 300000},
+        "F": {"day_price": 25000, "night_price": 20000, "daily_cap": 500000}
+    }
+}
+
+SECONDS_PER_DAY = 86400
+
+
+class Tariff:
+    """Bảng giá đã kiểm tra hợp lệ"""
+
+    def __init__(self, block_minutes=10, grace_minutes=0, day_start_hour=6, night_start_hour=22,
+                 utc_offset_hours=7, rates=None):
+        if not 0 <= day_start_hour < night_start_hour <= 24:
+            raise ValueError("Cần 0 <= day_start_hour < night_start_hour <= 24")
+        if block_minutes <= 0:
+            raise ValueError("block_minutes phải > 0")
+        rates = rates or DEFAULT_TARIFF["rates"]
+        if "*" not in rates:
+            raise ValueError("Bảng giá cần dòng mặc định '*'")
+        self.block_minutes = block_minutes
+        self.grace_minutes = grace_minutes
+        self.day_start_hour = day_start_hour
+        self.night_start_hour = night_start_hour
+        self.utc_offset_hours = utc_offset_hours
+        self.rates = {
+            floor: {
+                "day_price": float(rate["day_price"]),
+                "night_price": float(rate.get("night_price", rate["day_price"])),
+                "daily_cap": float(rate.get("daily_cap") or 0)
+            }
+            for floor, rate in rates.items()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def flat(cls, price_per_block, block_minutes=10):
+        """Một giá cho mọi tầng, mọi giờ, không trần, không miễn phí (cách tính cũ)"""
+        return cls(block_minutes=block_minutes, grace_minutes=0,
+                   rates={"*": {"day_price": price_per_block, "night_price": price_per_block}})
+
+    def to_dict(self):
+        return {
+            "block_minutes": self.block_minutes,
+            "grace_minutes": self.grace_minutes,
+            "day_start_hour": self.day_start_hour,
+            "night_start_hour": self.night_start_hour,
+            "utc_offset_hours": self.utc_offset_hours,
+            "rates": self.rates
+        }
+
+    def rate(self, floor):
+        return self.rates.get(floor, self.rates["*"])
+
+    def blocks_for(self, duration_seconds):
+        """Số block cho thời gian đỗ (giây), dùng chung với parking_state"""
+        if duration_seconds <= self.grace_minutes * 60:
+            return 0
+        return math.ceil(duration_seconds / (self.block_minutes * 60))
+
+    def fee(self, floor, entry_unix, now_unix):
+        """
+        (blocks, cost) cho một lượt đỗ, cùng công thức với compute_fees nhưng không qua
+        NumPy (nhanh hơn nhiều khi tính từng lượt, ví dụ engine xử lý từng event)
+        """
+        if entry_unix is None or now_unix is None:
+            return 0, 0.0
+        blocks = self.blocks_for(max(now_unix - entry_unix, 0))
+        if blocks == 0:
+            return 0, 0.0
+        rate = self.rate(floor)
+        cap = rate["daily_cap"] or math.inf
+        block_seconds = self.block_minutes * 60.0
+        offset = self.utc_offset_hours * 3600.0
+
+        def count(start, end):
+            k0 = min(max(math.ceil((start - entry_unix) / block_seconds), 0), blocks)
+            k1 = min(max(math.ceil((end - entry_unix) / block_seconds), 0), blocks)
+            return k1 - k0
+
+        cost = 0.0
+        first_day = math.floor((entry_unix + offset) / SECONDS_PER_DAY)
+        last_day = math.floor((entry_unix + (blocks - 1) * block_seconds + offset) / SECONDS_PER_DAY)
+        for day in range(first_day, last_day + 1):
+            midnight = day * SECONDS_PER_DAY - offset
+            day_start = midnight + self.day_start_hour * 3600.0
+            night_start = midnight + self.night_start_hour * 3600.0
+            day_blocks = count(day_start, night_start)
+            night_blocks = count(midnight, day_start) + count(night_start, midnight + SECONDS_PER_DAY)
+            cost += min(day_blocks * rate["day_price"] + night_blocks * rate["night_price"], cap)
+        return blocks, float(cost)
+
+
+def load_tariff(path=None, price_per_block=None):
+    """
+    Bảng giá từ file JSON (nếu có), ngược lại DEFAULT_TARIFF
+
+    Args:
+        price_per_block (float): Ghi đè giá ban ngày của dòng '*' (tương thích PRICE_PER_BLOCK)
+    """
+    if path:
+        return Tariff.from_file(path)
+    data = json.loads(json.dumps(DEFAULT_TARIFF))
+    if price_per_block is not None:
+        data["rates"]["*"]["day_price"] = price_per_block
+    return Tariff.from_dict(data)
+
+
+def _count_blocks(entry, blocks, block_seconds, start, end):
+    """Số block k (0 <= k < blocks) có thời điểm bắt đầu entry + k * block_seconds trong [start, end)"""
+    k0 = np.clip(np.ceil((start - entry) / block_seconds), 0, blocks)
+    k1 = np.clip(np.ceil((end - entry) / block_seconds), 0, blocks)
+    return k1 - k0
+
+
+def compute_fees(tariff, floors, entry_unix, now_unix):
+    """
+    Tính số block và tiền cho một mảng lượt đỗ
+
+    Args:
+        tariff (Tariff): Bảng giá
+        floors: Mảng tầng ("A".."F") của từng lượt đỗ
+        entry_unix: Mảng giờ vào (Unix timestamp, NaN = không tính tiền)
+        now_unix: Mảng thời điểm tính tiền (Unix timestamp)
+
+    Returns:
+        (blocks, cost): mảng int64 và float64
+    """
+    floors = np.asarray(floors, dtype=object)
+    entry = np.asarray(entry_unix, dtype=np.float64)
+    now = np.asarray(now_unix, dtype=np.float64)
+    n = len(entry)
+
+    valid = ~np.isnan(entry) & ~np.isnan(now)
+    duration = np.where(valid, np.maximum(now - np.where(valid, entry, 0), 0), 0)
+    block_seconds = tariff.block_minutes * 60.0
+    blocks = np.where(valid & (duration > tariff.grace_minutes * 60),
+                      np.ceil(duration / block_seconds), 0).astype(np.int64)
+    entry = np.where(valid, entry, 0)
+
+    # Giá theo tầng: chỉ lặp Python trên các tầng khác nhau
+    unique_floors, floor_idx = np.unique(floors.astype(str), return_inverse=True)
+    rate_table = np.array([
+        [r["day_price"], r["night_price"], r["daily_cap"] or np.inf]
+        for r in (tariff.rate(f) for f in unique_floors)
+    ], dtype=np.float64).reshape(-1, 3)
+    day_price, night_price, daily_cap = rate_table[floor_idx].T
+
+    # Trải mỗi lượt đỗ theo các ngày (giờ địa phương) mà các block của nó bắt đầu
+    offset = tariff.utc_offset_hours * 3600.0
+    first_day = np.floor((entry + offset) / SECONDS_PER_DAY)
+    last_day = np.floor((entry + (np.maximum(blocks, 1) - 1) * block_seconds + offset) / SECONDS_PER_DAY)
+    num_days = np.where(blocks > 0, last_day - first_day + 1, 0).astype(np.int64)
+
+    rows = np.repeat(np.arange(n), num_days)
+    starts = np.cumsum(num_days) - num_days
+    day = first_day[rows] + (np.arange(len(rows)) - np.repeat(starts, num_days))
+
+    midnight = day * SECONDS_PER_DAY - offset
+    day_start = midnight + tariff.day_start_hour * 3600.0
+    night_start = midnight + tariff.night_start_hour * 3600.0
+    next_midnight = midnight + SECONDS_PER_DAY
+
+    e, b = entry[rows], blocks[rows]
+    day_blocks = _count_blocks(e, b, block_seconds, day_start, night_start)
+    night_blocks = (_count_blocks(e, b, block_seconds, midnight, day_start)
+                    + _count_blocks(e, b, block_seconds, night_start, next_midnight))
+    day_cost = np.minimum(day_blocks * day_price[rows] + night_blocks * night_price[rows], daily_cap[rows])
+
+    cost = np.bincount(rows, weights=day_cost, minlength=n).astype(np.float64)
+    return blocks, cost
+
+
+def calculate_fee(location, entry_unix, now_unix, tariff=None):
+    """Tính (blocks, cost) cho một lượt đỗ, cùng kết quả với Spark (dùng cho GUI / kiểm tra)"""
+    tariff = tariff or load_tariff()
+    return tariff.fee((location or "*")[0], entry_unix, now_unix)
+
+
+def _parse_local_time(text, tariff):
+    """Chuỗi "YYYY-MM-DD HH:MM:SS" theo giờ địa phương của bảng giá -> Unix timestamp"""
+    naive = datetime.strptime(text, "%Y-%m-%d %H:%M:%S")
+    return (naive - datetime(1970, 1, 1)).total_seconds() - tariff.utc_offset_hours * 3600
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Tính tiền đỗ xe theo bảng giá')
+    parser.add_argument('--tariff', type=str, default=os.getenv('TARIFF_FILE'),
+                       help='File JSON bảng giá (mặc định: TARIFF_FILE hoặc bảng giá có sẵn)')
+    parser.add_argument('--location', type=str, default='A1',
+                       help='Vị trí đỗ (mặc định: A1)')
+    parser.add_argument('--entry', type=str, default=None,
+                       help='Giờ vào "YYYY-MM-DD HH:MM:SS"')
+    parser.add_argument('--exit', type=str, default=None,
+                       help='Giờ ra "YYYY-MM-DD HH:MM:SS" (mặc định: hiện tại)')
+    parser.add_argument('--dump', action='store_true',
+                       help='In bảng giá dạng JSON rồi thoát')
+
+    args = parser.parse_args()
+
+    tariff = load_tariff(args.tariff)
+    if args.dump or not args.entry:
+        print(json.dumps(tariff.to_dict(), ensure_ascii=False, indent=2))
+    else:
+        entry = _parse_local_time(args.entry, tariff)
+        now = _parse_local_time(args.exit, tariff) if args.exit else datetime.now().timestamp()
+        blocks, cost = calculate_fee(args.location, entry, now, tariff)
+        print(f"🅿️  {args.location}: {(now - entry) / 60:.1f} phút -> {blocks} block, {cost:,.0f} VNĐ")
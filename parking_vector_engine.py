@@ -0,0 +1,444 @@
+"""
+Vectorized Simulation Engine - Mô phỏng bãi đỗ lớn bằng mảng NumPy
+
+Toàn bộ trạng thái xe (status, parked_count, parked_duration, slot, biển số)
+nằm trong các mảng NumPy; mỗi tick chuyển trạng thái hàng nghìn xe cùng lúc
+và trả về cả lô event, dùng để load test Spark với bãi đỗ gần đầy.
+
+Logic chuyển trạng thái giống ParkingEvent.next_status:
+ENTERING -> PARKED -> (đếm đủ parked_duration) MOVING -> EXITING -> rời bãi
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("Cảnh báo: numpy chưa được cài đặt. Chạy: pip install numpy")
+
+from parking_json_stream import (
+    KAFKA_AVAILABLE, ParkingEvent, ParkingStatus, DeliveryStats, serialize_event,
+    create_kafka_producer, send_event, send_frames, generate_parking_locations, generate_license_plates
+)
+from parking_frames import floor_layout, make_frame
+from parking_wire_format import DEFAULT_LOT_ID, LOCATION_PATTERN, WIRE_FORMATS, validate_lot_id
+
+# Mã trạng thái = thứ tự khai báo trong ParkingStatus
+STATUS_NAMES = [status.name for status in ParkingStatus]
+ENTERING, PARKED, MOVING, EXITING = (STATUS_NAMES.index(name) for name in
+                                     ("ENTERING", "PARKED", "MOVING", "EXITING"))
+NO_VEHICLE = -1
+
+
+class EventBatch:
+    """Lô event của một tick dưới dạng cột (chỉ số slot, chỉ số biển số, mã trạng thái)"""
+
+    def __init__(self, timestamp_unix, slot_id, plate_id, status_code):
+        self.timestamp_unix = timestamp_unix
+        self.slot_id = slot_id
+        self.plate_id = plate_id
+        self.status_code = status_code
+
+    def __len__(self):
+        return len(self.slot_id)
+
+
+class VectorParkingSimulator:
+    """
+    Mô phỏng bãi đỗ với trạng thái xe lưu trong mảng NumPy
+
+    Mỗi hàng là một xe; status = NO_VEHICLE nghĩa là hàng đang trống.
+    Số hàng = 2 x số vị trí vì xe EXITING đã trả vị trí nhưng vẫn còn trong bãi.
+    """
+
+    def __init__(self, locations=None, license_plates=None, occupancy=0.9, step_probability=0.5,
+                 max_arrivals_per_tick=None, seed=None, lot_id=DEFAULT_LOT_ID):
+        """
+        Args:
+            locations (list): Danh sách vị trí đỗ
+            license_plates (list): Danh sách biển số (nên >= 2 x số vị trí)
+            occupancy (float): Tỷ lệ lấp đầy mục tiêu (0-1)
+            step_probability (float): Xác suất mỗi xe chuyển trạng thái trong một tick
+            max_arrivals_per_tick (int): Số xe vào tối đa mỗi tick (mặc định: không giới hạn)
+            seed (int): Seed cho bộ sinh số ngẫu nhiên
+            lot_id (str): Bãi đỗ gắn vào mọi event/frame
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy chưa được cài đặt")
+
+        self.locations = np.array(locations or ParkingEvent.PARKING_LOCATIONS, dtype=object)
+        self.license_plates = np.array(license_plates or ParkingEvent.LICENSE_PLATES, dtype=object)
+        self.occupancy = occupancy
+        self.step_probability = step_probability
+        self.max_arrivals_per_tick = max_arrivals_per_tick
+        self.rng = np.random.default_rng(seed)
+        self.lot_id = validate_lot_id(lot_id)
+
+        capacity = 2 * len(self.locations)
+        self.status = np.full(capacity, NO_VEHICLE, dtype=np.int8)
+        self.parked_count = np.zeros(capacity, dtype=np.int32)
+        self.parked_duration = np.zeros(capacity, dtype=np.int32)
+        self.slot_id = np.full(capacity, -1, dtype=np.int32)
+        self.plate_id = np.full(capacity, -1, dtype=np.int32)
+
+        self.slot_free = np.ones(len(self.locations), dtype=bool)
+        self.plate_free = np.ones(len(self.license_plates), dtype=bool)
+        self._frame_slots = None
+
+    @property
+    def occupied_count(self):
+        return int(len(self.slot_free) - self.slot_free.sum())
+
+    @property
+    def vehicle_count(self):
+        return int((self.status != NO_VEHICLE).sum())
+
+    def _admit(self):
+        """Cho xe mới vào để đưa tỷ lệ lấp đầy về mức mục tiêu"""
+        target = int(self.occupancy * len(self.locations))
+        wanted = target - self.occupied_count
+        if self.max_arrivals_per_tick is not None:
+            wanted = min(wanted, self.max_arrivals_per_tick)
+        if wanted <= 0:
+            return
+
+        free_rows = np.flatnonzero(self.status == NO_VEHICLE)
+        free_slots = np.flatnonzero(self.slot_free)
+        free_plates = np.flatnonzero(self.plate_free)
+        k = min(wanted, len(free_rows), len(free_slots), len(free_plates))
+        if k <= 0:
+            return
+
+        rows = free_rows[:k]
+        slots = self.rng.choice(free_slots, size=k, replace=False)
+        plates = self.rng.choice(free_plates, size=k, replace=False)
+
+        self.status[rows] = ENTERING
+        self.parked_count[rows] = 0
+        self.parked_duration[rows] = 0
+        self.slot_id[rows] = slots
+        self.plate_id[rows] = plates
+        self.slot_free[slots] = False
+        self.plate_free[plates] = False
+
+    def tick(self, now=None):
+        """
+        Chuyển trạng thái một loạt xe ngẫu nhiên và trả về EventBatch
+
+        Event mang trạng thái trước khi chuyển, giống ParkingSimulator.step.
+
+        Args:
+            now (int): Unix timestamp gắn cho cả lô (mặc định: time.time())
+        """
+        self._admit()
+
+        active = self.status != NO_VEHICLE
+        rows = np.flatnonzero(active & (self.rng.random(len(self.status)) < self.step_probability))
+        status = self.status[rows]
+
+        batch = EventBatch(
+            int(time.time()) if now is None else int(now),
+            self.slot_id[rows].copy(),
+            self.plate_id[rows].copy(),
+            status.copy()
+        )
+
+        # ENTERING -> PARKED
+        entering = rows[status == ENTERING]
+        self.status[entering] = PARKED
+        self.parked_duration[entering] = self.rng.integers(20, 201, size=len(entering))
+        self.parked_count[entering] = 0
+
+        # PARKED -> đếm thời gian đỗ, đủ thì MOVING
+        parked = rows[status == PARKED]
+        self.parked_count[parked] += 1
+        done = parked[self.parked_count[parked] >= self.parked_duration[parked]]
+        self.status[done] = MOVING
+
+        # MOVING -> EXITING, giải phóng vị trí (giữ biển số đến khi xe rời bãi)
+        moving = rows[status == MOVING]
+        self.status[moving] = EXITING
+        self.slot_free[self.slot_id[moving]] = True
+
+        # EXITING -> xe rời bãi, trả biển số
+        exiting = rows[status == EXITING]
+        self.plate_free[self.plate_id[exiting]] = True
+        self.status[exiting] = NO_VEHICLE
+        self.slot_id[exiting] = -1
+        self.plate_id[exiting] = -1
+
+        return batch
+
+    def floor_frames(self, now=None, seq=0):
+        """
+        Occupancy frame của mọi tầng (xem parking_frames.py), tạo bằng np.packbits
+
+        Args:
+            now (int): Unix timestamp của frame (mặc định: time.time())
+            seq (int): Số thứ tự frame
+        """
+        if self._frame_slots is None:
+            # Mỗi tầng: mảng slot_id theo thứ tự bit, -1 nếu tầng không có vị trí đó
+            layout = floor_layout(self.locations)
+            self._frame_slots = {floor: np.full(count, -1, dtype=np.int64) for floor, count in layout.items()}
+            for slot_id, location in enumerate(self.locations):
+                m = LOCATION_PATTERN.match(location)
+                self._frame_slots[m.group(1)][int(m.group(2)) - 1] = slot_id
+
+        now = time.time() if now is None else now
+        # Biển số theo slot; phần tử cuối là -1 cho chỉ số slot -1
+        slot_plate = np.full(len(self.locations) + 1, -1, dtype=np.int64)
+        held = (self.status == ENTERING) | (self.status == PARKED) | (self.status == MOVING)
+        slot_plate[self.slot_id[held]] = self.plate_id[held]
+
+        timestamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+        frames = []
+        for floor in sorted(self._frame_slots):
+            plates = slot_plate[self._frame_slots[floor]]
+            occupied = plates >= 0
+            frames.append(make_frame(
+                floor, len(plates),
+                np.packbits(occupied, bitorder='little').tobytes(),
+                self.license_plates[plates[occupied]].tolist(),
+                now, seq, timestamp, self.lot_id
+            ))
+        return frames
+
+    def to_records(self, batch):
+        """Chuyển EventBatch thành list dict cùng định dạng ParkingEvent.get_event_info"""
+        timestamp = datetime.fromtimestamp(batch.timestamp_unix).strftime("%Y-%m-%d %H:%M:%S")
+        locations = self.locations[batch.slot_id]
+        plates = self.license_plates[batch.plate_id]
+        status_names = [STATUS_NAMES[code] for code in batch.status_code]
+        return [
+            {
+                "timestamp": timestamp,
+                "timestamp_unix": batch.timestamp_unix,
+                "license_plate": plate,
+                "location": location,
+                "status_code": status_name,
+                "lot_id": self.lot_id
+            }
+            for plate, location, status_name in zip(plates, locations, status_names)
+        ]
+
+
+def parking_stream_vectorized(duration_minutes=30, tick_interval=1.0, kafka_broker=None,
+                              kafka_topic="parking-events", locations=None, license_plates=None,
+                              occupancy=0.9, step_probability=0.5, seed=None, quiet=False,
+                              linger_ms=20, batch_size=131072, compression_type=None, record_path=None,
+                              wire_format='json', frame_interval=None, frames_topic="parking-frames",
+                              frames_only=False, lot_id=DEFAULT_LOT_ID):
+    """
+    Chạy engine vector hóa và gửi từng lô event lên Kafka (chế độ pipelined)
+
+    Args:
+        duration_minutes (int): Thời gian chạy (phút)
+        tick_interval (float): Thời gian giữa hai tick (giây), 0 = nhanh nhất có thể
+        kafka_broker (str): Địa chỉ Kafka broker, None = in ra console
+        kafka_topic (str): Tên Kafka topic
+        quiet (bool): Không in từng event ở chế độ console (chỉ đếm, để đo tốc độ sinh)
+        record_path (str): Ghi các event vào event log để replay (xem parking_event_log.py)
+        wire_format (str): 'json' hoặc 'binary' (xem parking_wire_format.py)
+        frame_interval (float): Chu kỳ gửi occupancy frame của mỗi tầng (giây), None = không gửi
+        frames_topic (str): Topic nhận occupancy frame
+        frames_only (bool): Chỉ gửi frame, không gửi event từng xe
+        lot_id (str): Bãi đỗ gắn vào mọi event/frame, cũng là Kafka key
+    """
+    producer = None
+    stats = DeliveryStats()
+    if kafka_broker and KAFKA_AVAILABLE:
+        try:
+            producer = create_kafka_producer(
+                kafka_broker,
+                fast_mode=True,
+                linger_ms=linger_ms,
+                batch_size=batch_size,
+                compression_type=compression_type,
+                value_serializer=serialize_event if wire_format == 'json' else None
+            )
+            print(f"✅ Đã kết nối Kafka broker: {kafka_broker}")
+            print(f"✅ Topic: {kafka_topic}")
+        except Exception as e:
+            print(f"⚠️  Không thể kết nối Kafka: {e}")
+            print("⚠️  Sẽ chỉ in ra console thay vì gửi lên Kafka")
+            producer = None
+    elif kafka_broker and not KAFKA_AVAILABLE:
+        print("⚠️  kafka-python chưa được cài đặt. Chỉ in ra console.")
+
+    simulator = VectorParkingSimulator(
+        locations=locations,
+        license_plates=license_plates,
+        occupancy=occupancy,
+        step_probability=step_probability,
+        seed=seed,
+        lot_id=lot_id
+    )
+    print(f"🅿️  Bãi đỗ {lot_id}: {len(simulator.locations)} vị trí, {len(simulator.license_plates)} biển số, "
+          f"lấp đầy mục tiêu {occupancy:.0%}")
+
+    recorder = None
+    if record_path:
+        from parking_event_log import EventLogWriter
+        recorder = EventLogWriter(record_path, metadata={
+            "source": "parking_vector_engine",
+            "seed": seed,
+            "locations": len(simulator.locations),
+            "license_plates": len(simulator.license_plates),
+            "occupancy": occupancy,
+            "tick_interval": tick_interval
+        })
+        print(f"💾 Ghi event log: {record_path}")
+
+    if frame_interval:
+        print(f"📷 Occupancy frame mỗi {frame_interval}s -> topic {frames_topic}"
+              f"{' (không gửi event từng xe)' if frames_only else ''}")
+
+    start_time = time.time()
+    end_time = start_time + (duration_minutes * 60)
+    event_count = 0
+    frame_count = 0
+    last_frame = None
+    try:
+        while time.time() < end_time:
+            tick_start = time.time()
+            batch = simulator.tick()
+            if recorder:
+                for event_data in simulator.to_records(batch):
+                    recorder.append(event_data, emit_time=tick_start)
+
+            if frame_interval and (last_frame is None or tick_start - last_frame >= frame_interval):
+                last_frame = tick_start
+                frames = simulator.floor_frames(int(tick_start), seq=frame_count)
+                if producer:
+                    send_frames(producer, frames_topic, frames, stats, wire_format)
+                elif not quiet:
+                    for frame in frames:
+                        print(json.dumps(frame, ensure_ascii=False))
+                frame_count += 1
+
+            if frames_only:
+                if producer:
+                    producer.flush()
+            elif producer:
+                for event_data in simulator.to_records(batch):
+                    send_event(producer, kafka_topic, event_data, stats, wire_format)
+                producer.flush()
+            elif not quiet:
+                for event_data in simulator.to_records(batch):
+                    print(json.dumps(event_data, ensure_ascii=False))
+            if not frames_only:
+                event_count += len(batch)
+
+            elapsed = time.time() - start_time
+            print(f"📤 Tick: {len(batch)} events | có xe: {simulator.occupied_count} | "
+                  f"tổng: {event_count} ({event_count / max(elapsed, 1e-9):,.0f} events/s)"
+                  f"{f' | frame: {frame_count}' if frame_interval else ''}")
+
+            if tick_interval > 0:
+                time.sleep(max(0.0, tick_interval - (time.time() - tick_start)))
+
+    except KeyboardInterrupt:
+        print("\n⚠️  Đã dừng bởi người dùng (Ctrl+C)")
+
+    finally:
+        if recorder:
+            recorder.close()
+            print(f"💾 Đã ghi {recorder.count} events vào {record_path}")
+        if producer:
+            producer.flush()
+            producer.close()
+            print(f"\n✅ Hoàn thành! Tổng cộng đã gửi {event_count} events lên Kafka")
+            print(f"📊 {stats.summary()}")
+        else:
+            print(f"\n✅ Hoàn thành! Tổng cộng đã tạo {event_count} events")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Mô phỏng bãi đỗ lớn bằng NumPy và gửi lô event lên Kafka')
+    parser.add_argument('--kafka-broker', type=str,
+                       default=os.getenv('KAFKA_BROKER', 'localhost:9092'),
+                       help='Địa chỉ Kafka broker (mặc định: localhost:9092 hoặc từ biến môi trường KAFKA_BROKER)')
+    parser.add_argument('--topic', type=str, default='parking-events',
+                       help='Tên Kafka topic (mặc định: parking-events)')
+    parser.add_argument('--duration', type=int, default=30,
+                       help='Thời gian chạy (phút, mặc định: 30)')
+    parser.add_argument('--tick-interval', type=float, default=1.0,
+                       help='Thời gian giữa hai tick (giây, mặc định: 1.0, 0 = nhanh nhất)')
+    parser.add_argument('--lot-id', type=str, default=os.getenv('LOT_ID', DEFAULT_LOT_ID),
+                       help=f'Mã bãi đỗ gắn vào event, cũng là Kafka key (mặc định: {DEFAULT_LOT_ID} hoặc từ biến môi trường LOT_ID)')
+    parser.add_argument('--floors', type=int, default=6,
+                       help='Số tầng của bãi đỗ (mặc định: 6)')
+    parser.add_argument('--slots-per-floor', type=int, default=1000,
+                       help='Số vị trí mỗi tầng (mặc định: 1000)')
+    parser.add_argument('--num-plates', type=int, default=0,
+                       help='Số biển số sinh ngẫu nhiên (mặc định: 0 = 2 x số vị trí)')
+    parser.add_argument('--occupancy', type=float, default=0.9,
+                       help='Tỷ lệ lấp đầy mục tiêu (mặc định: 0.9)')
+    parser.add_argument('--step-probability', type=float, default=0.5,
+                       help='Xác suất mỗi xe chuyển trạng thái trong một tick (mặc định: 0.5)')
+    parser.add_argument('--seed', type=int, default=None,
+                       help='Seed cho bộ sinh số ngẫu nhiên')
+    parser.add_argument('--no-kafka', action='store_true',
+                       help='Không gửi lên Kafka, chỉ in ra console')
+    parser.add_argument('--quiet', action='store_true',
+                       help='Không in từng event ở chế độ console')
+    parser.add_argument('--wire-format', type=str, default='json', choices=WIRE_FORMATS,
+                       help='Định dạng message: json hoặc binary gọn (mặc định: json)')
+    parser.add_argument('--record', type=str, default=None,
+                       help='Ghi các event vào file event log để replay (parking_event_log.py)')
+    parser.add_argument('--frame-interval', type=float, default=None,
+                       help='Gửi occupancy frame của mỗi tầng theo chu kỳ này (giây, mặc định: tắt)')
+    parser.add_argument('--frames-topic', type=str, default='parking-frames',
+                       help='Topic nhận occupancy frame (mặc định: parking-frames)')
+    parser.add_argument('--frames-only', action='store_true',
+                       help='Chỉ gửi occupancy frame, không gửi event từng xe (dùng với --frame-interval)')
+    parser.add_argument('--linger-ms', type=int, default=20,
+                       help='Thời gian gom batch của producer (ms, mặc định: 20)')
+    parser.add_argument('--batch-size', type=int, default=131072,
+                       help='Kích thước batch mỗi partition (bytes, mặc định: 131072)')
+    parser.add_argument('--compression', type=str, default='none',
+                       choices=['none', 'gzip', 'snappy', 'lz4', 'zstd'],
+                       help='Kiểu nén batch (mặc định: none)')
+
+    args = parser.parse_args()
+    try:
+        validate_lot_id(args.lot_id)
+    except ValueError as e:
+        parser.error(str(e))
+
+    locations = generate_parking_locations(args.floors, args.slots_per_floor)
+    num_plates = args.num_plates or 2 * len(locations)
+
+    print("=" * 60)
+    print("🚗 MÔ PHỎNG BÃI ĐỖ LỚN - ENGINE VECTOR HÓA (NUMPY)")
+    print("=" * 60)
+
+    parking_stream_vectorized(
+        duration_minutes=args.duration,
+        tick_interval=args.tick_interval,
+        kafka_broker=None if args.no_kafka else args.kafka_broker,
+        kafka_topic=args.topic,
+        locations=locations,
+        license_plates=generate_license_plates(num_plates, seed=args.seed),
+        occupancy=args.occupancy,
+        step_probability=args.step_probability,
+        seed=args.seed,
+        quiet=args.quiet,
+        linger_ms=args.linger_ms,
+        batch_size=args.batch_size,
+        compression_type=None if args.compression == 'none' else args.compression,
+        record_path=args.record,
+        wire_format=args.wire_format,
+        frame_interval=args.frame_interval,
+        frames_topic=args.frames_topic,
+        frames_only=args.frames_only,
+        lot_id=args.lot_id
+    )
@@ -0,0 +1,213 @@
+"""
+Wire Format - Định dạng nhị phân gọn cho topic parking-events và parking-status
+
+Định dạng được thỏa thuận qua Kafka header 'content-type' của từng message:
+- không có header hoặc 'application/json'  -> JSON như cũ
+- 'application/x-parking-event.v1'          -> event nhị phân v1 (17 bytes)
+- 'application/x-parking-status.v1'         -> status nhị phân v1 (39 bytes)
+nên client JSON và client nhị phân có thể chạy song song trong lúc chuyển đổi.
+
+Chuỗi được "intern" bằng bảng mã cố định, không cần gửi kèm từ điển:
+- status_code / status   -> chỉ số trong EVENT_STATUS_CODES / OUTPUT_STATUS_CODES
+- location "C12"         -> tầng (uint8, A=0) + số vị trí (uint16)
+- biển số "51C-12345"    -> uint32 = (tỉnh x 26 + chữ cái) x 100000 + số
+Record có location/biển số không theo mẫu trên được gửi bằng JSON.
+
+Layout event v1 (big-endian):
+    version B | status B | floor B | slot H | plate I | timestamp_unix q
+Layout status v1 (big-endian):
+    version B | status B | floor B | slot H | plate I | parked_duration_seconds I |
+    parked_blocks H | total_cost q (VNĐ) | event_timestamp_unix q | last_update q (epoch ms)
+Giá trị null được mã hóa bằng NULL_U32.
+
+Bãi đỗ (lot_id) không nằm trong layout nhị phân: Kafka key của event, frame và dòng
+trạng thái là lot_id (mọi message của một bãi vào cùng một partition), JSON mang thêm
+trường "lot_id". Message cũ (key là location/tầng, không có lot_id) thuộc DEFAULT_LOT_ID,
+nên lot_id có dạng location/tầng ("P1", "B") bị từ chối (validate_lot_id): key của nó
+không phân biệt được với key cũ.
+"""
+
+import json
+import re
+import struct
+from datetime import datetime
+
+CONTENT_TYPE_HEADER = 'content-type'
+JSON_CONTENT_TYPE = 'application/json'
+EVENT_V1_CONTENT_TYPE = 'application/x-parking-event.v1'
+STATUS_V1_CONTENT_TYPE = 'application/x-parking-status.v1'
+
+WIRE_FORMATS = ('json', 'binary')
+
+VERSION_1 = 1
+NULL_U32 = 0xFFFFFFFF
+
+EVENT_STATUS_CODES = ('ENTERING', 'PARKED', 'MOVING', 'EXITING')
+OUTPUT_STATUS_CODES = ('EMPTY', 'OCCUPIED', 'UNKNOWN')
+
+EVENT_V1 = struct.Struct(">BBBHIq")
+STATUS_V1 = struct.Struct(">BBBHIIHqqq")
+
+LOCATION_PATTERN = re.compile(r'^([A-Z])([0-9]{1,5})$')
+PLATE_PATTERN = re.compile(r'^([0-9]{2})([A-Z])-([0-9]{5})$')
+# Key cũ: location ("C12") hoặc tầng ("C") của producer trước khi có lot_id
+LEGACY_KEY_PATTERN = re.compile(r'^[A-Z]([0-9]{1,5})?$')
+
+DEFAULT_LOT_ID = 'default'
+
+
+def encode_location(location):
+    """'C12' -> (2, 12), None nếu không theo mẫu"""
+    m = LOCATION_PATTERN.match(location or '')
+    if not m or int(m.group(2)) > 0xFFFF:
+        return None
+    return ord(m.group(1)) - ord('A'), int(m.group(2))
+
+
+def decode_location(floor, slot):
+    return f"{chr(ord('A') + floor)}{slot}"
+
+
+def encode_plate(plate):
+    """'51C-12345' -> mã uint32, None nếu không theo mẫu"""
+    m = PLATE_PATTERN.match(plate or '')
+    if not m:
+        return None
+    return (int(m.group(1)) * 26 + ord(m.group(2)) - ord('A')) * 100000 + int(m.group(3))
+
+
+def decode_plate(code):
+    if code == NULL_U32:
+        return None
+    prefix, number = divmod(code, 100000)
+    province, letter = divmod(prefix, 26)
+    return f"{province:02d}{chr(ord('A') + letter)}-{number:05d}"
+
+
+def validate_lot_id(lot_id):
+    """
+    Kiểm tra lot_id dùng được làm Kafka key
+
+    Raises:
+        ValueError: lot_id rỗng hoặc có dạng location/tầng (trùng với key cũ, message nhị
+            phân của bãi đó sẽ bị gộp vào DEFAULT_LOT_ID)
+    """
+    if not lot_id:
+        raise ValueError("lot_id không được rỗng")
+    if LEGACY_KEY_PATTERN.match(lot_id):
+        raise ValueError(f"lot_id '{lot_id}' có dạng vị trí/tầng (như A12, B), trùng với Kafka key cũ; "
+                         f"hãy dùng tên khác, ví dụ hanoi-01")
+    return lot_id
+
+
+def lot_key(record):
+    """Kafka key (bytes) của event/frame/dòng trạng thái: lot_id của record"""
+    return (record.get("lot_id") or DEFAULT_LOT_ID).encode('utf-8')
+
+
+def record_lot_id(record, key=None):
+    """
+    lot_id của một message đã giải mã
+
+    Lấy trường "lot_id" (JSON), nếu không có thì lấy Kafka key (message nhị phân),
+    key cũ theo location/tầng hoặc không có key thì là DEFAULT_LOT_ID.
+    """
+    lot_id = record.get("lot_id") if record else None
+    if lot_id:
+        return lot_id
+    if isinstance(key, (bytes, bytearray)):
+        key = key.decode('utf-8', errors='replace')
+    if key and not LEGACY_KEY_PATTERN.match(key):
+        return key
+    return DEFAULT_LOT_ID
+
+
+def get_content_type(headers):
+    """Lấy content-type từ Kafka headers (list các tuple (key, bytes)), mặc định JSON"""
+    for key, value in headers or ():
+        if key == CONTENT_TYPE_HEADER:
+            return value.decode('utf-8') if isinstance(value, (bytes, bytearray)) else value
+    return JSON_CONTENT_TYPE
+
+
+def encode_event(event_data, wire_format='json'):
+    """
+    Serialize event cho topic parking-events
+
+    Returns:
+        (bytes, headers): value và Kafka headers tương ứng
+    """
+    if wire_format == 'binary':
+        location = encode_location(event_data.get("location"))
+        plate = encode_plate(event_data.get("license_plate"))
+        status = event_data.get("status_code")
+        if location is not None and plate is not None and status in EVENT_STATUS_CODES:
+            value = EVENT_V1.pack(VERSION_1, EVENT_STATUS_CODES.index(status), location[0], location[1],
+                                  plate, int(event_data["timestamp_unix"]))
+            return value, [(CONTENT_TYPE_HEADER, EVENT_V1_CONTENT_TYPE.encode('utf-8'))]
+    value = json.dumps(event_data, ensure_ascii=False).encode('utf-8')
+    return value, [(CONTENT_TYPE_HEADER, JSON_CONTENT_TYPE.encode('utf-8'))]
+
+
+def decode_event(value, headers=None):
+    """Giải mã value của topic parking-events thành dict cùng dạng get_event_info"""
+    if get_content_type(headers) == EVENT_V1_CONTENT_TYPE:
+        _, status, floor, slot, plate, ts = EVENT_V1.unpack(value)
+        return {
+            "timestamp": datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S"),
+            "timestamp_unix": ts,
+            "license_plate": decode_plate(plate),
+            "location": decode_location(floor, slot),
+            "status_code": EVENT_STATUS_CODES[status]
+        }
+    return json.loads(value.decode('utf-8'))
+
+
+def encode_status(row):
+    """
+    Serialize một dòng trạng thái (dict như Spark ghi lên parking-status)
+
+    Returns:
+        (bytes, headers): nhị phân v1 nếu mã hóa được, ngược lại JSON
+    """
+    location = encode_location(row.get("location"))
+    plate_str = row.get("license_plate")
+    plate = NULL_U32 if plate_str is None else encode_plate(plate_str)
+    status = row.get("status")
+    if location is not None and plate is not None and status in OUTPUT_STATUS_CODES:
+        minutes = row.get("parked_duration_minutes")
+        last_update = row.get("last_update")
+        if isinstance(last_update, str):
+            last_update = datetime.fromisoformat(last_update).timestamp()
+        value = STATUS_V1.pack(
+            VERSION_1,
+            OUTPUT_STATUS_CODES.index(status),
+            location[0], location[1],
+            plate,
+            NULL_U32 if minutes is None else int(round(minutes * 60)),
+            int(row.get("parked_blocks") or 0),
+            int(round(row.get("total_cost") or 0)),
+            int(row.get("event_timestamp_unix") or 0),
+            int((last_update or 0) * 1000)
+        )
+        return value, [(CONTENT_TYPE_HEADER, STATUS_V1_CONTENT_TYPE.encode('utf-8'))]
+    value = json.dumps(row, ensure_ascii=False, default=str).encode('utf-8')
+    return value, [(CONTENT_TYPE_HEADER, JSON_CONTENT_TYPE.encode('utf-8'))]
+
+
+def decode_status(value, headers=None):
+    """Giải mã value của topic parking-status thành dict (cùng key với JSON của Spark)"""
+    if get_content_type(headers) == STATUS_V1_CONTENT_TYPE:
+        (_, status, floor, slot, plate, seconds, blocks, cost,
+         event_ts, last_update_ms) = STATUS_V1.unpack(value)
+        return {
+            "location": decode_location(floor, slot),
+            "status": OUTPUT_STATUS_CODES[status],
+            "license_plate": decode_plate(plate),
+            "parked_duration_minutes": None if seconds == NULL_U32 else seconds / 60.0,
+            "parked_blocks": blocks,
+            "total_cost": float(cost),
+            "event_timestamp_unix": event_ts,
+            "last_update": datetime.fromtimestamp(last_update_ms / 1000.0).isoformat()
+        }
+    return json.loads(value.decode('utf-8'))
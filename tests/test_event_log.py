@@ -0,0 +1,79 @@
+"""
+Test event log (parking_event_log.py): index, đọc ngẫu nhiên, record ghi dở và phát lại một
+khoảng [start, end)
+"""
+
+import io
+import json
+
+import pytest
+
+from parking_event_log import EventLogReader, EventLogWriter, replay
+
+T0 = 1767225600
+
+
+def make_events(n):
+    return [{"timestamp_unix": T0 + i, "license_plate": f"29A-{i:05d}", "location": f"A{i + 1}",
+             "status_code": "ENTERING", "lot_id": "hanoi-01"} for i in range(n)]
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = str(tmp_path / "events.log")
+    with EventLogWriter(path, {"seed": 42}) as writer:
+        for i, event in enumerate(make_events(5)):
+            writer.append(event, emit_time=T0 + i * 2)
+    return path
+
+
+def test_index_random_access_and_append(log_path):
+    reader = EventLogReader(log_path)
+    try:
+        assert len(reader) == 5
+        assert reader.metadata == {"seed": 42}
+        assert reader.read(3)["location"] == "A4"
+        key, _, emit_time = reader.read_raw(4)
+        assert key == b"hanoi-01" and emit_time == T0 + 8
+    finally:
+        reader.close()
+
+    # Ghi tiếp vào log đã có: metadata không bị ghi lại, index nối tiếp
+    with EventLogWriter(log_path, {"seed": 0}) as writer:
+        writer.append(make_events(6)[5], emit_time=T0 + 10)
+    reader = EventLogReader(log_path)
+    try:
+        assert len(reader) == 6 and reader.metadata == {"seed": 42}
+        assert reader.read(5)["location"] == "A6"
+    finally:
+        reader.close()
+
+
+def test_truncated_record_is_ignored(log_path):
+    with open(log_path, "rb+") as f:
+        f.truncate(f.seek(0, 2) - 3)
+    reader = EventLogReader(log_path)
+    try:
+        assert len(reader) == 4
+    finally:
+        reader.close()
+
+
+def test_replay_range(log_path):
+    reader = EventLogReader(log_path)
+    try:
+        out = io.StringIO()
+        assert replay(reader, start=1, end=3, speed=0, out=out) == 2
+        assert [json.loads(line)["location"] for line in out.getvalue().splitlines()] == ["A2", "A3"]
+        assert replay(reader, start=4, end=100, speed=0, out=io.StringIO()) == 1
+        assert replay(reader, start=3, end=3, speed=0, out=io.StringIO()) == 0
+    finally:
+        reader.close()
+
+
+def test_not_an_event_log(tmp_path):
+    path = tmp_path / "other.log"
+    path.write_bytes(b"hello")
+    (tmp_path / "other.log.idx").write_bytes(b"")
+    with pytest.raises(ValueError):
+        EventLogReader(str(path))
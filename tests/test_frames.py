@@ -0,0 +1,45 @@
+"""
+Test occupancy frame (parking_frames.py): đóng gói / trải frame và diff_frames giữa hai
+frame liên tiếp của một tầng
+"""
+
+import pytest
+
+from parking_frames import build_floor_frames, diff_frames, expand_frame, floor_layout
+
+T0 = 1767225600
+
+
+def test_frames_round_trip():
+    layout = floor_layout([f"{floor}{i}" for floor in "AB" for i in range(1, 11)])
+    assert layout == {"A": 10, "B": 10}
+    occupied = {"A1": "29A-11111", "A9": "30B-22222", "B10": "51C-33333"}
+    frames = build_floor_frames(layout, occupied, T0, seq=3, lot_id="hanoi-01")
+
+    assert [(f["floor"], f["seq"], f["lot_id"]) for f in frames] == [("A", 3, "hanoi-01"), ("B", 3, "hanoi-01")]
+    expanded = {}
+    for frame in frames:
+        expanded.update(expand_frame(frame))
+    assert len(expanded) == 20
+    assert {loc: plate for loc, plate in expanded.items() if plate} == occupied
+
+
+def test_floor_layout_rejects_unknown_location():
+    with pytest.raises(ValueError):
+        floor_layout(["A1", "lobby"])
+
+
+def test_diff_frames():
+    layout = {"A": 4}
+    first = expand_frame(build_floor_frames(layout, {"A1": "29A-11111"}, T0)[0])
+    # Chưa có frame trước: mọi vị trí là thay đổi
+    assert diff_frames(None, first) == {"A1": "29A-11111", "A2": None, "A3": None, "A4": None}
+    assert diff_frames(first, first) == {}
+
+    second = expand_frame(build_floor_frames(
+        layout, {"A1": "29A-11111", "A3": "30B-22222"}, T0 + 5)[0])
+    assert diff_frames(first, second) == {"A3": "30B-22222"}
+
+    # Xe rời A1, xe khác vào đúng vị trí A3
+    third = expand_frame(build_floor_frames(layout, {"A3": "51C-33333"}, T0 + 10)[0])
+    assert diff_frames(second, third) == {"A1": None, "A3": "51C-33333"}
@@ -0,0 +1,54 @@
+"""
+Test FreePool (parking_json_stream.py): tập phần tử trống với acquire / take / release O(1)
+"""
+
+import random
+
+from parking_json_stream import FreePool
+
+
+def check_consistent(pool):
+    """Mảng phần tử trống và map chỉ số luôn khớp nhau"""
+    assert len(pool._index) == len(pool._free)
+    for i, item in enumerate(pool._free):
+        assert pool._index[item] == i
+
+
+def test_acquire_take_release():
+    pool = FreePool(["A1", "A2", "A3"])
+    assert pool.take("A2") and "A2" not in pool
+    assert not pool.take("A2")
+    check_consistent(pool)
+
+    taken = {pool.acquire(), pool.acquire()}
+    assert taken == {"A1", "A3"}
+    assert pool.acquire() is None and len(pool) == 0
+
+    pool.release("A3")
+    pool.release("A3")          # đã trống: bỏ qua
+    assert len(pool) == 1 and pool.acquire() == "A3"
+    assert pool.all_items == ["A1", "A2", "A3"]
+
+
+def test_random_operations_keep_index_consistent():
+    random.seed(7)
+    items = [f"P{i}" for i in range(50)]
+    pool = FreePool(items)
+    used = set()
+    for _ in range(2000):
+        op = random.random()
+        if op < 0.4:
+            item = pool.acquire()
+            if item is not None:
+                assert item not in used
+                used.add(item)
+        elif op < 0.6:
+            item = random.choice(items)
+            assert pool.take(item) == (item not in used)
+            used.add(item)
+        elif used:
+            item = random.choice(sorted(used))
+            pool.release(item)
+            used.discard(item)
+        check_consistent(pool)
+        assert set(pool._free) == set(items) - used
@@ -0,0 +1,47 @@
+"""
+Test AdaptiveRateController.propose (parking_spark_streaming.py): giới hạn maxOffsetsPerTrigger
+mới từ số dòng và thời gian của một batch
+"""
+
+import pytest
+
+pytest.importorskip("pyspark")
+from parking_spark_streaming import AdaptiveRateController
+
+
+@pytest.fixture
+def controller():
+    return AdaptiveRateController(10000, target_seconds=5.0, min_limit=1000, max_limit=100000)
+
+
+def test_slow_batch_shrinks_to_target(controller):
+    # 10000 dòng trong 10s = 1000 dòng/s -> 1000 x 5s x headroom 0.8
+    assert controller.propose(10000, 10.0) == 4000
+
+
+def test_full_fast_batch_grows_at_most_double(controller):
+    assert controller.propose(10000, 1.0) == 20000
+    # Nhanh nhưng chưa đầy giới hạn: không đuổi backlog, giữ nguyên
+    assert controller.propose(5000, 1.0) is None
+
+
+def test_within_tolerance_or_empty_keeps_limit(controller):
+    # Chậm hơn mục tiêu một chút nhưng giới hạn mới (~9400) lệch không quá 25%: giữ nguyên
+    assert controller.propose(12000, 5.1) is None
+    assert controller.propose(0, 3.0) is None
+    assert controller.propose(10000, 0) is None
+
+
+def test_clamped_to_bounds(controller):
+    assert controller.propose(10000, 1000.0) == 1000
+    controller.limit = 60000
+    assert controller.propose(60000, 0.1) == 100000
+    # Đã sát max_limit: tăng thêm nằm trong tolerance nên giữ nguyên
+    controller.limit = 90000
+    assert controller.propose(90000, 0.1) is None
+
+
+def test_take_request_applies_and_clears(controller):
+    controller.requested = 4000
+    assert controller.take_request() == 4000
+    assert controller.limit == 4000 and controller.take_request() is None
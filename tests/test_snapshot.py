@@ -0,0 +1,85 @@
+"""
+Test snapshot nguyên tử và gán partition (parking_snapshot.py) với một consumer giả, không
+cần Kafka
+"""
+
+import json
+
+import pytest
+
+pytest.importorskip("kafka")
+from kafka import TopicPartition
+
+from parking_snapshot import PartitionWatcher, load_snapshot, save_snapshot, seek_partitions
+
+
+class FakeConsumer:
+    """Đủ các hàm KafkaConsumer mà seek_partitions / PartitionWatcher dùng"""
+
+    def __init__(self, partitions):
+        self.partitions = partitions    # {topic: set(partition)}
+        self.assigned = []
+        self.offsets = {}
+
+    def partitions_for_topic(self, topic):
+        return self.partitions.get(topic)
+
+    def topics(self):
+        return set(self.partitions)
+
+    def assign(self, partitions):
+        self.assigned = list(partitions)
+
+    def assignment(self):
+        return set(self.assigned)
+
+    def seek(self, tp, offset):
+        self.offsets[tp] = offset
+
+    def seek_to_end(self, *tps):
+        for tp in tps:
+            self.offsets[tp] = "end"
+
+    def seek_to_beginning(self, *tps):
+        for tp in tps:
+            self.offsets[tp] = "beginning"
+
+
+def test_save_and_load_snapshot(tmp_path):
+    path = str(tmp_path / "state.snapshot")
+    save_snapshot(path, {"parking-status:0": 42}, lots={"hanoi-01": {"A1": {"status": "EMPTY"}}})
+    data = load_snapshot(path)
+    assert data["positions"] == {"parking-status:0": 42}
+    assert data["lots"]["hanoi-01"]["A1"]["status"] == "EMPTY"
+
+    # Phiên bản khác hoặc file hỏng: bỏ qua
+    with open(path, "w") as f:
+        json.dump({"version": 0}, f)
+    assert load_snapshot(path) is None
+    with open(path, "w") as f:
+        f.write("{")
+    assert load_snapshot(path) is None
+    assert load_snapshot(str(tmp_path / "missing")) is None
+
+
+def test_seek_partitions_resumes_and_fails_on_missing_topic():
+    consumer = FakeConsumer({"parking-status": {0, 1}})
+    seek_partitions(consumer, ["parking-status"], {"parking-status:1": 7})
+    assert consumer.offsets == {TopicPartition("parking-status", 0): "end",
+                                TopicPartition("parking-status", 1): 7}
+
+    with pytest.raises(RuntimeError):
+        seek_partitions(FakeConsumer({}), ["parking-status"], wait_seconds=0)
+
+
+def test_partition_watcher_assigns_new_partitions_from_beginning():
+    consumer = FakeConsumer({"parking-events": {0}})
+    seek_partitions(consumer, ["parking-events"])
+    watcher = PartitionWatcher(["parking-events"], interval=0)
+
+    assert watcher.check(consumer) == 0
+    consumer.partitions["parking-events"] = {0, 1, 2}
+    assert watcher.check(consumer) == 2
+    assert consumer.assignment() == {TopicPartition("parking-events", p) for p in (0, 1, 2)}
+    assert consumer.offsets[TopicPartition("parking-events", 0)] == "end"
+    assert consumer.offsets[TopicPartition("parking-events", 2)] == "beginning"
@@ -0,0 +1,109 @@
+"""
+Test spool trên đĩa (parking_spool.py): khung length/crc32, commit, mở lại sau khi dừng và
+đếm byte chưa gửi trong bộ nhớ
+"""
+
+import os
+
+import pytest
+
+from parking_spool import EventSpool
+
+
+def disk_pending(spool):
+    """Số byte chưa gửi tính từ kích thước file trên đĩa (để so với bộ đếm trong bộ nhớ)"""
+    spool._active.flush()
+    segment_id, offset = spool._position
+    return sum(os.path.getsize(spool._segment_path(s)) - (offset if s == segment_id else 0)
+               for s in spool._segments if s >= segment_id)
+
+
+def drain_all(spool, batch_size=7):
+    sent = []
+    spool.drain(sent.extend, batch_size=batch_size)
+    return [event["i"] for event in sent]
+
+
+def test_append_drain_in_order_across_segments(tmp_path):
+    spool = EventSpool(str(tmp_path), segment_bytes=300, fsync_policy='never')
+    for i in range(50):
+        spool.append({"i": i, "pad": "x" * 20})
+    assert len(spool._segments) > 1
+    assert spool.pending_bytes() == disk_pending(spool)
+
+    assert drain_all(spool) == list(range(50))
+    assert not spool.has_pending()
+    # Segment đã gửi hết bị xóa, chỉ còn segment đang ghi
+    assert spool._segments == [spool._active_id]
+    spool.close()
+
+
+def test_commit_then_reopen_resumes_after_position(tmp_path):
+    spool = EventSpool(str(tmp_path), segment_bytes=300, fsync_policy='never')
+    for i in range(10):
+        spool.append({"i": i})
+    records, position = spool.read_batch(4)
+    assert [r["i"] for r in records] == [0, 1, 2, 3]
+    spool.commit(position)
+    assert spool.pending_bytes() == disk_pending(spool)
+    spool.close()
+
+    reopened = EventSpool(str(tmp_path), segment_bytes=300, fsync_policy='never')
+    assert reopened.pending_bytes() == disk_pending(reopened)
+    assert drain_all(reopened) == list(range(4, 10))
+    reopened.close()
+
+
+def test_failed_send_is_not_committed(tmp_path):
+    spool = EventSpool(str(tmp_path), fsync_policy='never')
+    for i in range(3):
+        spool.append({"i": i})
+
+    def broker_down(records):
+        raise ConnectionError("broker down")
+
+    with pytest.raises(ConnectionError):
+        spool.drain(broker_down)
+    assert drain_all(spool) == [0, 1, 2]
+    spool.close()
+
+
+def test_torn_and_corrupt_records_are_skipped(tmp_path):
+    spool = EventSpool(str(tmp_path), fsync_policy='never')
+    for i in range(3):
+        spool.append({"i": i})
+    path = spool._segment_path(spool._active_id)
+    spool.close()
+
+    # Record cuối bị ghi dở (producer bị kill giữa chừng)
+    with open(path, "rb+") as f:
+        f.truncate(os.path.getsize(path) - 2)
+    reopened = EventSpool(str(tmp_path), fsync_policy='never')
+    assert drain_all(reopened) == [0, 1]
+    reopened.close()
+
+    # crc sai: dừng đọc segment đó tại record hỏng
+    spool = EventSpool(str(tmp_path / "crc"), fsync_policy='never')
+    for i in range(3):
+        spool.append({"i": i})
+    path = spool._segment_path(spool._active_id)
+    spool.close()
+    with open(path, "rb+") as f:
+        data = bytearray(f.read())
+        data[-2] ^= 0xFF
+        f.seek(0)
+        f.write(data)
+    reopened = EventSpool(str(tmp_path / "crc"), fsync_policy='never')
+    assert drain_all(reopened) == [0, 1]
+    reopened.close()
+
+
+def test_over_capacity(tmp_path):
+    spool = EventSpool(str(tmp_path), max_bytes=100, fsync_policy='never')
+    assert not spool.over_capacity()
+    for i in range(10):
+        spool.append({"i": i})
+    assert spool.over_capacity()
+    drain_all(spool)
+    assert not spool.over_capacity()
+    spool.close()
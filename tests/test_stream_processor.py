@@ -0,0 +1,186 @@
+"""
+Test engine xử lý thuần Python (parking_stream_processor.py) với một event log được phát lại
+
+Event log được ghi bằng parking_event_log.EventLogWriter rồi phát lại ra JSON lines
+(như `parking_event_log.py --no-kafka`), sau đó đi qua FileTransport + run_processor,
+nên không cần Kafka hay Spark.
+"""
+
+import asyncio
+import io
+import json
+
+import pytest
+
+from parking_event_log import EventLogReader, EventLogWriter, replay
+from parking_state import apply_event, completed_stay
+from parking_stream_processor import FileTransport, LocationProcessor, run_processor
+from parking_tariff import calculate_fee, load_tariff
+
+LOT = "hanoi-01"
+T0 = 1767225600  # 2026-01-01 07:00 giờ địa phương (giá ban ngày)
+
+
+def event(location, plate, status_code, ts, lot_id=LOT):
+    return {"timestamp_unix": ts, "license_plate": plate, "location": location,
+            "status_code": status_code, "lot_id": lot_id}
+
+
+EVENTS = [
+    event("A1", "29A-11111", "ENTERING", T0),
+    event("A1", "29A-11111", "PARKED", T0 + 60),
+    event("B2", "30B-22222", "ENTERING", T0 + 100),
+    event("A1", "29A-11111", "PARKED", T0 + 1200),
+    event("A1", "29A-11111", "PARKED", T0 + 30),          # đến trễ: bị bỏ qua
+    event("A1", "99Z-99999", "ENTERING", T0 + 200, lot_id="hcm-01"),  # bãi khác
+    event("B2", "30B-22222", "PARKED", T0 + 700),
+    event("A1", "29A-11111", "EXITING", T0 + 3600),
+    event("B2", "30B-22222", "EXITING", T0 + 7300),
+]
+
+
+def replayed_lines(tmp_path, events=EVENTS):
+    """Ghi events vào event log rồi phát lại dạng JSON lines"""
+    path = str(tmp_path / "events.log")
+    with EventLogWriter(path, {"seed": 1}) as writer:
+        for i, e in enumerate(events):
+            writer.append(e, emit_time=T0 + i)
+    reader = EventLogReader(path)
+    out = io.StringIO()
+    try:
+        assert replay(reader, speed=0, out=out) == len(events)
+    finally:
+        reader.close()
+    return out.getvalue()
+
+
+def run_file(processor, input_path, output_path, snapshot_path=None, bills_path=None):
+    transport = FileTransport(str(input_path), str(output_path), bills_path=bills_path)
+    count = asyncio.run(run_processor(processor, transport, snapshot_path=snapshot_path,
+                                      tick_interval=0.01))
+    with open(output_path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    return count, rows
+
+
+def test_apply_event_keeps_entry_time_and_reports_completed_stay():
+    state = apply_event(None, "29A-11111", "ENTERING", T0)
+    parked = apply_event(state, "29A-11111", "PARKED", T0 + 60)
+    assert parked == ("29A-11111", "PARKED", T0, T0 + 60)
+    assert completed_stay(state, parked) is None
+
+    # Event cũ hơn event cuối: state giữ nguyên
+    assert apply_event(parked, "29A-11111", "PARKED", T0 + 30) is parked
+
+    # Đổi biển số: lượt cũ kết thúc, lượt mới bắt đầu
+    swapped = apply_event(parked, "51C-33333", "PARKED", T0 + 900)
+    assert swapped[2] == T0 + 900
+    assert completed_stay(parked, swapped) == ("29A-11111", T0, T0 + 900)
+
+    exited = apply_event(swapped, "51C-33333", "EXITING", T0 + 1500)
+    assert exited == ("51C-33333", "EXITING", None, T0 + 1500)
+    assert completed_stay(swapped, exited) == ("51C-33333", T0 + 900, T0 + 1500)
+
+
+@pytest.mark.parametrize("emit_mode, expected", [
+    # change: phát khi (trạng thái, biển số, số block) đổi
+    ("change", [("A1", "OCCUPIED", 0), ("B2", "OCCUPIED", 0), ("A1", "OCCUPIED", 2),
+                ("B2", "OCCUPIED", 1), ("A1", "EMPTY", 0), ("B2", "EMPTY", 0)]),
+    # state: phát khi biển số / trạng thái / giờ vào đổi
+    ("state", [("A1", "OCCUPIED", 0), ("A1", "OCCUPIED", 0), ("B2", "OCCUPIED", 0),
+               ("B2", "OCCUPIED", 1), ("A1", "EMPTY", 0), ("B2", "EMPTY", 0)]),
+])
+def test_process_event_emit_modes(emit_mode, expected):
+    tariff = load_tariff()
+    processor = LocationProcessor(tariff=tariff, emit_mode=emit_mode, billing_clock='event', lot_id=LOT)
+    rows = [row for e in EVENTS for row in processor.process_event(e, T0 + 10000)]
+
+    assert [(r["location"], r["status"], r["parked_blocks"]) for r in rows] == expected
+    assert {r["lot_id"] for r in rows} == {LOT}
+    for r in rows:
+        if r["parked_blocks"]:
+            entry = {"A1": T0, "B2": T0 + 100}[r["location"]]
+            assert (r["parked_blocks"], r["total_cost"]) == calculate_fee(
+                r["location"], entry, r["event_timestamp_unix"], tariff)
+
+
+def test_fees_match_spark_vectorized_tariff():
+    """Tiền của engine Python (Tariff.fee) khớp compute_fees mà UDF của Spark dùng"""
+    np = pytest.importorskip("numpy")
+    from parking_tariff import compute_fees
+
+    tariff = load_tariff()
+    processor = LocationProcessor(tariff=tariff, billing_clock='event', lot_id=LOT)
+    stays = [("A1", T0, T0 + 1200), ("F3", T0 + 50000, T0 + 200000), ("C2", T0 - 30000, T0 + 400)]
+    expected = []
+    for i, (location, entry, exit_time) in enumerate(stays):
+        processor.process_event(event(location, f"PLATE-{i}", "PARKED", entry), T0)
+        row, = processor.process_event(event(location, f"PLATE-{i}", "MOVING", exit_time), T0)
+        expected.append((row["parked_blocks"], row["total_cost"]))
+
+    blocks, cost = compute_fees(tariff, [loc[0] for loc, _, _ in stays],
+                                np.array([s[1] for s in stays], dtype=float),
+                                np.array([s[2] for s in stays], dtype=float))
+    assert blocks.tolist() == [b for b, _ in expected]
+    assert cost.tolist() == pytest.approx([c for _, c in expected])
+
+
+def test_file_transport_replayed_log_without_trailing_newline(tmp_path):
+    input_path = tmp_path / "events.jsonl"
+    input_path.write_text(replayed_lines(tmp_path).rstrip("\n"), encoding="utf-8")
+
+    bills_path = tmp_path / "bills.jsonl"
+    processor = LocationProcessor(billing_clock='event', lot_id=LOT)
+    count, rows = run_file(processor, input_path, tmp_path / "status.jsonl", bills_path=str(bills_path))
+
+    assert count == len(EVENTS)
+    # Dòng cuối (không có '\n') vẫn được xử lý: B2 đã trống
+    assert rows[-1]["location"] == "B2" and rows[-1]["status"] == "EMPTY"
+
+    # Mỗi lượt đỗ kết thúc có đúng một hóa đơn, tiền tính đến giờ ra
+    bills = [json.loads(line) for line in bills_path.read_text(encoding="utf-8").splitlines()]
+    assert [(b["bill_id"], b["amount"]) for b in bills] == [
+        (f"{LOT}-A1-{T0}-29A-11111", calculate_fee("A1", T0, T0 + 3600)[1]),
+        (f"{LOT}-B2-{T0 + 100}-30B-22222", calculate_fee("B2", T0 + 100, T0 + 7300)[1]),
+    ]
+
+
+def test_snapshot_resumes_from_file_position(tmp_path):
+    lines = replayed_lines(tmp_path).splitlines(keepends=True)
+    input_path = tmp_path / "events.jsonl"
+    output_path = tmp_path / "status.jsonl"
+    snapshot_path = str(tmp_path / "processor.snapshot")
+
+    input_path.write_text("".join(lines[:4]), encoding="utf-8")
+    count, _ = run_file(LocationProcessor(billing_clock='event', lot_id=LOT),
+                        input_path, output_path, snapshot_path)
+    assert count == 4
+
+    # Khởi động lại: nạp state từ snapshot, chỉ đọc các dòng mới
+    with open(input_path, "a", encoding="utf-8") as f:
+        f.write("".join(lines[4:]))
+    processor = LocationProcessor(billing_clock='event', lot_id=LOT)
+    count, rows = run_file(processor, input_path, output_path, snapshot_path)
+    assert count == len(EVENTS) - 4
+    assert processor.states["A1"][1] == "EXITING"
+    # Giờ vào của B2 lấy từ state trước khi khởi động lại
+    b2 = [r for r in rows if r["location"] == "B2" and r["status"] == "OCCUPIED"]
+    assert b2[-1]["parked_duration_minutes"] == 10.0
+
+
+def test_malformed_lines_are_skipped_and_counted(tmp_path):
+    lines = replayed_lines(tmp_path).splitlines(keepends=True)
+    input_path = tmp_path / "events.jsonl"
+    input_path.write_text("not json\n" + lines[0] + "[1]\n" + "".join(lines[1:]), encoding="utf-8")
+    snapshot_path = str(tmp_path / "processor.snapshot")
+
+    transport = FileTransport(str(input_path), str(tmp_path / "status.jsonl"))
+    count = asyncio.run(run_processor(LocationProcessor(billing_clock='event', lot_id=LOT), transport,
+                                      snapshot_path=snapshot_path, tick_interval=0.01))
+    assert count == len(EVENTS)
+    assert transport.skipped == 2
+
+    # Vị trí đọc đã qua cả dòng hỏng: khởi động lại không đọc lại gì
+    count, _ = run_file(LocationProcessor(billing_clock='event', lot_id=LOT),
+                        input_path, tmp_path / "status.jsonl", snapshot_path)
+    assert count == 0
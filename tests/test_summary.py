@@ -0,0 +1,47 @@
+"""Test tổng hợp theo tầng (parking_summary.py) trên dòng status của engine Python"""
+
+import pytest
+
+from parking_stream_processor import EMIT_MODES, LocationProcessor
+from parking_summary import LOT_KEY, LotSummary, parse_layout
+from parking_tariff import load_tariff
+
+T0 = 1767225600
+
+EVENTS = [
+    ("A1", "29A-11111", "ENTERING", T0),
+    ("A1", "29A-11111", "PARKED", T0 + 60),
+    ("B2", "30B-22222", "PARKED", T0 + 100),
+    ("A1", "29A-11111", "EXITING", T0 + 3600),
+    ("B2", "51C-33333", "PARKED", T0 + 5000),    # đổi biển số: lượt của 30B-22222 kết thúc
+    ("B2", "51C-33333", "EXITING", T0 + 9000),
+]
+
+
+@pytest.mark.parametrize("emit_mode", EMIT_MODES)
+def test_completed_revenue_matches_bills(emit_mode):
+    tariff = load_tariff()
+    processor = LocationProcessor(tariff=tariff, emit_mode=emit_mode, billing_clock='event')
+    summary = LotSummary(parse_layout("A:10,B:10"), tariff)
+    summary.roll_day(T0)
+    for location, plate, status_code, ts in EVENTS:
+        event = {"location": location, "license_plate": plate, "status_code": status_code, "timestamp_unix": ts}
+        for row in processor.process_event(event, ts):
+            summary.apply_status(row)
+    bills = processor.take_bills()
+
+    lot = summary.rows(T0 + 9000)[-1]
+    assert lot["floor"] == LOT_KEY
+    assert lot["completed_stays"] == len(bills) == 3
+    assert lot["completed_revenue"] == pytest.approx(sum(b["amount"] for b in bills))
+    assert lot["completed_revenue"] > 0
+    assert lot["occupied"] == 0 and lot["accrued_cost"] == 0
+
+
+def test_accrued_cost_uses_tariff_at_summary_time():
+    tariff = load_tariff()
+    summary = LotSummary(parse_layout("A:10"), tariff)
+    summary.apply_status({"location": "A1", "status": "OCCUPIED", "license_plate": "29A-11111",
+                          "total_cost": 0.0, "event_timestamp_unix": T0})
+    lot = summary.rows(T0 + 3600)[-1]
+    assert lot["accrued_cost"] == tariff.fee("A", T0, T0 + 3600)[1]
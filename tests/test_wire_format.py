@@ -0,0 +1,74 @@
+"""
+Test định dạng nhị phân (parking_wire_format.py): encode/decode khứ hồi và giới hạn của
+bảng mã (location, biển số, trạng thái), record ngoài bảng mã được gửi bằng JSON
+"""
+
+import pytest
+
+from parking_wire_format import (
+    EVENT_V1, EVENT_V1_CONTENT_TYPE, JSON_CONTENT_TYPE, NULL_U32, STATUS_V1, STATUS_V1_CONTENT_TYPE,
+    decode_event, decode_plate, decode_status, encode_event, encode_location, encode_plate,
+    encode_status, get_content_type, record_lot_id, validate_lot_id
+)
+
+T0 = 1767225600
+
+
+def event(location="C12", plate="51C-12345", status_code="PARKED"):
+    return {"timestamp": "2026-01-01 07:00:00", "timestamp_unix": T0, "license_plate": plate,
+            "location": location, "status_code": status_code}
+
+
+def test_event_round_trip():
+    value, headers = encode_event(event(), 'binary')
+    assert get_content_type(headers) == EVENT_V1_CONTENT_TYPE
+    assert len(value) == EVENT_V1.size == 17
+    decoded = decode_event(value, headers)
+    assert {k: decoded[k] for k in ("location", "license_plate", "status_code", "timestamp_unix")} == {
+        "location": "C12", "license_plate": "51C-12345", "status_code": "PARKED", "timestamp_unix": T0}
+
+
+@pytest.mark.parametrize("data", [
+    event(location="AA1"),              # tầng hai chữ cái
+    event(location="A70000"),           # số vị trí > uint16
+    event(plate="51CD-12345"),          # biển số ngoài mẫu
+    event(plate=None),
+    event(status_code="TOWED"),         # trạng thái ngoài bảng mã
+])
+def test_event_outside_codebook_falls_back_to_json(data):
+    value, headers = encode_event(data, 'binary')
+    assert get_content_type(headers) == JSON_CONTENT_TYPE
+    assert decode_event(value, headers) == data
+
+
+def test_codebook_limits():
+    assert encode_location("Z65535") == (25, 65535)
+    assert encode_location("A65536") is None
+    assert encode_location("a1") is None
+    assert decode_plate(encode_plate("99Z-99999")) == "99Z-99999"
+    assert encode_plate("99Z-99999") < NULL_U32
+    assert decode_plate(NULL_U32) is None
+
+
+def test_status_round_trip():
+    row = {"location": "F7", "status": "OCCUPIED", "license_plate": "30A-00001",
+           "parked_duration_minutes": 12.5, "parked_blocks": 1, "total_cost": 5000.0,
+           "event_timestamp_unix": T0, "last_update": "2026-01-01T07:12:30"}
+    value, headers = encode_status(row)
+    assert get_content_type(headers) == STATUS_V1_CONTENT_TYPE and len(value) == STATUS_V1.size
+    assert decode_status(value, headers) == row
+
+    # Vị trí trống: biển số và thời gian đỗ null
+    empty = dict(row, status="EMPTY", license_plate=None, parked_duration_minutes=None,
+                 parked_blocks=0, total_cost=0.0)
+    assert decode_status(*encode_status(empty)) == empty
+
+
+def test_lot_id_from_key_and_validation():
+    assert record_lot_id({"lot_id": "hanoi-01"}, b"hcm-02") == "hanoi-01"
+    assert record_lot_id({}, b"hcm-02") == "hcm-02"
+    assert record_lot_id({}, b"C12") == "default"      # key cũ theo location
+    assert validate_lot_id("hanoi-01") == "hanoi-01"
+    for bad in ("", "B", "A12"):
+        with pytest.raises(ValueError):
+            validate_lot_id(bad)